@@ -47,6 +47,8 @@ MIDDLEWARE_CLASSES = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'scheduling.middleware.ProfilerMiddleware',
+    'scheduling.routers.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,11 +79,111 @@ WSGI_APPLICATION = 'bookit.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # SQLite whose transactions begin with BEGIN IMMEDIATE, so a write
+        # after a read queues for the lock instead of failing
+        'ENGINE': 'scheduling.db_backend',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections open between requests
+        'CONN_MAX_AGE': 600,
+        # Seconds to wait on a locked database before giving up
+        'OPTIONS': {'timeout': 5},
+        # A file, so threaded tests share one WAL database
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
 
+# PRAGMAs run on every new SQLite connection (scheduling/db.py): WAL,
+# synchronous=NORMAL, busy_timeout, cache_size and mmap_size.
+# Set to () to keep SQLite defaults. `manage.py bench_sqlite` compares both,
+# and the pragmas with the BEGIN IMMEDIATE transactions of the backend.
+BOOKIT_SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('cache_size', -64000),
+    ('mmap_size', 268435456),
+    ('temp_store', 'MEMORY'),
+)
+
+
+# Read replica
+# Read-only views and the reminder job read from DATABASES['replica'] when
+# it is configured; writes always go to 'default'. A client that just wrote
+# is pinned to the primary so it reads its own booking: until the replica
+# was copied after the write when sync_replica made it, otherwise (and at
+# most) for BOOKIT_REPLICA_STICKY_SECONDS. For a single host, a SQLite copy
+# refreshed with `manage.py sync_replica` from cron stands in for a real
+# replica. NAME becomes a symlink to the latest copy; do not create it.
+# DATABASES['replica'] = {
+#     'ENGINE': 'django.db.backends.sqlite3',
+#     'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+#     'CONN_MAX_AGE': 600,
+#     'TEST': {'MIRROR': 'default'},
+# }
+DATABASE_ROUTERS = ['scheduling.routers.ReplicaRouter']
+BOOKIT_REPLICA_DB = 'replica'
+BOOKIT_REPLICA_STICKY_SECONDS = 900
+
+# Threads shared by views that load several instruments at once, such as
+# /scheduling/availability/<name,name>/. Pays off when queries wait on a
+# database server; local SQLite loads are CPU bound, so they run inline.
+BOOKIT_LOADER_THREADS = 1
+
+# Live calendar feed, /scheduling/live/<name>/
+# Booking changes are written to an EventDelta table that a thread in each
+# worker process polls while browsers are connected. Each open feed holds a
+# worker for up to BOOKIT_LIVE_MAX_SECONDS, so run threaded workers (e.g.
+# gunicorn --worker-class gthread). expire_events prunes old deltas.
+BOOKIT_LIVE_POLL_SECONDS = 1.0
+BOOKIT_LIVE_KEEPALIVE_SECONDS = 15
+BOOKIT_LIVE_MAX_SECONDS = 300
+BOOKIT_LIVE_RETENTION_HOURS = 24
+# Open feeds per worker process; more connections get a 503 and their
+# calendars poll every BOOKIT_LIVE_BUSY_RETRY_SECONDS instead
+BOOKIT_LIVE_MAX_STREAMS = 8
+BOOKIT_LIVE_BUSY_RETRY_SECONDS = 60
+
+# Standing-booking occurrences of offline equipment are held this many days
+# ahead; expire_events extends the hold while the instrument stays offline.
+BOOKIT_OFFLINE_HOLD_DAYS = 92
+
+
+# Cache, sessions and authentication
+# Sessions are read from the cache and written through to the database, and
+# authenticated users (with their admin group membership) are served from
+# the cache, so a logged-in request costs no session or user queries.
+# Run `manage.py clearsessions` from cron to keep the session table bounded.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookit',
+    }
+}
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+AUTHENTICATION_BACKENDS = ['scheduling.backends.CachedModelBackend']
+
+# Scheduling data cache (scheduling/caching.py): equipment, information and
+# tags under versioned namespaces that model signals bump on change.
+# BOOKIT_CACHE names any CACHES alias, e.g. a memcached server on localhost:
+# CACHES['scheduling'] = {
+#     'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+#     'LOCATION': '127.0.0.1:11211',
+# }
+# `manage.py cache_stats` reports hit rates per namespace.
+BOOKIT_CACHE = 'default'
+BOOKIT_CACHE_TIMEOUT = 60 * 60
+BOOKIT_CACHE_STATS_FLUSH = 100
+
+# Large admin changelists (events, messages, services, tickets)
+# Past this many rows the unfiltered total is estimated from the table
+# statistics, filtered totals are cached for BOOKIT_ADMIN_COUNT_TIMEOUT
+# seconds and later pages seek on the sort key instead of OFFSET.
+BOOKIT_ADMIN_COUNT_THRESHOLD = 10000
+BOOKIT_ADMIN_COUNT_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/dev/ref/settings/#auth-password-validators
@@ -120,3 +222,12 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/dev/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Per-request profiling
+# Admins add an X-Bookit-Profile header or ?_profile=1 to a request to dump
+# a cProfile .prof file and a top-N summary here. Set to None to disable.
+BOOKIT_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+BOOKIT_PROFILE_SAMPLE_RATE = 1.0
+BOOKIT_PROFILE_MIN_INTERVAL = 60
+BOOKIT_PROFILE_TOP = 40
@@ -2,27 +2,105 @@ from django.contrib import admin, messages
 from django.http import HttpResponseRedirect
 from django.core.urlresolvers import reverse
 from django.utils import timezone, six
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.admin import UserAdmin
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget, \
+	ManyToManyRawIdWidget
 from django import forms
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Case, When, Value, BooleanField
 from django.contrib.auth.models import User
 from django.forms.utils import to_current_timezone
 from django.forms.widgets import MultiWidget, DateInput, TimeInput, SplitDateTimeWidget
 from django.utils.translation import ugettext_lazy as _
 from .models import Event, Equipment, Message, Ticket, Comment, \
-	Service, Component, Brand, Model, Information, Tag
-from .utils import changed_event_mail, deleted_event_mail, is_admin,\
-	new_event_mail, ticket_mail, message_mail, ticket_status_toggle_mail, \
+	Service, Component, Brand, Model, Information, Tag, RecurringBooking, \
+	RecurrenceException, rows_updated
+from .booking import save_booking, cancel_bookings, \
+	hold_offline_bookings, release_offline_bookings
+from .paginators import LargeTablePaginator
+from .permissions import get_permissions
+from .widgets import AutocompleteSelect, AutocompleteSelectMultiple
+from .utils import changed_event_mail, deleted_event_mail, \
+	new_event_mail, ticket_mail, message_mail, ticket_status_toggle_mails, \
+	deleted_event_mails, offline_hold_mails, offline_release_mails, \
 	maintenance_announcement, equipment_offline_email, equipment_online_email
 
 
 def toggle_boolean(modeladmin, request, queryset, field):
-	"""Toggle the boolean value of a model field"""
-	for obj in queryset:
-		setattr(obj, field, not getattr(obj, field))
-		obj.save()
+	"""Toggle the boolean value of a model field in one UPDATE"""
+	# Changelist aggregates (e.g. comment counts) cannot be carried into
+	# an UPDATE, select the rows by id instead
+	queryset = queryset.model._default_manager.filter(
+		pk__in=queryset.values('pk'))
+	count = queryset.update(**{field: Case(
+		When(**{field: True, 'then': Value(False)}),
+		default=Value(True),
+		output_field=BooleanField())})
+	rows_updated.send(sender=queryset.model, fields=[field])
+	return count
+
+
+class AutocompleteAdminMixin(object):
+	"""Search widgets for the relations in autocomplete_fields.
+	The forms then render only the chosen objects rather than every row
+	of the related table. Only admins may look up users, everyone else
+	gets a raw id box for them.
+	"""
+	autocomplete_fields = ()
+
+	def autocompleted(self, request, db_field):
+		"""The relation gets a search widget for this user"""
+		return db_field.name in self.autocomplete_fields and (
+			db_field.related_model is not User or
+			get_permissions(request).is_admin)
+
+	def formfield_for_foreignkey(self, db_field, request=None, **kwargs):
+		if self.autocompleted(request, db_field):
+			kwargs['widget'] = AutocompleteSelect(
+				db_field.model._meta.model_name, db_field.name)
+		elif db_field.name in self.autocomplete_fields:
+			kwargs['widget'] = ForeignKeyRawIdWidget(
+				db_field.remote_field, self.admin_site,
+				using=kwargs.get('using'))
+		return super(AutocompleteAdminMixin, self).formfield_for_foreignkey(
+			db_field, request, **kwargs)
+
+	def formfield_for_manytomany(self, db_field, request=None, **kwargs):
+		if self.autocompleted(request, db_field):
+			kwargs['widget'] = AutocompleteSelectMultiple(
+				db_field.model._meta.model_name, db_field.name)
+		elif db_field.name in self.autocomplete_fields:
+			kwargs['widget'] = ManyToManyRawIdWidget(
+				db_field.remote_field, self.admin_site,
+				using=kwargs.get('using'))
+		return super(AutocompleteAdminMixin, self).formfield_for_manytomany(
+			db_field, request, **kwargs)
+
+	def get_changelist_form(self, request, **kwargs):
+		"""Label editable rows from the objects the page query loaded"""
+		form = super(AutocompleteAdminMixin, self).get_changelist_form(
+			request, **kwargs)
+		meta = self.model._meta
+		names = [name for name in self.autocomplete_fields
+				 if self.autocompleted(request, meta.get_field(name))]
+
+		class AutocompleteChangelistForm(form):
+
+			def __init__(self, *args, **kwargs):
+				super(AutocompleteChangelistForm, self).__init__(*args, **kwargs)
+				for name in names:
+					field = self.fields.get(name)
+					related = self.instance._meta.get_field(name)
+					if (field is None or related.many_to_many or
+							getattr(self.instance, related.attname) is None):
+						continue
+					widget = getattr(field.widget, 'widget', field.widget)
+					widget.labels[getattr(self.instance, related.attname)] = \
+						field.label_from_instance(getattr(self.instance, name))
+
+		return AutocompleteChangelistForm
 
 
 class CustomDateTimeSplitWidget(SplitDateTimeWidget):
@@ -108,6 +186,10 @@ class EventAdmin(admin.ModelAdmin):
 	"""Tweak the Event admin form"""
 
 	readonly_fields = ('elapsed_hours',)
+	raw_id_fields = ('service',)
+	list_select_related = ('equipment', 'user', 'service')
+	paginator = LargeTablePaginator
+	show_full_result_count = False
 	actions = ['cancel_event']
 	exclude = ()
 	# form = EventForm
@@ -119,7 +201,7 @@ class EventAdmin(admin.ModelAdmin):
 	def get_list_filter(self, request):
 		"""Tweak list filtering based on user"""
 		# if request.user.is_superuser:
-		if is_admin(request.user):
+		if get_permissions(request).is_admin:
 			return ['start_time', 'user',
 					'equipment', 'maintenance', 'service']
 		return ['equipment']
@@ -134,14 +216,16 @@ class EventAdmin(admin.ModelAdmin):
 						'disassemble',
 						'get_notes')
 		# if request.user.is_superuser:
-		if is_admin(request.user):
+		if get_permissions(request).is_admin:
 			list_display = list_display + ('maintenance', 'service', 'user',)
 		return list_display
 
 	def cancel_event(self, request, queryset):
-		"""Cancel an upcoming event"""
-		queryset.filter(status__in=['A', 'H'],
-    				expired=False).update(status='C')
+		"""Cancel upcoming events"""
+		events = cancel_bookings(queryset)
+		deleted_event_mails(events)
+		self.message_user(request, 'Cancelled {} event(s)'.format(len(events)),
+						  messages.SUCCESS)
 
 	def has_delete_permission(self, request, obj=None):
 		"""Adjust deletion permissions to use cancel"""
@@ -164,7 +248,7 @@ class EventAdmin(admin.ModelAdmin):
 		Maybe the empty base-level "exclude" will help.
 		"""
 		# if not request.user.is_superuser:
-		if not is_admin(request.user):
+		if not get_permissions(request).is_admin:
 			self.exclude = ('maintenance', 'expired', 'status', 'service',)
 		return super(EventAdmin, self).get_fields(request, obj, **kwargs)
 
@@ -173,7 +257,7 @@ class EventAdmin(admin.ModelAdmin):
 		form = super(EventAdmin, self).get_form(request, obj, **kwargs)
 		form.base_fields['equipment'].queryset = \
 			form.base_fields['equipment']. \
-				queryset.filter(users=request.user)
+				queryset.filter(id__in=get_permissions(request).equipment_ids)
 		return form
 
 	def save_model(self, request, obj, form, change):
@@ -188,12 +272,12 @@ class EventAdmin(admin.ModelAdmin):
 		save_user = getattr(obj, 'user', None)
 		if save_user is None:
 			obj.user = request.user
-		elif request.user != save_user and not is_admin(request.user):
+		elif request.user != save_user and not get_permissions(request).is_admin:
 			raise PermissionDenied(
 				request,
 				'You are not the user.'
 			)
-		if request.user not in obj.equipment.users.all():
+		if not get_permissions(request).can_book(obj.equipment_id):
 			raise PermissionDenied(
 				request,
 				'You are not authorized for this instrument.')
@@ -202,7 +286,7 @@ class EventAdmin(admin.ModelAdmin):
 		if obj.pk is None and not obj.maintenance:
 			save_method = 'new_event'
 			save_method_string = "Created {}".format(obj.start_timestring)
-		elif obj.maintenance and is_admin(request.user):
+		elif obj.maintenance and get_permissions(request).is_admin:
 			save_method = 'maintenance'
 			save_method_string = "Maintenance scheduled {}".format(
 				obj.start_timestring)
@@ -224,7 +308,7 @@ class EventAdmin(admin.ModelAdmin):
 		else:
 			save_method = 'trivial_change'
 			save_method_string = 'Adjusted event without changing booking time.'
-		super(EventAdmin, self).save_model(request, obj, form, change)
+		save_booking(obj)
 		event_functions[save_method](obj)
 		self.message_user(request,
 						  save_method_string,
@@ -234,7 +318,7 @@ class EventAdmin(admin.ModelAdmin):
 		"""Override the queryset to enforce permissions"""
 		qstring = super(EventAdmin, self).get_queryset(request)
 		# if request.user.is_superuser:
-		if is_admin(request.user):
+		if get_permissions(request).is_admin:
 			return qstring
 		return qstring.filter(user=request.user)
 
@@ -277,6 +361,18 @@ class EventAdmin(admin.ModelAdmin):
 		return HttpResponseRedirect(
 			reverse('admin:scheduling_event_changelist'))
 
+	def changeform_view(self, request, object_id=None, form_url='',
+						extra_context=None):
+		"""Bounce back to the form if a concurrent booking won the slot"""
+		try:
+			return super(EventAdmin, self).changeform_view(request,
+														   object_id,
+														   form_url,
+														   extra_context)
+		except ValidationError as e:
+			self.message_user(request, ' '.join(e.messages), messages.ERROR)
+			return HttpResponseRedirect(request.get_full_path())
+
 	def change_view(self, request, object_id, form_url='', extra_context=None):
 		if not self.get_queryset(request).filter(id=object_id).exists():
 			return HttpResponseRedirect(
@@ -303,6 +399,50 @@ class EventAdmin(admin.ModelAdmin):
 													extra_context)
 
 
+class RecurrenceExceptionInline(admin.TabularInline):
+	"""Skipped occurrences of a standing booking"""
+	model = RecurrenceException
+	extra = 0
+
+
+@admin.register(RecurringBooking)
+class RecurringBookingAdmin(admin.ModelAdmin):
+	"""Standing (repeating) bookings"""
+
+	list_display = ('equipment', 'user', 'start_time', 'end_time',
+					'frequency', 'interval', 'until', 'count', 'status')
+	list_filter = ('equipment', 'frequency', 'status')
+	list_select_related = ('equipment', 'user')
+	inlines = [RecurrenceExceptionInline]
+
+	def get_form(self, request, obj=None, **kwargs):
+		"""Only offer instruments the user may book"""
+		form = super(RecurringBookingAdmin, self).get_form(request, obj, **kwargs)
+		form.base_fields['equipment'].queryset = \
+			form.base_fields['equipment'].queryset.filter(
+				id__in=get_permissions(request).equipment_ids)
+		return form
+
+	def get_queryset(self, request):
+		"""Override the queryset to enforce permissions"""
+		qstring = super(RecurringBookingAdmin, self).get_queryset(request)
+		if get_permissions(request).is_admin:
+			return qstring
+		return qstring.filter(user=request.user)
+
+	def save_model(self, request, obj, form, change):
+		"""Adjust some values on save"""
+		if getattr(obj, 'user', None) is None:
+			obj.user = request.user
+		elif request.user != obj.user and not get_permissions(request).is_admin:
+			raise PermissionDenied(request, 'You are not the user.')
+		if not get_permissions(request).can_book(obj.equipment_id):
+			raise PermissionDenied(
+				request,
+				'You are not authorized for this instrument.')
+		super(RecurringBookingAdmin, self).save_model(request, obj, form, change)
+
+
 class ComponentInline(admin.TabularInline):
 	"""Components to attach to equipment"""
 	model = Equipment.component.through
@@ -326,7 +466,7 @@ class ComponentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Service)
-class ServiceAdmin(admin.ModelAdmin):
+class ServiceAdmin(AutocompleteAdminMixin, admin.ModelAdmin):
 	"""Service record management"""
 	exclude = ('user',)
 	list_display = ('date', 'user', 'equipment',
@@ -334,6 +474,13 @@ class ServiceAdmin(admin.ModelAdmin):
 					'event', 'completed', 'success')
 	list_filter = ('completed', 'success', 'equipment')
 	list_editable = ['user']
+	autocomplete_fields = ('user',)
+	raw_id_fields = ('ticket',)
+	# Ticket and event names include their equipment and user
+	list_select_related = ('user', 'equipment', 'component',
+						   'ticket__equipment', 'event__user')
+	paginator = LargeTablePaginator
+	show_full_result_count = False
 	actions = ['toggle_completed', 'toggle_success']
 
 	def toggle_success(self, request, queryset):
@@ -370,18 +517,20 @@ class InformationAdmin(admin.ModelAdmin):
 
 
 @admin.register(Equipment)
-class EquipmentAdmin(admin.ModelAdmin):
+class EquipmentAdmin(AutocompleteAdminMixin, admin.ModelAdmin):
 	"""Equipment management"""
 
 	list_display = ('name', 'brand', 'model',
-					'description', 'last_service', 'status')
+					'description', 'last_service_date', 'status')
+	list_select_related = ('brand', 'model')
+	autocomplete_fields = ('admin', 'users')
 	inlines = [ComponentInline]
 	exclude = ('component',)
 
 	def get_fields(self, request, obj=None, **kwargs):
 		"""Override field getting"""
 		# if not request.user.is_superuser:
-		if not is_admin(request.user):
+		if not get_permissions(request).is_admin:
 			self.readonly_fields = ('admin',)
 		return super(EquipmentAdmin, self).get_fields(request, obj, **kwargs)
 
@@ -390,11 +539,23 @@ class EquipmentAdmin(admin.ModelAdmin):
 		super(EquipmentAdmin, self).save_model(request, obj, form, change)
 		if 'status' in form.changed_data:
 			if obj.status == False:
-				equipment_offline_email(obj)
+				held = hold_offline_bookings(obj)
+
+				def notify():
+					equipment_offline_email(obj)
+					offline_hold_mails(obj, held)
 			else:
-				equipment_online_email(obj)
+				held = release_offline_bookings(obj)
+
+				def notify():
+					equipment_online_email(obj)
+					offline_release_mails(obj, held)
+			# The admin saves in a transaction, mail once it commits
+			transaction.on_commit(notify)
 			self.message_user(request,
-							  "{} set running={}".format(obj.name, obj.status),
+							  "{} set running={}, {} booking(s) {}".format(
+								  obj.name, obj.status, len(held),
+								  'held' if obj.status == False else 'restored'),
 							  messages.SUCCESS)
 
 
@@ -403,6 +564,7 @@ class CommentInline(admin.TabularInline):
 	model = Ticket.comment.through
 	extra = 0
 	can_delete = False
+	raw_id_fields = ('comment',)
 
 	def formfield_for_foreignkey(self, db_field, request, **kwargs):
 		if db_field.name == 'comment' and not request.user.is_superuser:
@@ -486,22 +648,31 @@ class TicketAdmin(admin.ModelAdmin):
 					'comment_count', 'msg', 'status')
 	exclude = ('comment',)
 	readonly_fields = ('status',)
+	list_select_related = ('user', 'equipment')
+	paginator = LargeTablePaginator
+	show_full_result_count = False
 	inlines = [CommentInline, ]
 	actions = ['toggle_ticket', 'toggle_priority']
 
+	def comment_count(self, obj):
+		"""Comments counted by the changelist query"""
+		return obj.comment_total
+	comment_count.admin_order_field = 'comment_total'
+	comment_count.short_description = 'Comment count'
+
 	def get_queryset(self, request):
 		"""Override the queryset to enforce permissions"""
-		qstring = super(TicketAdmin, self).get_queryset(request)
+		qstring = super(TicketAdmin, self).get_queryset(request).annotate(
+			comment_total=Count('comment', distinct=True))
 		# if request.user.is_superuser:
-		if is_admin(request.user):
+		if get_permissions(request).is_admin:
 			return qstring
 		return qstring.filter(user=request.user)
 
 	def toggle_ticket(self, request, queryset):
 		"""Toggle ticket closed status"""
 		toggle_boolean(self, request, queryset, 'status')
-		for obj in queryset:
-			ticket_status_toggle_mail(obj)
+		ticket_status_toggle_mails(queryset.select_related('user', 'equipment'))
 
 	def toggle_priority(self, request, queryset):
 		"""Toggle ticket priority"""
@@ -513,7 +684,7 @@ class TicketAdmin(admin.ModelAdmin):
 			obj.user = request.user
 		# elif (obj.pk and obj.user != request.user and
 		#      not request.user.is_superuser):
-		elif (obj.pk and not is_admin(request.user)):
+		elif (obj.pk and not get_permissions(request).is_admin):
 			raise PermissionDenied
 		# if getattr(obj, 'comment', None):
 		#     form.cleaned_data['comment'] = self.comment.all()
@@ -528,6 +699,14 @@ class MessageAdmin(admin.ModelAdmin):
 	"""Message management"""
 
 	list_display = ('created', 'user', 'equipment', 'msg', 'get_tags')
+	list_select_related = ('user', 'equipment')
+	paginator = LargeTablePaginator
+	show_full_result_count = False
+
+	def get_queryset(self, request):
+		"""Load tags for the whole page at once"""
+		return super(MessageAdmin, self).get_queryset(request).\
+			prefetch_related('tags')
 
 	def save_model(self, request, obj, form, change):
 		"""Adjust some values on save"""
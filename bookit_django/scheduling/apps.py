@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class SchedulingConfig(AppConfig):
     name = 'scheduling'
+
+    def ready(self):
+        """Connect signal handlers that live outside models"""
+        from . import backends, caching, db, permissions, search
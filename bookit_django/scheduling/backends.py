@@ -0,0 +1,74 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, pre_delete, \
+	m2m_changed
+from .utils import is_admin
+
+USER_CACHE_KEY = 'bookit:auth-user:{}'
+USER_CACHE_TIMEOUT = 60 * 60
+
+
+class CachedModelBackend(ModelBackend):
+	"""ModelBackend that serves the per-request user from the cache.
+
+	The user is cached with its admin group membership already resolved,
+	so an authenticated request needs no User or group query. Entries are
+	dropped whenever the user, their groups or a group they belong to
+	change.
+	"""
+
+	def get_user(self, user_id):
+		key = USER_CACHE_KEY.format(user_id)
+		user = cache.get(key)
+		if user is None:
+			user = super(CachedModelBackend, self).get_user(user_id)
+			if user is None:
+				return None
+			is_admin(user)
+			cache.set(key, user, USER_CACHE_TIMEOUT)
+		return user
+
+
+def invalidate_cached_users(user_ids):
+	"""Drop cached users"""
+	cache.delete_many([USER_CACHE_KEY.format(user_id)
+					   for user_id in user_ids])
+
+
+def user_changed(sender, instance, **kwargs):
+	"""User saved or deleted"""
+	invalidate_cached_users([instance.pk])
+
+
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+	"""Group membership changed from either side"""
+	if action == 'pre_clear' and reverse:
+		instance._bookit_cleared_users = list(
+			instance.user_set.values_list('id', flat=True))
+	elif action == 'post_clear':
+		invalidate_cached_users(
+			getattr(instance, '_bookit_cleared_users', [instance.pk]))
+	elif action in ('post_add', 'post_remove'):
+		invalidate_cached_users(pk_set if reverse else [instance.pk])
+
+
+def group_pre_delete(sender, instance, **kwargs):
+	"""Remember members of a group about to be deleted"""
+	instance._bookit_cleared_users = list(
+		instance.user_set.values_list('id', flat=True))
+
+
+def group_changed(sender, instance, **kwargs):
+	"""Renamed or deleted groups change admin status of members"""
+	user_ids = getattr(instance, '_bookit_cleared_users', None)
+	if user_ids is None:
+		user_ids = instance.user_set.values_list('id', flat=True)
+	invalidate_cached_users(user_ids)
+
+post_save.connect(user_changed, sender=User)
+post_delete.connect(user_changed, sender=User)
+m2m_changed.connect(user_groups_changed, sender=User.groups.through)
+pre_delete.connect(group_pre_delete, sender=Group)
+post_save.connect(group_changed, sender=Group)
+post_delete.connect(group_changed, sender=Group)
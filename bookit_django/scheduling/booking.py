@@ -0,0 +1,177 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction, DatabaseError
+from django.db.models import Case, When, Value, F, CharField
+from django.utils import timezone
+from .models import Event, RecurringBooking, RecurrenceException, \
+	lock_equipment, record_event_deltas, record_rule_delta, \
+	refresh_equipment_summary
+from .utils import maintenance_cancellation_mails
+
+# Raised by the scheduling_event overlap triggers (see migration 0026)
+OVERLAP_ERROR = 'overlaps an existing booking'
+# Reason of the exceptions that hold standing bookings while offline
+OFFLINE_HOLD_REASON = 'Offline hold'
+
+
+def save_booking(event):
+	"""Create or modify a booking under its equipment's lock.
+
+	The overlap check and the write share one transaction holding the
+	instrument's row lock, so two users submitting the same slot cannot
+	both pass. The database trigger rejects anything that still slips
+	through, e.g. concurrent writers on SQLite. Maintenance instead
+	cancels what it overlaps in the same transaction, and the users are
+	mailed once it commits.
+	"""
+	try:
+		with transaction.atomic():
+			lock_equipment(event.equipment_id)
+			cleared = []
+			if event.status in ['A', 'H'] and not event.expired:
+				if event.maintenance:
+					cleared = clear_for_maintenance(event)
+				elif event.overlapping_bookings().exists():
+					raise ValidationError('Overlaps with existing booking.')
+			event.save()
+			if cleared:
+				transaction.on_commit(
+					lambda: maintenance_cancellation_mails(cleared))
+	except DatabaseError as e:
+		if OVERLAP_ERROR not in str(e):
+			raise
+		raise ValidationError('Overlaps with existing booking.')
+	return event
+
+
+def cancel_bookings(queryset):
+	"""Cancel the upcoming bookings in a queryset with one UPDATE.
+
+	update() skips the save signals, so live feeds get their deltas in one
+	INSERT and each instrument's summary is refreshed once. Returns the
+	cancelled events for notices.
+	"""
+	with transaction.atomic():
+		upcoming = queryset.filter(status__in=['A', 'H'], expired=False)
+		events = list(upcoming.select_related('equipment__admin', 'user'))
+		if not events:
+			return []
+		upcoming.update(status='C')
+		for event in events:
+			event.status = 'C'
+		record_event_deltas(events, 'cancelled')
+		for equipment_id in set(event.equipment_id for event in events):
+			refresh_equipment_summary(equipment_id)
+	return events
+
+
+def hold_offline_bookings(equipment):
+	"""Put an offline instrument's active bookings that have not ended
+	on hold, with one UPDATE, and its standing-booking occurrences with
+	hold_offline_occurrences. Bookings are flagged so
+	release_offline_bookings can restore exactly these. Returns the held
+	events and occurrences for notices.
+	"""
+	with transaction.atomic():
+		active = Event.objects.filter(equipment_id=equipment.id,
+									  status='A',
+									  expired=False,
+									  end_time__gt=timezone.now())
+		events = list(active.select_related('equipment', 'user'))
+		if events:
+			active.update(status='H', offline_hold=True)
+			for event in events:
+				event.status = 'H'
+				event.offline_hold = True
+			record_event_deltas(events, 'changed')
+			refresh_equipment_summary(equipment.id)
+		return events + hold_offline_occurrences(equipment)
+
+
+def hold_offline_occurrences(equipment):
+	"""Skip the active standing-booking occurrences of an offline
+	instrument up to BOOKIT_OFFLINE_HOLD_DAYS ahead, in one INSERT.
+	Occurrences already held are not expanded, so expire_events reruns
+	this to keep the hold ahead of time. Returns the newly held ones.
+	"""
+	now = timezone.now()
+	end = now + timedelta(days=getattr(settings, 'BOOKIT_OFFLINE_HOLD_DAYS',
+									   92))
+	occurrences = []
+	for rule in RecurringBooking.objects.active_between(
+			equipment.id, now, end).filter(status='A').\
+			select_related('equipment__admin', 'user'):
+		occurrences.extend(occurrence
+						   for occurrence in rule.occurrences(now, end)
+						   if occurrence.end_time > now)
+	if occurrences:
+		RecurrenceException.objects.bulk_create([
+			RecurrenceException(booking=occurrence.rule,
+								occurrence_start=occurrence.start_time,
+								reason=OFFLINE_HOLD_REASON)
+			for occurrence in occurrences])
+		for rule in set(occurrence.rule for occurrence in occurrences):
+			record_rule_delta(rule)
+		refresh_equipment_summary(equipment.id)
+	return occurrences
+
+
+def release_offline_bookings(equipment):
+	"""Reactivate the bookings held while an instrument was offline, with
+	one UPDATE, and drop the exceptions holding its standing bookings.
+	Ones cancelled in the meantime stay cancelled. Returns the reactivated
+	events and occurrences that have not ended, for notices.
+	"""
+	with transaction.atomic():
+		now = timezone.now()
+		held = Event.objects.filter(equipment_id=equipment.id,
+									offline_hold=True)
+		events = list(held.filter(status='H', expired=False,
+								  end_time__gt=now).
+					  select_related('equipment', 'user'))
+		held.update(offline_hold=False,
+					status=Case(When(status='H', then=Value('A')),
+								default=F('status'),
+								output_field=CharField()))
+		for event in events:
+			event.status = 'A'
+			event.offline_hold = False
+		record_event_deltas(events, 'changed')
+		refresh_equipment_summary(equipment.id)
+		skips = RecurrenceException.objects.filter(
+			booking__equipment_id=equipment.id, reason=OFFLINE_HOLD_REASON)
+		starts = dict()
+		for rule, start in skips.values_list('booking', 'occurrence_start'):
+			starts.setdefault(rule, set()).add(start)
+		skips.delete()
+		occurrences = []
+		for rule in RecurringBooking.objects.filter(id__in=starts).\
+				select_related('equipment__admin', 'user'):
+			rule_starts = starts[rule.id]
+			occurrences.extend(occurrence for occurrence in rule.occurrences(
+				now - (rule.end_time - rule.start_time), max(rule_starts))
+				if occurrence.start_time in rule_starts and
+				occurrence.end_time > now)
+	return events + occurrences
+
+
+def clear_for_maintenance(event):
+	"""Cancel the bookings and standing-booking occurrences a maintenance
+	event overlaps. Bookings go in one UPDATE and the skipped occurrences
+	in one INSERT. Returns both for notices.
+	"""
+	cancelled = cancel_bookings(event.overlapping_bookings())
+	occurrences = []
+	for rule in RecurringBooking.objects.active_between(
+			event.equipment_id, event.start_time, event.end_time).\
+			select_related('equipment__admin', 'user'):
+		occurrences.extend(rule.occurrences(event.start_time, event.end_time))
+	if occurrences:
+		RecurrenceException.objects.bulk_create([
+			RecurrenceException(booking=occurrence.rule,
+								occurrence_start=occurrence.start_time,
+								reason='Maintenance {}'.format(event.start_time))
+			for occurrence in occurrences])
+		refresh_equipment_summary(event.equipment_id)
+	return cancelled + occurrences
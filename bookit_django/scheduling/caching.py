@@ -0,0 +1,283 @@
+import threading
+import time
+from datetime import date, datetime, timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from .models import Equipment, Brand, Model, Component, Information, Tag, \
+	Message, equipment_summary_changed, rows_updated
+from .loaders import month_bookings, feed_bookings
+from .routers import use_primary
+from .utils import EventCalendar, jsonify_schedule, month_bounds, \
+	localize_bound
+
+VERSION_KEY = 'bookit:version:{}'
+DATA_KEY = 'bookit:data:{}:{}'
+STATS_KEY = 'bookit:stats:{}:{}'
+
+# Counters not yet added to the shared totals, by namespace kind
+_stats = dict()
+_stats_lock = threading.Lock()
+_pending = [0]
+
+
+def get_cache():
+	"""Cache backend named by BOOKIT_CACHE, any alias in CACHES"""
+	return caches[getattr(settings, 'BOOKIT_CACHE', 'default')]
+
+
+def new_version():
+	"""Fresh version number that cannot repeat an evicted one"""
+	return int(time.time() * 1000)
+
+
+def versions(namespaces):
+	"""Current version of each namespace, creating missing ones"""
+	backend = get_cache()
+	keys = [VERSION_KEY.format(namespace) for namespace in namespaces]
+	found = backend.get_many(keys)
+	for key in keys:
+		if key not in found:
+			found[key] = new_version()
+			if not backend.add(key, found[key], None):
+				# Another process created it first
+				found[key] = backend.get(key, found[key])
+	return '.'.join(str(found[key]) for key in keys)
+
+
+def bump(*namespaces):
+	"""Invalidate everything cached under the namespaces once the current
+	transaction commits. Bumping earlier would let a concurrent reader
+	cache the rows it is about to replace under the new version.
+	"""
+	transaction.on_commit(lambda: bump_now(namespaces))
+
+
+def bump_now(namespaces):
+	"""Move the namespaces to new versions immediately"""
+	backend = get_cache()
+	for namespace in namespaces:
+		key = VERSION_KEY.format(namespace)
+		try:
+			backend.incr(key)
+		except ValueError:
+			backend.set(key, new_version(), None)
+
+
+def cached(namespaces, name, loader, refresh=False):
+	"""Value of loader() cached under a versioned key.
+	The key embeds the version of every namespace the value depends on,
+	so bumping any of them makes it unreachable. Misses load from the
+	primary, a lagging replica would otherwise be cached as current.
+	"""
+	backend = get_cache()
+	key = DATA_KEY.format(name, versions(namespaces))
+	value = None if refresh else backend.get(key)
+	kind = namespaces[-1].split(':')[0]
+	if value is None:
+		with use_primary():
+			value = loader()
+		backend.set(key, value, getattr(settings, 'BOOKIT_CACHE_TIMEOUT',
+										60 * 60))
+		record(kind, 'misses')
+	else:
+		record(kind, 'hits')
+	return value
+
+
+def record(kind, outcome):
+	"""Count a lookup, adding to the shared totals every so often"""
+	with _stats_lock:
+		counts = _stats.setdefault(kind, {'hits': 0, 'misses': 0})
+		counts[outcome] += 1
+		_pending[0] += 1
+		due = _pending[0] >= getattr(settings, 'BOOKIT_CACHE_STATS_FLUSH',
+									 100)
+	if due:
+		flush_stats()
+
+
+def flush_stats():
+	"""Add this process's counters to the totals kept in the cache"""
+	with _stats_lock:
+		pending = [(kind, outcome, count)
+				   for kind, counts in _stats.items()
+				   for outcome, count in counts.items() if count]
+		_stats.clear()
+		_pending[0] = 0
+	backend = get_cache()
+	for kind, outcome, count in pending:
+		key = STATS_KEY.format(kind, outcome)
+		try:
+			backend.incr(key, count)
+		except ValueError:
+			backend.set(key, count, None)
+
+
+def read_stats(kinds=('dashboard', 'equipment', 'tag')):
+	"""Shared hit/miss totals by namespace kind"""
+	flush_stats()
+	backend = get_cache()
+	return dict((kind, dict((outcome, backend.get(
+		STATS_KEY.format(kind, outcome), 0)) for outcome in ('hits', 'misses')))
+		for kind in kinds)
+
+
+def reset_stats(kinds=('dashboard', 'equipment', 'tag')):
+	"""Zero the shared totals"""
+	get_cache().delete_many([STATS_KEY.format(kind, outcome)
+							 for kind in kinds
+							 for outcome in ('hits', 'misses')])
+
+
+def equipment_list(refresh=False):
+	"""All equipment with brand, model and admin loaded"""
+	return cached(('equipment',), 'equipment-list', lambda: list(
+		Equipment.objects.select_related('brand', 'model', 'admin')),
+		refresh)
+
+
+def equipment_detail(equipment_id, refresh=False):
+	"""One instrument with its users and components prefetched, or None"""
+	return cached(('equipment:{}'.format(equipment_id),),
+				  'equipment-detail-{}'.format(equipment_id),
+				  lambda: Equipment.objects.
+				  select_related('brand', 'model', 'admin').
+				  prefetch_related('users', 'component').
+				  filter(id=equipment_id).first(), refresh)
+
+
+def equipment_named(name):
+	"""Cached instrument with a given name, or None"""
+	for equipment in equipment_list():
+		if equipment.name == name:
+			return equipment
+	return None
+
+
+def tag_list(refresh=False):
+	"""All message tags by name"""
+	return cached(('tag',), 'tag-list', lambda: list(
+		Tag.objects.all().order_by('tag')), refresh)
+
+
+class DashboardSnapshot(object):
+	"""Everything the landing page shows, built in three queries"""
+
+	def __init__(self, message_count=3):
+		self.equipment_list = list(Equipment.objects.only(
+			'id', 'name', 'status', 'next_booking_start'))
+		self.message_objs = list(Message.objects.select_related('user').
+								 order_by('-created')[:message_count])
+		self.information_list = list(Information.objects.filter(
+			main_page_visible=True))
+		self.built = datetime.now()
+
+
+def dashboard_snapshot(refresh=False):
+	"""Cached landing page snapshot"""
+	return cached(('equipment', 'information', 'message', 'dashboard'),
+				  'dashboard', DashboardSnapshot, refresh)
+
+
+def month_calendar(equipment, year, month, refresh=False):
+	"""Rendered month calendar of an instrument.
+	Past days lose their add links and today is highlighted, so the
+	render is also keyed by the current date.
+	"""
+	def render():
+		events = month_bookings(equipment, *month_bounds(year, month))
+		return EventCalendar(events).formatmonth(
+			year, month, equipment).replace('\n', '')
+	return cached(('equipment:{}'.format(equipment.id),),
+				  'month-calendar-{}-{}-{}-{}'.format(
+					  equipment.id, year, month, date.today()),
+				  render, refresh)
+
+
+def default_feed(equipment, days, refresh=False):
+	"""JSON feed of an instrument over the default window.
+	The window starts on the current hour so the render can be shared
+	until the next one, when elapsed occurrences turn expired. Empty
+	feeds come back as an empty string.
+	"""
+	hour = localize_bound(datetime.now().replace(minute=0, second=0,
+												 microsecond=0))
+
+	def render():
+		bookings = feed_bookings(equipment.name, hour,
+								 hour + timedelta(days=days))
+		return jsonify_schedule(bookings) if bookings else ''
+	return cached(('equipment:{}'.format(equipment.id),),
+				  'feed-{}-{}-{}'.format(equipment.id, days,
+										 hour.strftime('%Y%m%d%H')),
+				  render, refresh)
+
+
+def instrument_namespaces(equipment_ids=None):
+	"""Per-instrument namespaces, of all equipment if no ids are given"""
+	if equipment_ids is None:
+		equipment_ids = Equipment.objects.values_list('id', flat=True)
+	return ['equipment:{}'.format(equipment_id)
+			for equipment_id in equipment_ids]
+
+
+def equipment_changed(sender, **kwargs):
+	"""Equipment, or a brand, model or component it shows, changed"""
+	if sender is Equipment:
+		bump('equipment', *instrument_namespaces([kwargs['instance'].id]))
+	else:
+		bump('equipment', *instrument_namespaces())
+
+
+def bookings_changed(sender, **kwargs):
+	"""Bookings of an instrument changed.
+	Only its own renders and the landing page show them, the equipment
+	list and other instruments' calendars stay cached.
+	"""
+	bump('dashboard', *instrument_namespaces([kwargs['equipment_id']]))
+
+
+def equipment_members_changed(sender, **kwargs):
+	"""Users or components of an instrument changed"""
+	if kwargs['action'] not in ('post_add', 'post_remove', 'post_clear'):
+		return
+	if isinstance(kwargs['instance'], Equipment):
+		bump(*instrument_namespaces([kwargs['instance'].id]))
+	else:
+		# Changed from the user or component side, pk_set holds equipment
+		bump(*instrument_namespaces(kwargs['pk_set']))
+
+
+def information_changed(sender, **kwargs):
+	"""Landing page information changed"""
+	bump('information')
+
+
+def tag_changed(sender, **kwargs):
+	"""Message tags changed"""
+	bump('tag')
+
+
+def message_changed(sender, **kwargs):
+	"""Message board posts changed"""
+	bump('message')
+
+post_save.connect(equipment_changed, sender=Equipment)
+post_delete.connect(equipment_changed, sender=Equipment)
+equipment_summary_changed.connect(bookings_changed, sender=Equipment)
+for related in (Brand, Model, Component):
+	post_save.connect(equipment_changed, sender=related)
+	post_delete.connect(equipment_changed, sender=related)
+m2m_changed.connect(equipment_members_changed,
+					sender=Equipment.users.through)
+m2m_changed.connect(equipment_members_changed,
+					sender=Equipment.component.through)
+post_save.connect(information_changed, sender=Information)
+post_delete.connect(information_changed, sender=Information)
+rows_updated.connect(information_changed, sender=Information)
+post_save.connect(tag_changed, sender=Tag)
+post_delete.connect(tag_changed, sender=Tag)
+post_save.connect(message_changed, sender=Message)
+post_delete.connect(message_changed, sender=Message)
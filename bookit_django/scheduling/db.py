@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+# Applied to every new SQLite connection, see BOOKIT_SQLITE_PRAGMAS
+DEFAULT_SQLITE_PRAGMAS = (
+	('journal_mode', 'WAL'),
+	('synchronous', 'NORMAL'),
+	('busy_timeout', 5000),
+	('cache_size', -64000),
+	('mmap_size', 268435456),
+	('temp_store', 'MEMORY'),
+)
+
+
+def sqlite_pragmas():
+	"""Configured SQLite pragmas, None or empty to leave defaults alone"""
+	return getattr(settings, 'BOOKIT_SQLITE_PRAGMAS', DEFAULT_SQLITE_PRAGMAS)
+
+
+def apply_sqlite_pragmas(cursor, pragmas):
+	"""Run PRAGMA statements on a DB-API cursor"""
+	for name, value in pragmas or ():
+		cursor.execute('PRAGMA {}={}'.format(name, value))
+
+
+def tune_sqlite_connection(sender, connection, **kwargs):
+	"""Tune each new SQLite connection for concurrent use.
+	WAL lets readers run alongside the single writer and busy_timeout
+	makes writers queue instead of failing with 'database is locked'.
+	"""
+	if connection.vendor != 'sqlite':
+		return
+	cursor = connection.cursor()
+	try:
+		apply_sqlite_pragmas(cursor, sqlite_pragmas())
+	finally:
+		cursor.close()
+
+connection_created.connect(tune_sqlite_connection)
@@ -0,0 +1,16 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+	"""SQLite backend whose transactions take the write lock as they begin.
+
+	A deferred BEGIN holds a read snapshot from the first SELECT. On a WAL
+	database, upgrading that snapshot to a write fails at once with
+	'database is locked' when another connection committed in between, and
+	busy_timeout does not apply. BEGIN IMMEDIATE waits on busy_timeout for
+	the lock instead, so concurrent admin saves queue up. Reads outside
+	transactions are unaffected.
+	"""
+
+	def _start_transaction_under_autocommit(self):
+		self.cursor().execute("BEGIN IMMEDIATE")
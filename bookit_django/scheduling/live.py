@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Max
+from django.utils.six.moves import queue
+from .models import EventDelta
+
+logger = logging.getLogger(__name__)
+
+
+class Broadcaster(object):
+	"""Fan booking deltas out to the live feeds open in this process.
+
+	Every worker process writes EventDelta rows with its bookings, so the
+	table doubles as a bus between processes. One thread per process polls
+	it for new rows while anyone is subscribed and copies each row to the
+	queues listening on that instrument. The thread exits once the last
+	subscriber leaves.
+	"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.subscribers = dict()
+		self.thread = None
+		self.last_id = 0
+		self.streams = 0
+
+	def reserve_stream(self):
+		"""Count a new open feed, False when BOOKIT_LIVE_MAX_STREAMS are
+		already open in this process"""
+		with self.lock:
+			if self.streams >= getattr(settings, 'BOOKIT_LIVE_MAX_STREAMS', 8):
+				return False
+			self.streams += 1
+			return True
+
+	def release_stream(self):
+		"""Count a feed as closed"""
+		with self.lock:
+			self.streams -= 1
+
+	def subscribe(self, equipment_id):
+		"""Queue receiving new deltas for an instrument"""
+		listener = queue.Queue(
+			getattr(settings, 'BOOKIT_LIVE_QUEUE_SIZE', 100))
+		with self.lock:
+			self.subscribers.setdefault(equipment_id, set()).add(listener)
+			if self.thread is None:
+				self.last_id = latest_delta_id()
+				self.thread = threading.Thread(target=self.run,
+											   name='bookit-live')
+				self.thread.daemon = True
+				self.thread.start()
+		return listener
+
+	def unsubscribe(self, equipment_id, listener):
+		"""Stop delivering to a queue"""
+		with self.lock:
+			listeners = self.subscribers.get(equipment_id, set())
+			listeners.discard(listener)
+			if not listeners:
+				self.subscribers.pop(equipment_id, None)
+
+	def run(self):
+		"""Poll for new deltas until nobody is listening"""
+		interval = getattr(settings, 'BOOKIT_LIVE_POLL_SECONDS', 1.0)
+		try:
+			while True:
+				time.sleep(interval)
+				with self.lock:
+					if not self.subscribers:
+						self.thread = None
+						return
+				self.poll()
+		finally:
+			close_old_connections()
+
+	def poll(self):
+		"""Deliver deltas written since the last poll"""
+		try:
+			deltas = list(EventDelta.objects.filter(
+				id__gt=self.last_id).order_by('id')[:500])
+		except DatabaseError:
+			logger.exception('Live feed poll failed')
+			close_old_connections()
+			return
+		for delta in deltas:
+			self.last_id = delta.id
+			with self.lock:
+				listeners = list(self.subscribers.get(delta.equipment_id, ()))
+			for listener in listeners:
+				try:
+					listener.put_nowait(delta)
+				except queue.Full:
+					# The client fell behind, it replays from its
+					# Last-Event-ID when it reconnects
+					pass
+
+
+def latest_delta_id(equipment_id=None):
+	"""Id of the newest delta, 0 when there are none"""
+	deltas = EventDelta.objects.all()
+	if equipment_id is not None:
+		deltas = deltas.filter(equipment_id=equipment_id)
+	return deltas.aggregate(latest=Max('id'))['latest'] or 0
+
+
+def stream_deltas(equipment_id, last_event_id=None):
+	"""Server-sent event frames for an instrument.
+
+	Replays anything after last_event_id, then follows the broadcaster.
+	Comment frames keep idle connections open, and the stream ends after
+	BOOKIT_LIVE_MAX_SECONDS so a worker is never held indefinitely; the
+	browser reconnects on its own and resumes from the last id it saw.
+	"""
+	listener = broadcaster.subscribe(equipment_id)
+	try:
+		yield 'retry: {}\n\n'.format(
+			getattr(settings, 'BOOKIT_LIVE_RETRY_MS', 3000))
+		if last_event_id is None:
+			sent = latest_delta_id(equipment_id)
+		else:
+			sent = last_event_id
+			for delta in EventDelta.objects.filter(
+					equipment_id=equipment_id, id__gt=sent).order_by('id'):
+				yield delta.as_sse()
+				sent = delta.id
+		keepalive = getattr(settings, 'BOOKIT_LIVE_KEEPALIVE_SECONDS', 15)
+		deadline = time.time() + getattr(settings,
+										 'BOOKIT_LIVE_MAX_SECONDS', 300)
+		while time.time() < deadline:
+			try:
+				delta = listener.get(timeout=keepalive)
+			except queue.Empty:
+				yield ': keepalive\n\n'
+				continue
+			if delta.id > sent:
+				yield delta.as_sse()
+				sent = delta.id
+	finally:
+		broadcaster.unsubscribe(equipment_id, listener)
+
+
+class LiveStream(object):
+	"""Frames of one open feed, holding its place in the stream count
+	until the server closes the response"""
+
+	def __init__(self, frames):
+		self.frames = frames
+		self.open = True
+
+	def __iter__(self):
+		return self.frames
+
+	def close(self):
+		self.frames.close()
+		if self.open:
+			self.open = False
+			broadcaster.release_stream()
+
+
+def open_stream(equipment_id, last_event_id=None):
+	"""Live feed of an instrument, None when this process is full.
+	Each open feed holds a worker thread, so they are capped per process
+	and the rest are told to poll instead."""
+	if not broadcaster.reserve_stream():
+		return None
+	return LiveStream(stream_deltas(equipment_id, last_event_id))
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,94 @@
+import threading
+from itertools import chain
+from multiprocessing.pool import ThreadPool
+from operator import attrgetter
+from django.conf import settings
+from django.db import close_old_connections
+from .models import Event, EventRow, Equipment, expand_occurrences
+from .routers import reading_replica, use_replica
+from .utils import to_epoch
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def loader_pool():
+	"""Shared pool for blocking loads, sized by BOOKIT_LOADER_THREADS"""
+	global _pool
+	with _pool_lock:
+		if _pool is None:
+			_pool = ThreadPool(getattr(settings, 'BOOKIT_LOADER_THREADS', 1))
+	return _pool
+
+
+def run_all(func, arg_list):
+	"""Call func once per argument tuple on the loader pool.
+	Results come back in order. Each job reads from the same database as
+	the caller, and a single job runs inline without a thread hop. Pool
+	threads treat each job as a request, closing their connections after
+	it as CONN_MAX_AGE says.
+	"""
+	arg_list = list(arg_list)
+	replica = reading_replica()
+
+	def job(args):
+		close_old_connections()
+		try:
+			if replica:
+				with use_replica():
+					return func(*args)
+			return func(*args)
+		finally:
+			close_old_connections()
+
+	if len(arg_list) < 2 or getattr(settings, 'BOOKIT_LOADER_THREADS', 1) < 2:
+		return [func(*args) for args in arg_list]
+	return loader_pool().map(job, arg_list)
+
+
+def month_bookings(equipment, month_start, month_end):
+	"""Events and standing booking occurrences starting in a month,
+	latest first as the calendar expects"""
+	events = EventRow.rows(Event.objects.filter(
+		equipment=equipment,
+		start_epoch__gte=to_epoch(month_start),
+		start_epoch__lt=to_epoch(month_end)))
+	occurrences = [occurrence for occurrence in
+				   expand_occurrences(equipment, month_start, month_end)
+				   if occurrence.start_time < month_end]
+	if occurrences:
+		return sorted(chain(events, occurrences),
+					  key=attrgetter('start_time'), reverse=True)
+	return events
+
+
+def feed_bookings(equipment_name, window_start, window_end):
+	"""Events on an instrument overlapping the window plus standing
+	booking occurrences expanded over it"""
+	bookings = EventRow.rows(Event.objects.filter(
+		equipment__name=equipment_name,
+		start_epoch__lt=to_epoch(window_end),
+		end_epoch__gt=to_epoch(window_start)))
+	for equipment in Equipment.objects.filter(name=equipment_name):
+		bookings.extend(expand_occurrences(equipment, window_start, window_end))
+	return bookings
+
+
+def free_slots(equipment, window_start, window_end, min_length):
+	"""Gaps of at least min_length between live bookings in a window"""
+	events = Event.objects.filter(equipment=equipment,
+								  status__in=['A', 'H'],
+								  start_epoch__lt=to_epoch(window_end),
+								  end_epoch__gt=to_epoch(window_start)).\
+		only('start_time', 'end_time')
+	occurrences = expand_occurrences(equipment, window_start, window_end)
+	slots = []
+	cursor = window_start
+	for booking in sorted(chain(events, occurrences),
+						  key=attrgetter('start_time')):
+		if booking.start_time - cursor >= min_length:
+			slots.append((cursor, booking.start_time))
+		cursor = max(cursor, booking.end_time)
+	if window_end - cursor >= min_length:
+		slots.append((cursor, window_end))
+	return slots
@@ -0,0 +1,108 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from scheduling.models import Event, EventRow, Equipment
+from scheduling.utils import schedule_entry, to_epoch
+from datetime import timedelta
+import gc
+import sys
+import time
+
+
+class Command(BaseCommand):
+	"""Compare Event model instances with EventRow projections on the
+	work the calendar, feed and reminders do per event
+	"""
+
+	help = "Benchmarks building and formatting events as models and as " \
+		   "EventRow projections"
+	requires_system_checks = False
+
+	def add_arguments(self, parser):
+		parser.add_argument('--events', type=int, default=20000)
+		parser.add_argument('--repeat', type=int, default=3)
+
+	def handle(self, *args, **options):
+		rows = self.rows(options['events'])
+		for label, build in [('model', self.models), ('row', self.projections)]:
+			best = None
+			for attempt in range(options['repeat']):
+				gc.collect()
+				started = time.time()
+				events = build(rows)
+				for event in events:
+					schedule_entry(event)
+					event.hover_text
+					event.start_timestring_time
+				elapsed = time.time() - started
+				best = elapsed if best is None else min(best, elapsed)
+			self.stdout.write(self.style.SUCCESS(
+				'{:6} us/event {:8.2f}  bytes/event {:6}'.format(
+					label,
+					best * 1e6 / len(rows),
+					self.footprint(events[0]))))
+
+	def rows(self, count):
+		"""values_list() style rows of synthetic one hour bookings"""
+		start = timezone.now().replace(minute=0, second=0, microsecond=0)
+		epoch = to_epoch(start)
+		return [(index + 1,
+				 start + timedelta(hours=index),
+				 start + timedelta(hours=index + 1),
+				 epoch + index * 3600,
+				 epoch + (index + 1) * 3600,
+				 'A', False, False, True, 'Benchmark booking',
+				 index % 20 + 1, 'equipment{}'.format(index % 20),
+				 'user{}'.format(index % 100),
+				 'user{}@example.com'.format(index % 100))
+				for index in range(count)]
+
+	def models(self, rows):
+		"""Events as select_related('user', 'equipment') would load them"""
+		event_fields = [field.attname
+						for field in Event._meta.concrete_fields]
+		user_fields = [field.attname for field in User._meta.concrete_fields]
+		equipment_fields = [field.attname
+							for field in Equipment._meta.concrete_fields]
+		user_cache = Event._meta.get_field('user').get_cache_name()
+		equipment_cache = Event._meta.get_field('equipment').get_cache_name()
+		events = []
+		for (pk, start_time, end_time, start_epoch, end_epoch, status,
+			 expired, maintenance, disassemble, notes, equipment_id,
+			 equipment_name, user_name, user_email) in rows:
+			user_id = int(user_name[4:]) + 1
+			values = dict(id=pk, user_id=user_id, start_time=start_time,
+						  end_time=end_time, start_epoch=start_epoch,
+						  end_epoch=end_epoch, equipment_id=equipment_id,
+						  status=status, notes=notes,
+						  disassemble=disassemble, maintenance=maintenance,
+						  expired=expired)
+			event = Event.from_db(DEFAULT_DB_ALIAS, event_fields, [
+				values.get(name, None) for name in event_fields])
+			user = User.from_db(DEFAULT_DB_ALIAS, user_fields, [
+				dict(id=user_id, username=user_name, email=user_email).get(
+					name, None) for name in user_fields])
+			equipment = Equipment.from_db(
+				DEFAULT_DB_ALIAS, equipment_fields, [
+					dict(id=equipment_id, name=equipment_name).get(name, None)
+					for name in equipment_fields])
+			setattr(event, user_cache, user)
+			setattr(event, equipment_cache, equipment)
+			events.append(event)
+		return events
+
+	def projections(self, rows):
+		"""Events as EventRow.rows() would load them"""
+		return [EventRow(*values) for values in rows]
+
+	def footprint(self, event):
+		"""Bytes held by an event's containers, values excluded"""
+		if not hasattr(event, '__dict__'):
+			return sys.getsizeof(event)
+		size = 0
+		for obj in (event, event.user, event.equipment):
+			size += sys.getsizeof(obj) + sys.getsizeof(obj.__dict__)
+			size += sys.getsizeof(obj._state) + \
+				sys.getsizeof(obj._state.__dict__)
+		return size
@@ -0,0 +1,160 @@
+from django.core.management.base import BaseCommand
+from scheduling.db import apply_sqlite_pragmas, sqlite_pragmas
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE event (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    equipment_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    status TEXT NOT NULL,
+    expired INTEGER NOT NULL,
+    notes TEXT);
+CREATE INDEX event_equipment_start ON event (equipment_id, start_time);
+CREATE INDEX event_equipment_expired_start
+    ON event (equipment_id, expired, start_time);
+"""
+
+READ_SQL = """
+SELECT id, start_time, end_time, status FROM event
+WHERE equipment_id = ? AND start_time >= ? AND start_time < ?
+ORDER BY start_time DESC"""
+
+# The overlap check a booking save reads before it writes
+CHECK_SQL = """
+SELECT 1 FROM event
+WHERE equipment_id = ? AND end_time >= ? AND start_time <= ?
+  AND status = 'A' AND expired = 0
+LIMIT 1"""
+
+WRITE_SQL = """
+INSERT INTO event (equipment_id, user_id, start_time, end_time, status,
+                   expired, notes)
+VALUES (?, ?, ?, ?, 'A', 0, ?)"""
+
+
+class Command(BaseCommand):
+	"""Compare concurrent SQLite throughput with and without tuning.
+	Writers read before they write, as booking saves do, which is what
+	fails on a deferred transaction once another writer commits first.
+	"""
+
+	help = "Benchmarks concurrent reads/writes on a scratch SQLite database " \
+		   "with default settings, with BOOKIT_SQLITE_PRAGMAS, and with the " \
+		   "pragmas plus BEGIN IMMEDIATE as scheduling.db_backend does"
+	requires_system_checks = False
+
+	def add_arguments(self, parser):
+		parser.add_argument('--seconds', type=float, default=5.0)
+		parser.add_argument('--readers', type=int, default=4)
+		parser.add_argument('--writers', type=int, default=2)
+		parser.add_argument('--rows', type=int, default=50000)
+		parser.add_argument('--equipment', type=int, default=20)
+
+	def handle(self, *args, **options):
+		workdir = tempfile.mkdtemp(prefix='bookit-bench-')
+		try:
+			profiles = [('default', (), 'BEGIN'),
+						('pragmas', sqlite_pragmas(), 'BEGIN'),
+						('tuned', sqlite_pragmas(), 'BEGIN IMMEDIATE')]
+			for label, pragmas, begin in profiles:
+				path = os.path.join(workdir, '{}.sqlite3'.format(label))
+				self.seed(path, pragmas, options)
+				result = self.run(path, pragmas, begin, options)
+				self.stdout.write(self.style.SUCCESS(
+					'{:8} reads/s {:9.1f}  writes/s {:8.1f}  '
+					'locked errors {}'.format(
+						label,
+						result['reads'] / options['seconds'],
+						result['writes'] / options['seconds'],
+						result['locked'])))
+		finally:
+			shutil.rmtree(workdir)
+
+	def connect(self, path, pragmas):
+		"""Open a connection the way Django's SQLite backend does"""
+		connection = sqlite3.connect(path, check_same_thread=False)
+		connection.isolation_level = None
+		cursor = connection.cursor()
+		apply_sqlite_pragmas(cursor, pragmas)
+		return connection, cursor
+
+	def seed(self, path, pragmas, options):
+		"""Create the table and fill it with a year of bookings"""
+		connection, cursor = self.connect(path, pragmas)
+		cursor.executescript(SCHEMA)
+		cursor.execute('BEGIN')
+		for index in range(options['rows']):
+			cursor.execute(WRITE_SQL, self.random_event(options))
+		cursor.execute('COMMIT')
+		connection.close()
+
+	def random_event(self, options):
+		"""Parameters for a one hour booking somewhere in 2016"""
+		day = random.randint(1, 28)
+		month = random.randint(1, 12)
+		hour = random.randint(0, 22)
+		start = '2016-{:02d}-{:02d} {:02d}:00:00'.format(month, day, hour)
+		end = '2016-{:02d}-{:02d} {:02d}:00:00'.format(month, day, hour + 1)
+		return (random.randint(1, options['equipment']),
+				random.randint(1, 100), start, end, 'bench')
+
+	def run(self, path, pragmas, begin, options):
+		"""Hammer the database from reader and writer threads"""
+		counts = {'reads': 0, 'writes': 0, 'locked': 0}
+		lock = threading.Lock()
+		deadline = time.time() + options['seconds']
+
+		def count(key):
+			with lock:
+				counts[key] += 1
+
+		def reader():
+			connection, cursor = self.connect(path, pragmas)
+			while time.time() < deadline:
+				month = random.randint(1, 11)
+				try:
+					cursor.execute(READ_SQL, (
+						random.randint(1, options['equipment']),
+						'2016-{:02d}-01'.format(month),
+						'2016-{:02d}-01'.format(month + 1))).fetchall()
+					count('reads')
+				except sqlite3.OperationalError:
+					count('locked')
+			connection.close()
+
+		def writer():
+			connection, cursor = self.connect(path, pragmas)
+			while time.time() < deadline:
+				event = self.random_event(options)
+				try:
+					cursor.execute(begin)
+					cursor.execute(CHECK_SQL, event[:1] + event[2:4]).fetchall()
+					cursor.execute(WRITE_SQL, event)
+					cursor.execute('COMMIT')
+					count('writes')
+				except sqlite3.OperationalError:
+					try:
+						cursor.execute('ROLLBACK')
+					except sqlite3.OperationalError:
+						pass
+					count('locked')
+			connection.close()
+
+		threads = [threading.Thread(target=reader)
+				   for index in range(options['readers'])]
+		threads += [threading.Thread(target=writer)
+					for index in range(options['writers'])]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		return counts
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from scheduling.caching import read_stats, reset_stats
+
+
+class Command(BaseCommand):
+	"""Report scheduling cache effectiveness"""
+
+	help = "Shows hit/miss counts of the scheduling cache by namespace"
+	requires_system_checks = False
+
+	def add_arguments(self, parser):
+		parser.add_argument('--reset', action='store_true',
+							help='Zero the counters after reporting')
+
+	def handle(self, *args, **options):
+		for kind, counts in sorted(read_stats().items()):
+			lookups = counts['hits'] + counts['misses']
+			ratio = 100.0 * counts['hits'] / lookups if lookups else 0.0
+			self.stdout.write('{:12} hits {:8}  misses {:8}  hit rate {:5.1f}%'.
+							  format(kind, counts['hits'], counts['misses'],
+									 ratio))
+		if options['reset']:
+			reset_stats()
+			self.stdout.write(self.style.SUCCESS('Counters reset.'))
@@ -1,6 +1,11 @@
 from django.core.management.base import BaseCommand
-from scheduling.models import Event
-from datetime import datetime
+from scheduling.models import Event, EventDelta, Equipment, \
+    refresh_equipment_summary, refresh_passed_summaries
+from scheduling.booking import hold_offline_occurrences
+from scheduling.utils import offline_hold_mails
+from django.conf import settings
+from django.utils import timezone
+from datetime import datetime, timedelta
 
 
 class Command(BaseCommand):
@@ -12,14 +17,38 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         events = Event.objects.filter(expired=False,
                                       end_time__lt=datetime.now())
+        equipment_ids = set(events.values_list('equipment_id', flat=True))
         self.stdout.write(self.style.SUCCESS(
             "{} Found [{}] events.".format(
                 datetime.now().strftime('%a %d-%b-%y %H-%M-%S'),
-                str(len(events)))))
-        for event in events:
-            event.expired = True
-            event.save()
+                str(events.count()))))
+        expired = events.update(expired=True)
+        for equipment_id in equipment_ids:
+            refresh_equipment_summary(equipment_id)
+        # Bookings and occurrences that started but have yet to end
+        refresh_passed_summaries()
         self.stdout.write(self.style.SUCCESS(
             '{} Expired [{}] events.'.format(
                 datetime.now().strftime('%a %d-%b-%y %H-%M-%S'),
-                len(events))))
\ No newline at end of file
+                expired)))
+        # Standing bookings of offline equipment are held a fixed time
+        # ahead, hold the occurrences that came into range
+        held = 0
+        for equipment in Equipment.objects.filter(status=False).\
+                select_related('admin'):
+            occurrences = hold_offline_occurrences(equipment)
+            if occurrences:
+                offline_hold_mails(equipment, occurrences)
+                held += len(occurrences)
+        self.stdout.write(self.style.SUCCESS(
+            '{} Held [{}] occurrences on offline equipment.'.format(
+                datetime.now().strftime('%a %d-%b-%y %H-%M-%S'),
+                held)))
+        # Live feeds only replay deltas to briefly disconnected clients
+        retention = getattr(settings, 'BOOKIT_LIVE_RETENTION_HOURS', 24)
+        pruned, _ = EventDelta.objects.filter(
+            created__lt=timezone.now() - timedelta(hours=retention)).delete()
+        self.stdout.write(self.style.SUCCESS(
+            '{} Pruned [{}] live feed deltas.'.format(
+                datetime.now().strftime('%a %d-%b-%y %H-%M-%S'),
+                pruned)))
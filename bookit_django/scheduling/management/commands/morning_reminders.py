@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
-from scheduling.models import Event
-from scheduling.utils import event_reminder_mail
-from datetime import datetime
+from scheduling.models import Event, EventRow, RecurringBooking
+from scheduling.utils import event_reminder_mail, day_bounds
+from scheduling.routers import use_replica
+from datetime import datetime, date, timedelta
 
 
 class Command(BaseCommand):
@@ -13,10 +14,24 @@ class Command(BaseCommand):
 	requires_system_checks = False
 
 	def handle(self, *args, **options):
-		events = Event.objects.filter(expired=False,
-									  status__in=['A', 'H'],
-									  equipment__status=True,
-									  start_time__day=datetime.now().day + 1)
+		with use_replica():
+			self.send_reminders()
+
+	def send_reminders(self):
+		day_start, day_end = day_bounds(date.today() + timedelta(days=1))
+		events = EventRow.rows(Event.objects.filter(
+			expired=False,
+			status__in=['A', 'H'],
+			equipment__status=True,
+			start_time__gte=day_start,
+			start_time__lt=day_end))
+		rules = RecurringBooking.objects.between(day_start, day_end).filter(
+			status='A',
+			equipment__status=True).select_related('user', 'equipment')
+		for rule in rules:
+			events.extend(occurrence for occurrence in
+						  rule.occurrences(day_start, day_end)
+						  if day_start <= occurrence.start_time < day_end)
 		self.stdout.write(self.style.SUCCESS(
 			"{} Reminders: Found [{}] events.".format(
 				datetime.now().strftime('%a %d-%b-%y %H-%M-%S'),
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from scheduling.search import rebuild_index
+from datetime import datetime
+import time
+
+
+class Command(BaseCommand):
+	"""Rebuild the full-text search index"""
+
+	help = "Reindexes messages, tickets, comments and service records"
+	requires_system_checks = False
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=1000)
+
+	def handle(self, *args, **options):
+		start = time.time()
+		counts = rebuild_index(options['batch_size'])
+		if counts is None:
+			raise CommandError('No full-text index on this database, '
+							   'search falls back to scans.')
+		self.stdout.write(self.style.SUCCESS(
+			'{} Search index: [{}] in {:.1f} s.'.format(
+				datetime.now().strftime('%a %d-%b-%y %H-%M-%S'),
+				', '.join('{} {}'.format(counts[kind], kind)
+						  for kind in sorted(counts)),
+				time.time() - start)))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from scheduling.models import recompute_equipment_summaries
+from datetime import datetime
+
+
+class Command(BaseCommand):
+    """Self-heal denormalized equipment columns"""
+
+    help = "Recomputes next booking and last service columns on equipment"
+    requires_system_checks = False
+
+    def handle(self, *args, **options):
+        drifted = recompute_equipment_summaries()
+        self.stdout.write(self.style.SUCCESS(
+            '{} Recomputed equipment, fixed [{}] drifted rows.'.format(
+                datetime.now().strftime('%a %d-%b-%y %H-%M-%S'),
+                drifted)))
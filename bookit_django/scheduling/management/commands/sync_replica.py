@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from scheduling.routers import replica_alias, replica_version_path
+from datetime import datetime
+import glob
+import os
+import time
+
+
+class Command(BaseCommand):
+	"""Refresh a SQLite replica stand-in from the primary.
+
+	Each sync writes a new copy next to the replica's NAME, named after the
+	time it was taken, and then atomically points the NAME symlink at it.
+	Copies are never overwritten, so connections kept open by CONN_MAX_AGE
+	read their old copy, with its own -wal and -shm, until they reconnect.
+	The copy time tells ReplicaPinMiddleware how stale the replica is.
+	"""
+
+	help = "Copies the primary SQLite database to a new replica file"
+	requires_system_checks = False
+
+	def handle(self, *args, **options):
+		alias = replica_alias()
+		if alias is None:
+			raise CommandError('No replica database is configured.')
+		primary = connections[DEFAULT_DB_ALIAS]
+		replica = connections[alias]
+		if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+			raise CommandError('Only SQLite replicas can be synced locally.')
+		target = replica.settings_dict['NAME']
+		if replica.is_in_memory_db(target):
+			raise CommandError('The replica [{}] is an in-memory database, '
+							   'there is no file to sync.'.format(alias))
+		synced = time.time()
+		version = replica_version_path(target, synced)
+		with primary.cursor() as cursor:
+			cursor.execute('VACUUM INTO %s', [version])
+		link = target + '.link'
+		if os.path.lexists(link):
+			os.remove(link)
+		os.symlink(os.path.basename(version), link)
+		os.rename(link, target)
+		removed = self.prune(target, replica.settings_dict)
+		self.stdout.write(self.style.SUCCESS(
+			'{} Synced replica [{}] to {}, removed [{}] old copies'.format(
+				datetime.now().strftime('%a %d-%b-%y %H-%M-%S'),
+				alias, version, removed)))
+
+	def prune(self, target, settings_dict):
+		"""Delete copies replaced long enough ago that no kept-open
+		connection can still be reading them"""
+		max_age = settings_dict.get('CONN_MAX_AGE', 0)
+		if max_age is None:
+			# Connections are kept forever, any copy may be in use
+			return 0
+		grace = max_age + 60
+		versions = []
+		for path in glob.glob(target + '.[0-9]*'):
+			try:
+				versions.append((int(path.rsplit('.', 1)[1]), path))
+			except ValueError:
+				continue
+		versions.sort()
+		removed = 0
+		for (stamp, path), (replaced, _) in zip(versions, versions[1:]):
+			if time.time() - replaced / 1000.0 < grace:
+				continue
+			for name in (path, path + '-wal', path + '-shm'):
+				if os.path.exists(name):
+					os.remove(name)
+			removed += 1
+		return removed
@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connections
+from multiprocessing.pool import ThreadPool
+from scheduling.caching import equipment_list, equipment_detail, \
+	tag_list, month_calendar, default_feed, dashboard_snapshot, flush_stats
+from scheduling.views import RECURRENCE_FEED_DAYS
+from datetime import date, datetime
+import time
+
+
+def months_ahead(count):
+	"""(year, month) of the current month and the count following it"""
+	today = date.today()
+	months = []
+	for offset in range(count + 1):
+		index = today.month - 1 + offset
+		months.append((today.year + index // 12, index % 12 + 1))
+	return months
+
+
+class Command(BaseCommand):
+	"""Pre-render cached pages after a deploy or cache flush"""
+
+	help = "Renders month calendars, JSON feeds and dashboard data for " \
+		   "every instrument into the cache"
+	requires_system_checks = False
+
+	def add_arguments(self, parser):
+		parser.add_argument('--months', type=int, default=2,
+							help='Months to render after the current one')
+		parser.add_argument('--threads', type=int,
+							default=getattr(settings, 'BOOKIT_LOADER_THREADS', 1),
+							help='Size of the worker pool')
+		parser.add_argument('--force', action='store_true',
+							help='Render even where the cache is warm')
+
+	def handle(self, *args, **options):
+		refresh = options['force']
+		started = time.time()
+		# Dashboard data first, the per-instrument items need the list
+		items = [('equipment list', equipment_list, ()),
+				 ('dashboard', dashboard_snapshot, ()),
+				 ('message board tags', tag_list, ())]
+		results = [self.warm(item, refresh) for item in items]
+		items = []
+		for equipment in equipment_list():
+			items.append(('{} detail'.format(equipment.name),
+						  equipment_detail, (equipment.id,)))
+			items.append(('{} feed'.format(equipment.name),
+						  default_feed, (equipment, RECURRENCE_FEED_DAYS)))
+			for year, month in months_ahead(options['months']):
+				items.append(('{} {}-{:02d}'.format(equipment.name, year, month),
+							  month_calendar, (equipment, year, month)))
+		pool = ThreadPool(max(1, options['threads']))
+		try:
+			results += pool.map(lambda item: self.warm(item, refresh), items)
+		finally:
+			pool.close()
+			pool.join()
+		flush_stats()
+		failed = 0
+		for label, elapsed, error in results:
+			if error:
+				failed += 1
+				self.stdout.write(self.style.ERROR(
+					'{:40} failed: {}'.format(label, error)))
+			else:
+				self.stdout.write('{:40} {:8.1f} ms'.format(label, elapsed))
+		self.stdout.write(self.style.SUCCESS(
+			'{} Warmed [{}] items in {:.1f} s, [{}] failed.'.format(
+				datetime.now().strftime('%a %d-%b-%y %H-%M-%S'),
+				len(results) - failed, time.time() - started, failed)))
+
+	def warm(self, item, refresh):
+		"""Render one item, returning its label, time in ms and any error"""
+		label, loader, loader_args = item
+		start = time.time()
+		try:
+			loader(*loader_args, refresh=refresh)
+			error = None
+		except Exception as exc:
+			error = exc
+		finally:
+			# Pool threads each hold their own connection
+			connections.close_all()
+		return label, (time.time() - start) * 1000, error
@@ -0,0 +1,93 @@
+import cProfile
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from django.conf import settings
+from .permissions import get_permissions
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_BOOKIT_PROFILE'
+PROFILE_PARAM = '_profile'
+
+
+class ProfilerMiddleware(object):
+	"""Run a single request under cProfile on demand.
+
+	Staff flagged as admins can request a profile with either the
+	X-Bookit-Profile header or the _profile query parameter. Profiles are
+	only taken when BOOKIT_PROFILE_DIR is set, and are rate limited by
+	BOOKIT_PROFILE_SAMPLE_RATE and BOOKIT_PROFILE_MIN_INTERVAL so the
+	middleware can stay installed in production.
+	"""
+
+	_lock = threading.Lock()
+	_last_profile = 0.0
+
+	def process_view(self, request, view_func, view_args, view_kwargs):
+		"""Swap in a profiled call of the view when requested"""
+		if not self.wants_profile(request):
+			return None
+		if PROFILE_PARAM in request.GET:
+			# Admin changelists reject unknown query parameters as filters
+			request.GET = request.GET.copy()
+			del request.GET[PROFILE_PARAM]
+		if not self.acquire_slot():
+			return None
+		profiler = cProfile.Profile()
+		response = profiler.runcall(view_func, request,
+									*view_args, **view_kwargs)
+		# Admin changelists hand back lazy TemplateResponses, so render
+		# inside the profiler as well or the template work is missed.
+		if (callable(getattr(response, 'render', None)) and
+				not getattr(response, 'is_rendered', True)):
+			profiler.runcall(response.render)
+		response['X-Bookit-Profile'] = self.dump(request, profiler)
+		return response
+
+	def wants_profile(self, request):
+		"""Check the request asked for a profile and is allowed one"""
+		if not getattr(settings, 'BOOKIT_PROFILE_DIR', None):
+			return False
+		if PROFILE_HEADER not in request.META and \
+				PROFILE_PARAM not in request.GET:
+			return False
+		user = getattr(request, 'user', None)
+		return bool(user and user.is_authenticated() and
+					get_permissions(request).is_admin)
+
+	def acquire_slot(self):
+		"""Apply sampling and the minimum interval between profiles"""
+		sample_rate = getattr(settings, 'BOOKIT_PROFILE_SAMPLE_RATE', 1.0)
+		if random.random() >= sample_rate:
+			return False
+		min_interval = getattr(settings, 'BOOKIT_PROFILE_MIN_INTERVAL', 60)
+		with self._lock:
+			now = time.time()
+			if now - ProfilerMiddleware._last_profile < min_interval:
+				return False
+			ProfilerMiddleware._last_profile = now
+		return True
+
+	def dump(self, request, profiler):
+		"""Write the .prof file and a top-N summary, return the base name"""
+		profile_dir = settings.BOOKIT_PROFILE_DIR
+		if not os.path.isdir(profile_dir):
+			os.makedirs(profile_dir)
+		slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+		name = '{}-{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'),
+								 request.method.lower(), slug[:80])
+		base = os.path.join(profile_dir, name)
+		profiler.dump_stats(base + '.prof')
+		with open(base + '.txt', 'w') as summary:
+			summary.write('{} {}?{}\n\n'.format(request.method, request.path,
+												request.META.get('QUERY_STRING', '')))
+			stats = pstats.Stats(profiler, stream=summary)
+			stats.sort_stats('cumulative').print_stats(
+				getattr(settings, 'BOOKIT_PROFILE_TOP', 40))
+		logger.info('Wrote request profile [{}]'.format(base))
+		return name
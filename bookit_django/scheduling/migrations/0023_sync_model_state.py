@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 08:32
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Information, Tag and the fields below were in models.py without ever
+# being captured in a migration. Databases built from those models already
+# have the tables and columns; mark this migration applied on them with
+#   manage.py migrate scheduling 0023 --fake
+# and then run manage.py migrate as usual.
+FAKE_HINT = ('The scheduling_information table already exists, so this '
+             'database was built from models.py directly. Run '
+             '"manage.py migrate scheduling 0023 --fake", then migrate '
+             'again.')
+
+
+def check_unsynced_schema(apps, schema_editor):
+    """Stop with instructions rather than fail halfway on existing tables"""
+    tables = schema_editor.connection.introspection.table_names()
+    if 'scheduling_information' in tables:
+        raise RuntimeError(FAKE_HINT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scheduling', '0022_equipment_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_unsynced_schema,
+                             migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='Information',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('header', models.CharField(max_length=100, verbose_name='Header')),
+                ('body', models.TextField(verbose_name='Body')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Modified')),
+                ('main_page_visible', models.BooleanField(default=False, verbose_name='Main Page Display')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='information_editor', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'information',
+            },
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=50, unique=True, verbose_name='Tag')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='admin',
+            field=models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, related_name='equipment_admin', to=settings.AUTH_USER_MODEL),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='users',
+            field=models.ManyToManyField(related_name='equipment_user', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='service',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='scheduling.Service'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='equipment',
+            field=models.ForeignKey(blank=True, help_text='If selected, will only email associated users', null=True, on_delete=django.db.models.deletion.CASCADE, to='scheduling.Equipment'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='completed',
+            field=models.BooleanField(default=False, verbose_name='Completed'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='ticket',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='scheduling.Ticket'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='end_time',
+            field=models.DateTimeField(help_text='24hr format, e.g. 20:00', verbose_name='End time'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='start_time',
+            field=models.DateTimeField(help_text='24hr format, e.g. 15:00', verbose_name='Start time'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='status',
+            field=models.CharField(choices=[('C', 'Canceled'), ('A', 'Active'), ('H', 'Hold')], default='A', max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='success',
+            field=models.BooleanField(default=False, verbose_name='Success'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='tags',
+            field=models.ManyToManyField(blank=True, null=True, to='scheduling.Tag'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 08:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0023_sync_model_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='equipment',
+            name='name',
+            field=models.CharField(db_index=True, max_length=40, verbose_name='Equipment'),
+        ),
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('equipment', 'start_time'), ('expired', 'end_time'), ('user', 'start_time'), ('equipment', 'expired', 'start_time'), ('expired', 'start_time')]),
+        ),
+    ]
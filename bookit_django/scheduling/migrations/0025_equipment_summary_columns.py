@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 08:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+from django.utils import timezone
+
+
+def populate_summary_columns(apps, schema_editor):
+    """Fill the new columns for existing equipment"""
+    Equipment = apps.get_model('scheduling', 'Equipment')
+    Event = apps.get_model('scheduling', 'Event')
+    Service = apps.get_model('scheduling', 'Service')
+    for equipment in Equipment.objects.all():
+        next_booking = Event.objects.filter(
+            equipment=equipment,
+            status__in=['A', 'H'],
+            expired=False,
+            start_time__gte=timezone.now()).aggregate(
+                start=Min('start_time'))['start']
+        last_service = Service.objects.filter(
+            equipment=equipment).aggregate(date=Max('date'))['date']
+        Equipment.objects.filter(id=equipment.id).update(
+            next_booking_start=next_booking,
+            last_service_date=last_service)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0024_event_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipment',
+            name='last_service_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Last service'),
+        ),
+        migrations.AddField(
+            model_name='equipment',
+            name='next_booking_start',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Next booking'),
+        ),
+        migrations.RunPython(populate_summary_columns,
+                             migrations.RunPython.noop),
+    ]
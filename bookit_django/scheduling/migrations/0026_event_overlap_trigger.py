@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Keep the message in sync with scheduling.booking.OVERLAP_ERROR
+OVERLAP_CONDITION = """
+    EXISTS (SELECT 1 FROM scheduling_event e
+            WHERE e.equipment_id = NEW.equipment_id
+              AND e.id != {exclude}
+              AND e.status IN ('A', 'H')
+              AND e.expired = 0
+              AND e.end_time >= NEW.start_time
+              AND e.start_time <= NEW.end_time)"""
+
+SQLITE_TRIGGER = """
+CREATE TRIGGER scheduling_event_no_overlap_{action}
+BEFORE {event} ON scheduling_event
+FOR EACH ROW
+WHEN NEW.status IN ('A', 'H') AND NEW.expired = 0 AND {condition}
+BEGIN
+    SELECT RAISE(ABORT, 'scheduling_event overlaps an existing booking');
+END"""
+
+MYSQL_TRIGGER = """
+CREATE TRIGGER scheduling_event_no_overlap_{action}
+BEFORE {event} ON scheduling_event
+FOR EACH ROW
+BEGIN
+    IF NEW.status IN ('A', 'H') AND NEW.expired = 0 AND {condition} THEN
+        SIGNAL SQLSTATE '45000'
+            SET MESSAGE_TEXT = 'scheduling_event overlaps an existing booking';
+    END IF;
+END"""
+
+TRIGGERS = {
+    'sqlite': SQLITE_TRIGGER,
+    'mysql': MYSQL_TRIGGER,
+}
+
+ACTIONS = (
+    ('insert', 'INSERT', '-1'),
+    ('update', 'UPDATE', 'NEW.id'),
+)
+
+# Pairs of active bookings that overlap already. The UPDATE trigger would
+# reject every later save of either row, so they must be resolved first.
+EXISTING_OVERLAPS = """
+SELECT a.id, b.id FROM scheduling_event a
+JOIN scheduling_event b
+  ON b.equipment_id = a.equipment_id
+ AND b.id > a.id
+ AND b.status IN ('A', 'H')
+ AND b.expired = 0
+ AND b.end_time >= a.start_time
+ AND b.start_time <= a.end_time
+WHERE a.status IN ('A', 'H') AND a.expired = 0
+ORDER BY a.id, b.id"""
+
+OVERLAP_HINT = ('Active bookings already overlap, event id pairs: {}. '
+                'Cancel, expire or move one booking of each pair, then '
+                'migrate again.')
+
+
+def check_existing_overlaps(schema_editor):
+    """Stop with the offending bookings rather than add triggers that
+    would refuse every later change to them"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(EXISTING_OVERLAPS)
+        pairs = cursor.fetchmany(20)
+    if pairs:
+        raise RuntimeError(OVERLAP_HINT.format(', '.join(
+            '({}, {})'.format(*pair) for pair in pairs)))
+
+
+def create_triggers(apps, schema_editor):
+    """Reject overlapping active bookings at the database level.
+    Only SQLite and MySQL get triggers, other backends rely on the
+    locked check in scheduling.booking.save_booking alone.
+    """
+    template = TRIGGERS.get(schema_editor.connection.vendor)
+    if template is None:
+        return
+    check_existing_overlaps(schema_editor)
+    for action, event, exclude in ACTIONS:
+        schema_editor.execute(template.format(
+            action=action,
+            event=event,
+            condition=OVERLAP_CONDITION.format(exclude=exclude)))
+
+
+def drop_triggers(apps, schema_editor):
+    """Remove the overlap triggers"""
+    if schema_editor.connection.vendor not in TRIGGERS:
+        return
+    for action, event, exclude in ACTIONS:
+        schema_editor.execute(
+            'DROP TRIGGER IF EXISTS scheduling_event_no_overlap_{}'.format(
+                action))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0025_equipment_summary_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 08:37
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scheduling', '0026_event_overlap_trigger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurrenceException',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occurrence_start', models.DateTimeField(verbose_name='Occurrence start')),
+                ('reason', models.CharField(blank=True, max_length=100, null=True, verbose_name='Reason')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecurringBooking',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField(help_text='24hr format, e.g. 15:00', verbose_name='First start')),
+                ('end_time', models.DateTimeField(help_text='24hr format, e.g. 20:00', verbose_name='First end')),
+                ('frequency', models.CharField(choices=[('D', 'Daily'), ('W', 'Weekly')], default='W', max_length=1)),
+                ('interval', models.PositiveSmallIntegerField(default=1, help_text='Repeat every N days/weeks', verbose_name='Every')),
+                ('until', models.DateTimeField(blank=True, null=True, verbose_name='Until')),
+                ('count', models.PositiveIntegerField(blank=True, help_text='Stop after this many, blank for no limit', null=True, verbose_name='Occurrences')),
+                ('status', models.CharField(choices=[('C', 'Canceled'), ('A', 'Active'), ('H', 'Hold')], default='A', max_length=1)),
+                ('notes', models.TextField(blank=True, null=True, verbose_name='Notes')),
+                ('disassemble', models.BooleanField(default=True, verbose_name='Can disassemble')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Modified')),
+                ('equipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_bookings', to='scheduling.Equipment')),
+                ('user', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='recurring_bookings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-start_time'],
+            },
+        ),
+        migrations.AddField(
+            model_name='recurrenceexception',
+            name='booking',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='scheduling.RecurringBooking'),
+        ),
+        migrations.AlterIndexTogether(
+            name='recurringbooking',
+            index_together=set([('equipment', 'status', 'start_time')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='recurrenceexception',
+            unique_together=set([('booking', 'occurrence_start')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 08:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0027_recurring_booking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventDelta',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('booking', models.CharField(max_length=20, verbose_name='Booking')),
+                ('action', models.CharField(choices=[('created', 'Created'), ('changed', 'Changed'), ('cancelled', 'Cancelled')], max_length=9)),
+                ('payload', models.TextField(verbose_name='Payload')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('equipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deltas', to='scheduling.Equipment')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='eventdelta',
+            index_together=set([('equipment', 'id')]),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 08:52
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+TAG_INDEX = 'scheduling_message_tags_tag_message'
+
+
+def create_tag_index(apps, schema_editor):
+    """Let the tag filter walk a tag's messages from the index alone"""
+    schema_editor.execute(
+        'CREATE INDEX {} ON scheduling_message_tags (tag_id, message_id)'.
+        format(TAG_INDEX))
+
+
+def drop_tag_index(apps, schema_editor):
+    """Remove the tag filter index"""
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX {} ON scheduling_message_tags'.
+                              format(TAG_INDEX))
+    else:
+        schema_editor.execute('DROP INDEX {}'.format(TAG_INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0028_event_delta'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='message',
+            index_together=set([('created', 'id'), ('equipment', 'created', 'id')]),
+        ),
+        migrations.RunPython(create_tag_index, drop_tag_index),
+    ]
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, OperationalError
+
+# Keep in sync with scheduling.search: row ids are object id * 4 + kind,
+# kinds in order message, ticket, comment, service
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE scheduling_search USING fts5(
+    body,
+    equipment_id UNINDEXED,
+    tokenize = 'porter unicode61')"""
+
+POPULATE = [
+    """INSERT INTO scheduling_search (rowid, body, equipment_id)
+       SELECT id * 4, msg, equipment_id FROM scheduling_message""",
+    """INSERT INTO scheduling_search (rowid, body, equipment_id)
+       SELECT id * 4 + 1, msg, equipment_id FROM scheduling_ticket""",
+    """INSERT INTO scheduling_search (rowid, body, equipment_id)
+       SELECT c.id * 4 + 2, c.msg,
+              (SELECT t.equipment_id
+               FROM scheduling_ticket_comment tc
+               JOIN scheduling_ticket t ON t.id = tc.ticket_id
+               WHERE tc.comment_id = c.id
+               ORDER BY t.id LIMIT 1)
+       FROM scheduling_comment c""",
+    """INSERT INTO scheduling_search (rowid, body, equipment_id)
+       SELECT id * 4 + 3,
+              job || CASE WHEN notes IS NULL OR notes = ''
+                          THEN '' ELSE char(10) || notes END,
+              equipment_id
+       FROM scheduling_service""",
+]
+
+
+def create_search_index(apps, schema_editor):
+    """Full-text index for SQLite builds with FTS5, others use scans"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(CREATE_TABLE)
+    except OperationalError:
+        # SQLite compiled without FTS5
+        return
+    for statement in POPULATE:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    """Remove the full-text index"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS scheduling_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0029_message_board_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
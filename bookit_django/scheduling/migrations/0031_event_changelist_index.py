@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 09:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0030_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('equipment', 'start_time'), ('expired', 'start_time'), ('expired', 'end_time'), ('user', 'start_time'), ('equipment', 'expired', 'start_time'), ('start_time', 'id')]),
+        ),
+    ]
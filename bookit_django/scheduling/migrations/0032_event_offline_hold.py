@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 09:06
+from __future__ import unicode_literals
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+overlap_trigger = import_module(
+    'scheduling.migrations.0026_event_overlap_trigger')
+
+
+def recreate_triggers(apps, schema_editor):
+    """SQLite rebuilds the table to add a column, dropping its triggers"""
+    overlap_trigger.drop_triggers(apps, schema_editor)
+    overlap_trigger.create_triggers(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0031_event_changelist_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, recreate_triggers),
+        migrations.AddField(
+            model_name='event',
+            name='offline_hold',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Held while offline'),
+        ),
+        migrations.RunPython(recreate_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 09:11
+from __future__ import unicode_literals
+
+import calendar
+from importlib import import_module
+from time import mktime
+
+from django.db import migrations, models
+from django.db.models import Case, When, Value
+from django.utils import timezone
+
+overlap_trigger = import_module(
+    'scheduling.migrations.0026_event_overlap_trigger')
+
+
+def epoch(value):
+    """Seconds since the Unix epoch, through UTC for aware values"""
+    if timezone.is_aware(value):
+        return calendar.timegm(value.utctimetuple())
+    return int(mktime(value.timetuple()))
+
+
+def populate_epoch_columns(apps, schema_editor, batch_size=100):
+    """Fill the new columns for existing events, one UPDATE per batch.
+    Batches stay under SQLite's limit of 999 query parameters.
+    """
+    Event = apps.get_model('scheduling', 'Event')
+    rows = list(Event.objects.order_by('id').values_list(
+        'id', 'start_time', 'end_time'))
+    for offset in range(0, len(rows), batch_size):
+        batch = rows[offset:offset + batch_size]
+        Event.objects.filter(id__in=[pk for pk, _, _ in batch]).update(
+            start_epoch=Case(*[When(id=pk, then=Value(epoch(start_time)))
+                               for pk, start_time, _ in batch],
+                             output_field=models.BigIntegerField()),
+            end_epoch=Case(*[When(id=pk, then=Value(epoch(end_time)))
+                             for pk, _, end_time in batch],
+                           output_field=models.BigIntegerField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0032_event_offline_hold'),
+    ]
+
+    operations = [
+        # Off while the table is rebuilt and every row is rewritten
+        migrations.RunPython(overlap_trigger.drop_triggers,
+                             overlap_trigger.create_triggers),
+        migrations.AddField(
+            model_name='event',
+            name='end_epoch',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='End epoch'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='start_epoch',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Start epoch'),
+            preserve_default=False,
+        ),
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('equipment', 'start_time'), ('equipment', 'start_epoch', 'end_epoch'), ('expired', 'end_time'), ('user', 'start_time'), ('equipment', 'expired', 'start_time'), ('expired', 'start_time'), ('start_time', 'id')]),
+        ),
+        migrations.RunPython(populate_epoch_columns,
+                             migrations.RunPython.noop),
+        migrations.RunPython(overlap_trigger.create_triggers,
+                             overlap_trigger.drop_triggers),
+    ]
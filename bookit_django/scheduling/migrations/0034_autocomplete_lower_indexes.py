@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+# Keep in sync with AUTOCOMPLETE_COLUMNS in scheduling.views. MySQL's
+# default collations already compare case-insensitively and use the
+# plain column indexes.
+INDEXES = [
+    ('scheduling_user_username_lower', 'auth_user', 'username'),
+    ('scheduling_equipment_name_lower', 'scheduling_equipment', 'name'),
+]
+
+
+def create_lower_indexes(apps, schema_editor):
+    """Expression indexes answering case-insensitive prefix searches"""
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    quote = schema_editor.quote_name
+    for name, table, column in INDEXES:
+        schema_editor.execute('CREATE INDEX {} ON {} (LOWER({}))'.format(
+            quote(name), quote(table), quote(column)))
+
+
+def drop_lower_indexes(apps, schema_editor):
+    """Remove the expression indexes"""
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(
+            schema_editor.quote_name(name)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scheduling', '0033_event_epoch_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_lower_indexes, drop_lower_indexes),
+    ]
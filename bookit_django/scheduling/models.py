@@ -1,16 +1,20 @@
 from __future__ import unicode_literals
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models import Max, Min
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import Signal
 from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from datetime import datetime
-from time import mktime
+from datetime import timedelta
+import json
 from django.contrib.auth.forms import PasswordResetForm
 from django.core.urlresolvers import reverse
-from utils import maintenance_cancellation, EMAIL_FROM
+from utils import to_timestamp, to_epoch, epoch_timestamp, schedule_entry, \
+    EMAIL_FROM
+from .recurrence import Recurrence
 
 
 STATUS = (
@@ -18,10 +22,24 @@ STATUS = (
     ("A", "Active"),
     ("H", "Hold"))
 
+FREQUENCY = (
+    ("D", "Daily"),
+    ("W", "Weekly"))
+
 YESNO = (
     ("Y", "Yes"),
     ("N", "No"))
 
+DELTA_ACTIONS = (
+    ("created", "Created"),
+    ("changed", "Changed"),
+    ("cancelled", "Cancelled"))
+
+# Sent whenever the denormalized equipment columns are rewritten
+equipment_summary_changed = Signal(providing_args=["equipment_id"])
+# Sent after rows are changed by a set-based UPDATE, which skips post_save
+rows_updated = Signal(providing_args=["fields"])
+
 
 def get_model_fields(obj):
     """Generate field names and values for templates"""
@@ -29,14 +47,18 @@ def get_model_fields(obj):
             for field in obj.__class__._meta.fields]
 
 
+def upcoming_bookings():
+    """Active or held bookings that have yet to start"""
+    return Event.objects.filter(status__in=['A', 'H'],
+                                expired=False,
+                                start_time__gte=timezone.now())
+
+
 def find_next_booking(obj):
     """Identify next booked slot for instrument"""
-    return Event.objects.\
-        filter(equipment=obj,
-               status__in=['A', 'H'],
-               expired=False,
-               start_time__gte=datetime.now()).\
-        order_by('start_time')[0]
+    return upcoming_bookings().\
+        filter(equipment=obj).\
+        order_by('start_time').first()
 
 
 def find_last_service(obj):
@@ -44,6 +66,105 @@ def find_last_service(obj):
     return Service.objects.filter(equipment=obj).order_by('-date').first()
 
 
+def lock_equipment(equipment_id):
+    """Row-lock an instrument until the current transaction ends.
+    Bookings on other instruments are not blocked. SQLite has no row
+    locks; there the scheduling.db_backend backend already holds the
+    database write lock from the start of the transaction, the no-op write
+    keeps that true on the stock backend once it succeeds, and the overlap
+    trigger remains the final guard.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return
+    if connection.features.has_select_for_update:
+        list(Equipment.objects.select_for_update().
+             filter(id=equipment_id).values_list('id', flat=True))
+    else:
+        Equipment.objects.filter(id=equipment_id).update(id=models.F('id'))
+
+
+def next_recurring_start(equipment_id, after):
+    """Earliest upcoming occurrence of any standing booking"""
+    starts = [occurrence.start_time
+              for occurrence in [rule.next_occurrence(after) for rule in
+                                 RecurringBooking.objects.filter(
+                                     equipment_id=equipment_id,
+                                     status__in=['A', 'H']).
+                                 filter(models.Q(until__isnull=True) |
+                                        models.Q(until__gte=after))]
+              if occurrence is not None]
+    return min(starts) if starts else None
+
+
+def earliest(*values):
+    """Smallest of the given datetimes, ignoring None"""
+    values = [value for value in values if value is not None]
+    return min(values) if values else None
+
+
+def refresh_equipment_summary(equipment_id):
+    """Recompute the denormalized booking/service columns for equipment"""
+    next_booking = earliest(
+        upcoming_bookings().
+        filter(equipment_id=equipment_id).
+        aggregate(start=Min('start_time'))['start'],
+        next_recurring_start(equipment_id, timezone.now()))
+    last_service = Service.objects.\
+        filter(equipment_id=equipment_id).\
+        aggregate(date=Max('date'))['date']
+    # update() so neither Equipment.modified nor save signals are touched
+    Equipment.objects.filter(id=equipment_id).update(
+        next_booking_start=next_booking,
+        last_service_date=last_service)
+    equipment_summary_changed.send(sender=Equipment,
+                                   equipment_id=equipment_id)
+
+
+def refresh_passed_summaries():
+    """Refresh equipment whose next booking has already started.
+    Returns the number of equipment rows refreshed.
+    """
+    equipment_ids = list(Equipment.objects.filter(
+        next_booking_start__lt=timezone.now()).values_list('id', flat=True))
+    for equipment_id in equipment_ids:
+        refresh_equipment_summary(equipment_id)
+    return len(equipment_ids)
+
+
+def recompute_equipment_summaries():
+    """Rebuild the denormalized columns for all equipment in bulk.
+    Returns the number of equipment rows that had drifted.
+    """
+    next_bookings = dict(upcoming_bookings().
+                         values_list('equipment').
+                         annotate(start=Min('start_time')))
+    last_services = dict(Service.objects.
+                         values_list('equipment').
+                         annotate(date=Max('date')))
+    recurring = set(RecurringBooking.objects.
+                    filter(status__in=['A', 'H']).
+                    values_list('equipment_id', flat=True))
+    now = timezone.now()
+    drifted = 0
+    for equipment_id, next_booking, last_service in Equipment.objects.\
+            values_list('id', 'next_booking_start', 'last_service_date'):
+        expected = (next_bookings.get(equipment_id),
+                    last_services.get(equipment_id))
+        if equipment_id in recurring:
+            expected = (earliest(expected[0],
+                                 next_recurring_start(equipment_id, now)),
+                        expected[1])
+        if (next_booking, last_service) != expected:
+            Equipment.objects.filter(id=equipment_id).update(
+                next_booking_start=expected[0],
+                last_service_date=expected[1])
+            equipment_summary_changed.send(sender=Equipment,
+                                           equipment_id=equipment_id)
+            drifted += 1
+    return drifted
+
+
 class Information(models.Model):
     """Informational bits for page display"""
     user = models.ForeignKey(User,
@@ -101,7 +222,8 @@ class Model(models.Model):
 class Equipment(models.Model):
     """Available Equipment for Scheduling"""
     name = models.CharField("Equipment",
-                            max_length=40)
+                            max_length=40,
+                            db_index=True)
     admin = models.ForeignKey(User,
                               related_name="equipment_admin",
                               limit_choices_to={
@@ -124,10 +246,19 @@ class Equipment(models.Model):
                                     auto_now=True)
     status = models.BooleanField("Running",
                                  default=True)
+    # Denormalized from Event and Service, see refresh_equipment_summary
+    next_booking_start = models.DateTimeField("Next booking",
+                                              editable=False,
+                                              blank=True,
+                                              null=True)
+    last_service_date = models.DateTimeField("Last service",
+                                             editable=False,
+                                             blank=True,
+                                             null=True)
 
     @property
     def last_service(self):
-        """Identify last service date"""
+        """Identify last service record"""
         return find_last_service(self)
 
     @property
@@ -140,6 +271,16 @@ class Equipment(models.Model):
         """Rip down next booking for this instrument"""
         return find_next_booking(self)
 
+    @property
+    def upcoming_booking_start(self):
+        """next_booking_start while it is still ahead.
+        A booking that has started stays in the column until expire_events
+        refreshes it."""
+        if self.next_booking_start and \
+                self.next_booking_start > timezone.now():
+            return self.next_booking_start
+        return None
+
     def get_fields(self):
         """Generate field names and values for templates"""
         return get_model_fields(self)
@@ -225,7 +366,7 @@ class Message(models.Model):
     @property
     def get_admin_url(self):
         """Generate admin URL"""
-        return '/scheduling/messages/#msg-{}'.format(self.id)
+        return '/scheduling/messages/?at={0}#msg-{0}'.format(self.id)
 
     @property
     def get_absolute_full_url(self):
@@ -243,6 +384,14 @@ class Message(models.Model):
         return " | ".join(tags)
     get_tags.short_description = "Tags"
 
+    class Meta:
+        """Override some things"""
+        # Keyset pages of the message board, overall and per instrument
+        index_together = [
+            ["created", "id"],
+            ["equipment", "created", "id"],
+        ]
+
 
 class Tag(models.Model):
     """Tags to associate posts with"""
@@ -382,7 +531,89 @@ class Comment(models.Model):
         return get_model_fields(self)
 
 
-class Event(models.Model):
+class BookingDisplay(object):
+    """Display helpers shared by events, recurring occurrences and
+    EventRow projections"""
+    __slots__ = ()
+
+    @property
+    def user_name(self):
+        """Username of the booking's user"""
+        return self.user.username
+
+    @property
+    def user_email(self):
+        """Email of the booking's user"""
+        return self.user.email
+
+    @property
+    def equipment_name(self):
+        """Name of the booked equipment"""
+        return self.equipment.name
+
+    @property
+    def start_timestring_time(self):
+        """Start time only to string"""
+        return self.start_time.time().strftime("%I:%M%p")
+
+    @property
+    def end_timestring_time(self):
+        """End time only to string"""
+        return self.end_time.time().strftime("%I:%M%p")
+
+    @property
+    def start_timestring(self):
+        """Start time to string"""
+        return str(self.start_time)
+
+    @property
+    def end_timestring(self):
+        """End time to string"""
+        return str(self.end_time)
+
+    @property
+    def get_absolute_full_url(self):
+        """Compile a full, absolute URL"""
+        domain = Site.objects.get_current().domain.rstrip('/')
+        return 'http://{}{}'.format(domain, self.get_admin_url)
+
+    @property
+    def start_timestamp(self):
+        """Generate start timestamp in ms"""
+        return to_timestamp(self.start_time)
+
+    @property
+    def end_timestamp(self):
+        """Generate end timestamp in ms"""
+        return to_timestamp(self.end_time)
+
+    def get_notes(self):
+        """Generate a shortened notes view"""
+        if self.notes:
+            return "{note}{ending}".format(note=self.notes[:25],
+                                           ending="..." if len(self.notes) > 25 else "")
+        return None
+
+    @property
+    def current_status(self):
+        """Stringify display name of current status"""
+        return self.get_status_display()
+
+    @property
+    def hover_text(self):
+        """Generate descriptive text for html viewing"""
+        attrs = ['Start: {0.start_timestring_time}',
+                 'End: {0.end_timestring_time}',
+                 'User: {0.user_name}',
+                 'Expired: {0.expired}',
+                 'Status: {0.current_status}',
+                 'Equipment: {0.equipment_name}',
+                 'Disassemble: {0.disassemble}',
+                 'Notes: {1}']
+        return ' &#10; '.join(attrs).format(self, self.get_notes())
+
+
+class Event(BookingDisplay, models.Model):
     """Equipment Scheduling Event"""
 
     def __init__(self, *args, **kwargs):
@@ -422,6 +653,18 @@ class Event(models.Model):
                                    blank=True)
     expired = models.BooleanField("Expired",
                                   default=False)
+    # Put on hold when the equipment went offline, see hold_offline_bookings
+    offline_hold = models.BooleanField("Held while offline",
+                                       default=False,
+                                       editable=False)
+    # Start and end in seconds since the Unix epoch, kept in step by save()
+    # and by event_epochs for loaddata, for range filters and the JSON
+    # feeds. No default: bulk_create() fails rather than storing 0, and
+    # update() of start_time or end_time must set them too.
+    start_epoch = models.BigIntegerField("Start epoch",
+                                         editable=False)
+    end_epoch = models.BigIntegerField("End epoch",
+                                       editable=False)
 
     def upcoming(self):
         """Event is still in the future"""
@@ -430,54 +673,11 @@ class Event(models.Model):
         return False
     upcoming.boolean = True
 
-    @property
-    def start_timestring_time(self):
-        """Start time only to string"""
-        return self.start_time.time().strftime("%I:%M%p")
-
-    @property
-    def end_timestring_time(self):
-        """End time only to string"""
-        return self.end_time.time().strftime("%I:%M%p")
-
-    @property
-    def start_timestring(self):
-        """Start time to string"""
-        return str(self.start_time)
-
-    @property
-    def end_timestring(self):
-        """End time to string"""
-        return str(self.end_time)
-
     @property
     def get_admin_url(self):
         """Generate admin URL"""
         return '/admin/scheduling/event/{}/change/'.format(self.id)
 
-    @property
-    def get_absolute_full_url(self):
-        """Compile a full, absolute URL"""
-        domain = Site.objects.get_current().domain.rstrip('/')
-        return 'http://{}{}'.format(domain, self.get_admin_url)
-
-    @property
-    def start_timestamp(self):
-        """Generate start timestamp in ms"""
-        return '{0}'.format(int(mktime(self.start_time.timetuple()))*1000)
-
-    @property
-    def end_timestamp(self):
-        """Generate end timestamp in ms"""
-        return '{0}'.format(int(mktime(self.end_time.timetuple()))*1000)
-
-    def get_notes(self):
-        """Generate a shortened notes view"""
-        if self.notes:
-            return "{note}{ending}".format(note=self.notes[:25],
-                                           ending="..." if len(self.notes) > 25 else "")
-        return None
-
     def get_absolute_url(self):
         """Generate the absolute URL for this object"""
         # Using the admin change form for this
@@ -500,42 +700,49 @@ class Event(models.Model):
         if (any([self.maintenance, self.service])
                 and (not all([self.maintenance, self.service]))):
             raise ValidationError('Maintenance must be attached with a service.')
-        overlaps = self.__class__._default_manager.filter(
+        lock_equipment(self.equipment_id)
+        if self.maintenance:
+            # Overlapped bookings are cancelled as the event is saved,
+            # see scheduling.booking.clear_for_maintenance
+            return
+        if self.overlapping_bookings().exists():
+            raise ValidationError('Overlaps with existing booking.')
+        if self.status in ['A', 'H'] and not self.expired:
+            for rule in RecurringBooking.objects.active_between(
+                    self.equipment_id, self.start_time, self.end_time):
+                if rule.occurrences(self.start_time, self.end_time):
+                    raise ValidationError(
+                        'Overlaps with recurring booking {}.'.format(rule))
+
+    def overlapping_bookings(self):
+        """Active or held bookings that collide with this one"""
+        return self.__class__._default_manager.filter(
             end_time__gte=self.start_time,
             start_time__lte=self.end_time,
             status__in=['A', 'H'],
             expired=False,
-            equipment=self.equipment).exclude(id=self.id)
-        if overlaps.count() > 0:
-            if self.maintenance is False:
-                raise ValidationError('Overlaps with existing booking.')
-            else:
-                for obj in overlaps:
-                    obj.status = 'C'
-                    obj.save()
-                    maintenance_cancellation(obj)
-
-    def save(self, *args, **kwargs):
-        """Tweak save routine to run stuff"""
-        super(Event, self).save(*args, **kwargs)
+            equipment_id=self.equipment_id).exclude(id=self.id)
 
     @property
-    def current_status(self):
-        """Stringify display name of current status"""
-        return self.get_status_display()
+    def start_timestamp(self):
+        """Start timestamp in ms, from the stored epoch"""
+        return epoch_timestamp(self.start_epoch)
 
     @property
-    def hover_text(self):
-        """Generate descriptive text for html viewing"""
-        attrs = ['Start: {0.start_timestring_time}',
-                 'End: {0.end_timestring_time}',
-                 'User: {0.user.username}',
-                 'Expired: {0.expired}',
-                 'Status: {0.current_status}',
-                 'Equipment: {0.equipment.name}',
-                 'Disassemble: {0.disassemble}',
-                 'Notes: {1}']
-        return ' &#10; '.join(attrs).format(self, self.get_notes())
+    def end_timestamp(self):
+        """End timestamp in ms, from the stored epoch"""
+        return epoch_timestamp(self.end_epoch)
+
+    def save(self, *args, **kwargs):
+        """Tweak save routine to run stuff"""
+        self.start_epoch = to_epoch(self.start_time)
+        self.end_epoch = to_epoch(self.end_time)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and \
+                {'start_time', 'end_time'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | \
+                {'start_epoch', 'end_epoch'}
+        super(Event, self).save(*args, **kwargs)
 
     def get_fields(self):
         """Generate field names and values for templates"""
@@ -549,6 +756,402 @@ class Event(models.Model):
     class Meta:
         """Override some things"""
         ordering = ["-start_time"]
+        # Composite indexes for the hot scheduling filters:
+        #  - month calendars by equipment and start range
+        #  - next booking and overlap checks on unexpired events
+        #  - expire_events and morning_reminders sweeps
+        #  - per-user admin changelist
+        #  - keyset pages of the full admin changelist
+        #  - calendar and free time windows by equipment and epoch range
+        index_together = [
+            ["equipment", "start_time"],
+            ["equipment", "expired", "start_time"],
+            ["expired", "end_time"],
+            ["expired", "start_time"],
+            ["user", "start_time"],
+            ["start_time", "id"],
+            ["equipment", "start_epoch", "end_epoch"],
+        ]
+
+
+class RecurringBookingManager(models.Manager):
+    """Queries over standing bookings"""
+
+    def between(self, start, end):
+        """Rules on any instrument whose date range touches an interval"""
+        return self.filter(status__in=['A', 'H'],
+                           start_time__lte=end).\
+            filter(models.Q(until__isnull=True) | models.Q(until__gte=start))
+
+    def active_between(self, equipment_id, start, end):
+        """Rules on an instrument whose date range touches an interval"""
+        return self.between(start, end).filter(equipment_id=equipment_id)
+
+
+class RecurringBooking(models.Model):
+    """Standing booking stored once as a repeat rule.
+    Occurrences are expanded only for the window a view asks for.
+    """
+    user = models.ForeignKey(User,
+                             editable=False,
+                             related_name='recurring_bookings')
+    equipment = models.ForeignKey(Equipment,
+                                  related_name='recurring_bookings')
+    start_time = models.DateTimeField("First start",
+                                      help_text="24hr format, e.g. 15:00")
+    end_time = models.DateTimeField("First end",
+                                    help_text="24hr format, e.g. 20:00")
+    frequency = models.CharField(choices=FREQUENCY,
+                                 max_length=1,
+                                 default="W")
+    interval = models.PositiveSmallIntegerField("Every",
+                                                default=1,
+                                                help_text="Repeat every N days/weeks")
+    until = models.DateTimeField("Until",
+                                 blank=True,
+                                 null=True)
+    count = models.PositiveIntegerField("Occurrences",
+                                        blank=True,
+                                        null=True,
+                                        help_text="Stop after this many, blank for no limit")
+    status = models.CharField(choices=STATUS,
+                              max_length=1,
+                              default="A")
+    notes = models.TextField("Notes",
+                             blank=True,
+                             null=True)
+    disassemble = models.BooleanField("Can disassemble",
+                                      default=True)
+    created = models.DateTimeField("Created",
+                                   editable=False,
+                                   auto_now_add=True)
+    modified = models.DateTimeField("Modified",
+                                    auto_now=True,
+                                    editable=False)
+
+    objects = RecurringBookingManager()
+
+    @property
+    def period_days(self):
+        """Days between occurrences"""
+        return self.interval * (7 if self.frequency == "W" else 1)
+
+    @property
+    def recurrence(self):
+        """Occurrence arithmetic for this rule"""
+        return Recurrence(self.start_time, self.end_time, self.period_days,
+                          until=self.until, count=self.count)
+
+    def skipped_starts(self, start, end):
+        """Starts of excepted occurrences within a window"""
+        return set(self.exceptions.filter(
+            occurrence_start__gte=start - (self.end_time - self.start_time),
+            occurrence_start__lte=end).
+            values_list('occurrence_start', flat=True))
+
+    def occurrences(self, start, end):
+        """Expand the occurrences touching a window"""
+        if self.status not in ['A', 'H']:
+            return []
+        skip = None
+        result = []
+        for index, occ_start, occ_end in self.recurrence.between(start, end):
+            if skip is None:
+                skip = self.skipped_starts(start, end)
+            if occ_start not in skip:
+                result.append(Occurrence(self, index, occ_start, occ_end))
+        return result
+
+    def next_occurrence(self, after):
+        """First occurrence starting at or after a time"""
+        window_start = max(after, self.start_time)
+        window_end = window_start + timedelta(days=self.period_days)
+        for occurrence in self.occurrences(window_start, window_end):
+            if occurrence.start_time >= after:
+                return occurrence
+        return None
+
+    def skip(self, occurrence_start, reason=None):
+        """Cancel a single occurrence"""
+        return RecurrenceException.objects.get_or_create(
+            booking=self,
+            occurrence_start=occurrence_start,
+            defaults={'reason': reason})[0]
+
+    def clean(self, *args, **kwargs):
+        """Validate the rule against bookings and other rules"""
+        super(RecurringBooking, self).clean(*args, **kwargs)
+        if not self.equipment.status:
+            raise ValidationError('{} is offline.'.format(
+                self.equipment.name))
+        if self.end_time <= self.start_time:
+            raise ValidationError('End time must be later than start.')
+        if self.end_time - self.start_time >= timedelta(days=self.period_days):
+            raise ValidationError('Each occurrence must be shorter than the repeat period.')
+        if not self.id and self.start_time < timezone.now():
+            raise ValidationError('Cannot retroactively schedule a booking.')
+        if self.until is not None and self.until < self.start_time:
+            raise ValidationError('Until must be after the first start.')
+        if self.status not in ['A', 'H']:
+            return
+        lock_equipment(self.equipment_id)
+        recurrence = self.recurrence
+        events = Event.objects.filter(
+            equipment_id=self.equipment_id,
+            status__in=['A', 'H'],
+            expired=False,
+            end_time__gte=max(self.start_time, timezone.now()))
+        if self.until is not None:
+            events = events.filter(start_time__lte=self.until + (self.end_time - self.start_time))
+        for start, end in events.values_list('start_time', 'end_time'):
+            if recurrence.collides(start, end):
+                raise ValidationError('Overlaps with existing booking at {}.'.format(start))
+        rules = self.__class__.objects.filter(
+            equipment_id=self.equipment_id,
+            status__in=['A', 'H']).exclude(id=self.id)
+        for rule in rules:
+            if recurrence.collides_with(rule.recurrence):
+                raise ValidationError('Overlaps with recurring booking {}.'.format(rule))
+
+    @property
+    def get_admin_url(self):
+        """Generate admin URL"""
+        return '/admin/scheduling/recurringbooking/{}/change/'.format(self.id)
+
+    def get_absolute_url(self):
+        """Generate the absolute URL for this object"""
+        return reverse('admin:scheduling_recurringbooking_change', args=(self.id,))
+
+    def __unicode__(self):
+        """Unicode return"""
+        return '{} - {} every {} {}'.format(
+            self.user.username,
+            self.start_time,
+            self.interval,
+            'week(s)' if self.frequency == "W" else 'day(s)')
+
+    class Meta:
+        """Override some things"""
+        ordering = ["-start_time"]
+        index_together = [
+            ["equipment", "status", "start_time"],
+        ]
+
+
+class RecurrenceException(models.Model):
+    """Cancelled occurrence of a recurring booking"""
+    booking = models.ForeignKey(RecurringBooking,
+                                related_name='exceptions')
+    occurrence_start = models.DateTimeField("Occurrence start")
+    reason = models.CharField("Reason",
+                              max_length=100,
+                              blank=True,
+                              null=True)
+
+    def __unicode__(self):
+        """Unicode return"""
+        return '{} - skip {}'.format(self.booking_id, self.occurrence_start)
+
+    class Meta:
+        """Override some things"""
+        unique_together = ["booking", "occurrence_start"]
+
+
+class Occurrence(BookingDisplay):
+    """A single expanded occurrence of a RecurringBooking, read-only.
+    Quacks like an Event for calendars, the JSON feed and mails.
+    """
+    maintenance = False
+    service = None
+
+    def __init__(self, rule, index, start_time, end_time):
+        self.rule = rule
+        self.index = index
+        self.start_time = start_time
+        self.end_time = end_time
+        self.user = rule.user
+        self.equipment = rule.equipment
+        self.status = rule.status
+        self.notes = rule.notes
+        self.disassemble = rule.disassemble
+
+    @property
+    def pk(self):
+        """Stable identifier for the feed"""
+        return 'r{}-{}'.format(self.rule.pk, self.index)
+
+    @property
+    def expired(self):
+        """Occurrences expire as soon as they end"""
+        return self.end_time < timezone.now()
+
+    @property
+    def get_admin_url(self):
+        """Generate admin URL"""
+        return self.rule.get_admin_url
+
+    def get_absolute_url(self):
+        """Generate the absolute URL for this object"""
+        return self.rule.get_absolute_url()
+
+    def get_status_display(self):
+        """Display name of the rule status"""
+        return dict(STATUS)[self.status]
+
+    def __str__(self):
+        """String return"""
+        return '{} - {}'.format(self.user.username,
+                                self.start_timestring)
+
+
+class EventRow(BookingDisplay):
+    """Read-only projection of an Event built from a values_list() row.
+    Calendars, feeds and reminders read a few columns of many events;
+    a slotted row skips model instantiation and the user and equipment
+    instances, which are joined into the same query instead. Change
+    mails and the admin compare against the orig_start and orig_end set
+    by Event.__init__, so they keep loading Events.
+    """
+    FIELDS = ('id', 'start_time', 'end_time', 'start_epoch', 'end_epoch',
+              'status', 'expired', 'maintenance', 'disassemble', 'notes',
+              'equipment_id', 'equipment__name', 'user__username',
+              'user__email')
+    __slots__ = ('pk', 'start_time', 'end_time', 'start_epoch', 'end_epoch',
+                 'status', 'expired', 'maintenance', 'disassemble', 'notes',
+                 'equipment_id', 'equipment_name', 'user_name', 'user_email')
+    STATUS_NAMES = dict(STATUS)
+
+    def __init__(self, pk, start_time, end_time, start_epoch, end_epoch,
+                 status, expired, maintenance, disassemble, notes,
+                 equipment_id, equipment_name, user_name, user_email):
+        self.pk = pk
+        self.start_time = start_time
+        self.end_time = end_time
+        self.start_epoch = start_epoch
+        self.end_epoch = end_epoch
+        self.status = status
+        self.expired = expired
+        self.maintenance = maintenance
+        self.disassemble = disassemble
+        self.notes = notes
+        self.equipment_id = equipment_id
+        self.equipment_name = equipment_name
+        self.user_name = user_name
+        self.user_email = user_email
+
+    @classmethod
+    def rows(cls, queryset):
+        """Projections of every event in a queryset, in one query"""
+        return [cls(*values) for values in queryset.values_list(*cls.FIELDS)]
+
+    @property
+    def id(self):
+        """Event id"""
+        return self.pk
+
+    @property
+    def start_timestamp(self):
+        """Start timestamp in ms, from the stored epoch"""
+        return epoch_timestamp(self.start_epoch)
+
+    @property
+    def end_timestamp(self):
+        """End timestamp in ms, from the stored epoch"""
+        return epoch_timestamp(self.end_epoch)
+
+    def get_status_display(self):
+        """Display name of the status"""
+        return self.STATUS_NAMES.get(self.status, self.status)
+
+    @property
+    def get_admin_url(self):
+        """Generate admin URL"""
+        return '/admin/scheduling/event/{}/change/'.format(self.pk)
+
+    def get_absolute_url(self):
+        """Generate the absolute URL for this object"""
+        return self.get_admin_url
+
+    def __unicode__(self):
+        """Unicode return"""
+        return '{} - {}'.format(self.user_name, self.start_timestring)
+
+
+def expand_occurrences(equipment, start, end):
+    """Occurrences of all standing bookings on an instrument in a window"""
+    occurrences = []
+    for rule in RecurringBooking.objects.active_between(
+            equipment.id, start, end).select_related('user', 'equipment'):
+        occurrences.extend(rule.occurrences(start, end))
+    return occurrences
+
+
+class EventDelta(models.Model):
+    """A booking change for the live calendar feeds.
+    Rows are written in the same transaction as the booking, so every
+    worker process sees them, and are pruned by expire_events.
+    """
+    equipment = models.ForeignKey(Equipment,
+                                  related_name='deltas')
+    booking = models.CharField("Booking",
+                               max_length=20)
+    action = models.CharField(choices=DELTA_ACTIONS,
+                              max_length=9)
+    payload = models.TextField("Payload")
+    created = models.DateTimeField("Created",
+                                   auto_now_add=True)
+
+    def as_sse(self):
+        """Server-sent event frame"""
+        return 'id: {}\nevent: {}\ndata: {}\n\n'.format(self.id,
+                                                         self.action,
+                                                         self.payload)
+
+    def __unicode__(self):
+        """Unicode return"""
+        return '{} {} {}'.format(self.equipment_id, self.action, self.booking)
+
+    class Meta:
+        """Override some things"""
+        index_together = [
+            ["equipment", "id"],
+        ]
+
+
+def event_delta(event, action):
+    """Unsaved delta describing an event for live feeds"""
+    entry = schedule_entry(event)
+    entry["action"] = action
+    return EventDelta(equipment_id=event.equipment_id,
+                      booking=str(event.pk),
+                      action=action,
+                      payload=json.dumps(entry, separators=(',', ':')))
+
+
+def record_event_delta(event, action):
+    """Queue a delta describing an event for live feeds"""
+    event_delta(event, action).save()
+
+
+def record_event_deltas(events, action):
+    """Queue deltas for many events in one INSERT"""
+    EventDelta.objects.bulk_create([event_delta(event, action)
+                                    for event in events])
+
+
+def record_rule_delta(rule):
+    """Queue a delta for a changed standing booking.
+    Its occurrences are not listed; 'changed' makes every open calendar
+    of the instrument redraw whatever month it shows."""
+    entry = {"id": 'r{}'.format(rule.pk),
+             "status": rule.status,
+             "start": to_timestamp(rule.start_time),
+             "end": to_timestamp(rule.end_time),
+             "action": 'changed'}
+    EventDelta.objects.create(equipment_id=rule.equipment_id,
+                              booking=entry["id"],
+                              action='changed',
+                              payload=json.dumps(entry, separators=(',', ':')))
 
 
 def email_new_user(sender, **kwargs):
@@ -562,4 +1165,65 @@ def email_new_user(sender, **kwargs):
                   subject_template_name="scheduling/password_reset_subject.txt",
                   email_template_name="scheduling/password_reset_email.html")
 
-post_save.connect(email_new_user, sender=User)
\ No newline at end of file
+
+def update_equipment_summary(sender, **kwargs):
+    """Keep the equipment booking/service columns current"""
+    refresh_equipment_summary(kwargs["instance"].equipment_id)
+
+
+def update_equipment_summary_exception(sender, **kwargs):
+    """Skipped occurrences can move the next booking"""
+    refresh_equipment_summary(kwargs["instance"].booking.equipment_id)
+
+
+def event_epochs(sender, **kwargs):
+    """Fill the epoch columns of events loaded from fixtures, which are
+    saved raw, bypassing Event.save()"""
+    if kwargs["raw"]:
+        event = kwargs["instance"]
+        event.start_epoch = to_epoch(event.start_time)
+        event.end_epoch = to_epoch(event.end_time)
+
+
+def event_saved_delta(sender, **kwargs):
+    """Push saved events to live calendars"""
+    event = kwargs["instance"]
+    if event.status == 'C':
+        action = 'cancelled'
+    else:
+        action = 'created' if kwargs["created"] else 'changed'
+    record_event_delta(event, action)
+
+
+def event_deleted_delta(sender, **kwargs):
+    """Push deleted events to live calendars as cancellations"""
+    record_event_delta(kwargs["instance"], 'cancelled')
+
+
+def rule_changed_delta(sender, **kwargs):
+    """Push standing booking edits to live calendars"""
+    record_rule_delta(kwargs["instance"])
+
+
+def rule_exception_delta(sender, **kwargs):
+    """Push skipped or restored occurrences to live calendars"""
+    record_rule_delta(kwargs["instance"].booking)
+
+post_save.connect(email_new_user, sender=User)
+post_save.connect(update_equipment_summary, sender=Event)
+post_delete.connect(update_equipment_summary, sender=Event)
+post_save.connect(update_equipment_summary, sender=Service)
+post_delete.connect(update_equipment_summary, sender=Service)
+post_save.connect(update_equipment_summary, sender=RecurringBooking)
+post_delete.connect(update_equipment_summary, sender=RecurringBooking)
+post_save.connect(update_equipment_summary_exception,
+                  sender=RecurrenceException)
+post_delete.connect(update_equipment_summary_exception,
+                    sender=RecurrenceException)
+pre_save.connect(event_epochs, sender=Event)
+post_save.connect(event_saved_delta, sender=Event)
+post_delete.connect(event_deleted_delta, sender=Event)
+post_save.connect(rule_changed_delta, sender=RecurringBooking)
+post_delete.connect(rule_changed_delta, sender=RecurringBooking)
+post_save.connect(rule_exception_delta, sender=RecurrenceException)
+post_delete.connect(rule_exception_delta, sender=RecurrenceException)
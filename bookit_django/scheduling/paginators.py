@@ -0,0 +1,165 @@
+import hashlib
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q, Max, Min
+from django.utils import six
+from .caching import get_cache
+
+COUNT_KEY = 'bookit:count:{}'
+BOUNDARY_KEY = 'bookit:boundary:{}:{}:{}'
+
+
+def estimated_rows(model, using):
+	"""Rough row count of a model's table without scanning it"""
+	connection = connections[using]
+	table = model._meta.db_table
+	with connection.cursor() as cursor:
+		if connection.vendor == 'postgresql':
+			cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+						   [table])
+			row = cursor.fetchone()
+			return int(row[0]) if row else 0
+		if connection.vendor == 'mysql':
+			cursor.execute('SELECT table_rows FROM information_schema.tables '
+						   'WHERE table_schema = DATABASE() AND table_name = %s',
+						   [table])
+			row = cursor.fetchone()
+			return int(row[0] or 0) if row else 0
+	# Span of the primary key, both ends are read from the index
+	span = model._default_manager.using(using).aggregate(
+		low=Min('pk'), high=Max('pk'))
+	if span['low'] is None:
+		return 0
+	return span['high'] - span['low'] + 1
+
+
+def query_key(queryset):
+	"""Digest of a queryset's SQL, for caching facts about its results"""
+	sql, params = queryset.query.sql_with_params()
+	return hashlib.md5(repr((queryset.db, sql, params)).encode('utf8')).\
+		hexdigest()
+
+
+class LargeTablePaginator(Paginator):
+	"""Admin changelist paginator for tables too big to count or skip.
+
+	Below BOOKIT_ADMIN_COUNT_THRESHOLD rows this behaves as the stock
+	paginator. Above it the unfiltered count is estimated and filtered
+	counts are cached for BOOKIT_ADMIN_COUNT_TIMEOUT seconds. Pages after
+	the first seek past the last sort key of the page before, which is
+	cached when that page is shown, instead of using OFFSET.
+	"""
+
+	def __init__(self, object_list, per_page, orphans=0,
+				 allow_empty_first_page=True):
+		super(LargeTablePaginator, self).__init__(object_list, per_page,
+												  orphans,
+												  allow_empty_first_page)
+		self.threshold = getattr(settings, 'BOOKIT_ADMIN_COUNT_THRESHOLD',
+								 10000)
+		self.timeout = getattr(settings, 'BOOKIT_ADMIN_COUNT_TIMEOUT', 300)
+		self.key_fields = self.seek_fields()
+		self._query_key = None
+
+	@property
+	def query_key(self):
+		if self._query_key is None:
+			self._query_key = query_key(self.object_list)
+		return self._query_key
+
+	def _get_count(self):
+		if self._count is None:
+			self._count = self.large_count()
+		return self._count
+	count = property(_get_count)
+
+	def large_count(self):
+		"""Exact count on small tables, estimated or cached on large ones"""
+		queryset = self.object_list
+		estimate = estimated_rows(queryset.model, queryset.db)
+		if estimate < self.threshold:
+			return queryset.count()
+		if not queryset.query.where:
+			return estimate
+		backend = get_cache()
+		key = COUNT_KEY.format(self.query_key)
+		count = backend.get(key)
+		if count is None:
+			count = queryset.count()
+			backend.set(key, count, self.timeout)
+		return count
+
+	def seek_fields(self):
+		"""(name, descending) of each ordering field, or None when the
+		ordering cannot be sought on (relations, annotations, nullable)
+		"""
+		query = self.object_list.query
+		ordering = list(query.order_by or query.get_meta().ordering)
+		if not ordering or query.extra_order_by or query.distinct:
+			return None
+		meta = self.object_list.model._meta
+		fields = []
+		for name in ordering:
+			if (not isinstance(name, six.string_types) or '__' in name or
+					name == '?'):
+				return None
+			descending = name.startswith('-')
+			name = name.lstrip('-')
+			if name == 'pk':
+				name = meta.pk.name
+			try:
+				field = meta.get_field(name)
+			except FieldDoesNotExist:
+				return None
+			if not field.concrete or field.is_relation or field.null:
+				return None
+			fields.append((name, descending))
+		if meta.pk.name not in [name for name, _ in fields]:
+			# Without a unique tiebreaker seeking could skip rows
+			return None
+		return fields
+
+	def after(self, boundary):
+		"""Rows that sort after a boundary key"""
+		condition = Q()
+		equal = dict()
+		for (name, descending), value in zip(self.key_fields, boundary):
+			lookup = '{}__{}'.format(name, 'lt' if descending else 'gt')
+			condition |= Q(**dict(equal, **{lookup: value}))
+			equal[name] = value
+		return self.object_list.filter(condition)
+
+	def boundary(self, number):
+		"""Sort key of the last row on a page"""
+		key = BOUNDARY_KEY.format(self.query_key, self.per_page, number)
+		value = get_cache().get(key)
+		if value is None:
+			# OFFSET over the sort key alone is still cheaper than whole rows
+			names = [name for name, _ in self.key_fields]
+			rows = self.object_list.values_list(*names)[
+				number * self.per_page - 1:number * self.per_page]
+			value = tuple(rows[0]) if rows else None
+		return value
+
+	def page(self, number):
+		number = self.validate_number(number)
+		if self.key_fields is None or self.count < self.threshold:
+			return super(LargeTablePaginator, self).page(number)
+		if number == 1:
+			objects = self.object_list
+		else:
+			boundary = self.boundary(number - 1)
+			if boundary is None:
+				objects = self.object_list.none()
+			else:
+				objects = self.after(boundary)
+		objects = list(objects[:self.per_page])
+		if objects:
+			get_cache().set(
+				BOUNDARY_KEY.format(self.query_key, self.per_page, number),
+				tuple(getattr(objects[-1], name)
+					  for name, _ in self.key_fields),
+				self.timeout)
+		return self._get_page(objects, number, self)
@@ -0,0 +1,88 @@
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, pre_delete, post_delete
+from django.utils.functional import cached_property
+from .models import Equipment
+from .utils import is_admin
+
+ACCESS_CACHE_KEY = 'bookit:equipment-access:{}'
+# Access changes always invalidate, the timeout only bounds stale keys
+ACCESS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def equipment_access(user_id):
+	"""Cached set of equipment IDs a user is allowed to book"""
+	key = ACCESS_CACHE_KEY.format(user_id)
+	access = cache.get(key)
+	if access is None:
+		access = frozenset(Equipment.users.through.objects.
+						   filter(user_id=user_id).
+						   values_list('equipment_id', flat=True))
+		cache.set(key, access, ACCESS_CACHE_TIMEOUT)
+	return access
+
+
+def invalidate_equipment_access(user_ids):
+	"""Drop cached access sets after equipment membership changes"""
+	cache.delete_many([ACCESS_CACHE_KEY.format(user_id)
+					   for user_id in user_ids])
+
+
+class PermissionContext(object):
+	"""What the requesting user may do, computed once per request"""
+
+	def __init__(self, user):
+		self.user = user
+
+	@cached_property
+	def is_admin(self):
+		"""Superuser or member of the equipment_admin group"""
+		return is_admin(self.user)
+
+	@cached_property
+	def equipment_ids(self):
+		"""IDs of the equipment the user is allowed to book"""
+		if self.user.pk is None:
+			return frozenset()
+		return equipment_access(self.user.pk)
+
+	def can_book(self, equipment_id):
+		"""Check booking rights on an instrument"""
+		return equipment_id in self.equipment_ids
+
+
+def get_permissions(request):
+	"""Permission context for a request, built on first use"""
+	context = getattr(request, '_bookit_permissions', None)
+	if context is None or context.user is not request.user:
+		context = PermissionContext(request.user)
+		request._bookit_permissions = context
+	return context
+
+
+def equipment_users_changed(sender, instance, action, reverse, pk_set, **kwargs):
+	"""Invalidate access sets when Equipment.users changes"""
+	if action == 'pre_clear':
+		instance._bookit_cleared_users = set(
+			[instance.pk] if reverse else
+			instance.users.values_list('id', flat=True))
+	elif action == 'post_clear':
+		invalidate_equipment_access(
+			getattr(instance, '_bookit_cleared_users', ()))
+	elif action in ('post_add', 'post_remove'):
+		invalidate_equipment_access([instance.pk] if reverse else pk_set)
+
+
+def equipment_pre_delete(sender, instance, **kwargs):
+	"""Remember the users of equipment about to be deleted"""
+	instance._bookit_cleared_users = list(
+		instance.users.values_list('id', flat=True))
+
+
+def equipment_post_delete(sender, instance, **kwargs):
+	"""Deleting equipment removes its membership rows without m2m signals"""
+	invalidate_equipment_access(
+		getattr(instance, '_bookit_cleared_users', ()))
+
+m2m_changed.connect(equipment_users_changed, sender=Equipment.users.through)
+pre_delete.connect(equipment_pre_delete, sender=Equipment)
+post_delete.connect(equipment_post_delete, sender=Equipment)
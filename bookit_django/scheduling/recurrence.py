@@ -0,0 +1,121 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+
+
+def to_wall_clock(value):
+	"""Naive local form of a stored datetime"""
+	if settings.USE_TZ and timezone.is_aware(value):
+		return timezone.make_naive(value, timezone.get_current_timezone())
+	return value
+
+
+def from_wall_clock(value):
+	"""Stored form of a naive local datetime"""
+	if settings.USE_TZ:
+		return timezone.make_aware(value, timezone.get_current_timezone(),
+								   is_dst=False)
+	return value
+
+
+def gcd(a, b):
+	"""Greatest common divisor"""
+	while b:
+		a, b = b, a % b
+	return a
+
+
+class Recurrence(object):
+	"""Arithmetic over a fixed-period series of equal-length slots.
+
+	Occurrence k starts k periods after the first start on the wall clock,
+	so a weekly 9am slot stays at 9am across DST changes. Nothing is
+	materialized: the occurrences that can touch a window are found by
+	division and only those are built.
+	"""
+
+	def __init__(self, start, end, period_days, until=None, count=None):
+		self.start = start
+		self.duration = end - start
+		self.period = timedelta(days=period_days)
+		self.period_days = period_days
+		self.until = until
+		self.count = count
+		self.local_start = to_wall_clock(start)
+
+	def occurrence(self, index):
+		"""Start and end of occurrence number index"""
+		start = from_wall_clock(self.local_start + self.period * index)
+		return start, start + self.duration
+
+	@property
+	def last_index(self):
+		"""Index of the final occurrence, None when open ended"""
+		last = None
+		if self.count:
+			last = self.count - 1
+		if self.until is not None:
+			by_until = self.steps(self.until - self.start)
+			if by_until < 0:
+				return -1
+			last = by_until if last is None else min(last, by_until)
+		return last
+
+	def steps(self, delta):
+		"""Whole periods in a timedelta, rounded down"""
+		return int(delta.total_seconds() // self.period.total_seconds())
+
+	def index_range(self, window_start, window_end):
+		"""Indices whose occurrences may touch the window.
+		One period of slack on each side absorbs DST shifts.
+		"""
+		first = max(0, self.steps(window_start - self.duration - self.start) - 1)
+		last = self.steps(window_end - self.start) + 1
+		if self.last_index is not None:
+			last = min(last, self.last_index)
+		return range(first, last + 1)
+
+	def between(self, window_start, window_end):
+		"""Yield (index, start, end) for occurrences touching the window.
+		The window is inclusive, matching the Event overlap check.
+		"""
+		for index in self.index_range(window_start, window_end):
+			start, end = self.occurrence(index)
+			if start > window_end:
+				break
+			if self.until is not None and start > self.until:
+				break
+			if end >= window_start:
+				yield index, start, end
+
+	def collides(self, start, end, skip=()):
+		"""Check an interval against the series without expanding it"""
+		for index, occ_start, occ_end in self.between(start, end):
+			if occ_start not in skip:
+				return True
+		return False
+
+	def collides_with(self, other):
+		"""Check two series against each other.
+		Both repeat with the least common multiple of their periods, so
+		only one such cycle of the overlapping date range is compared.
+		"""
+		last_indices = [series.last_index for series in (self, other)]
+		if any(last is not None and last < 0 for last in last_indices):
+			return False
+		window_start = max(self.start, other.start)
+		ends = [series.occurrence(last)[1]
+				for series, last in zip((self, other), last_indices)
+				if last is not None]
+		cycle_days = (self.period_days * other.period_days //
+					  gcd(self.period_days, other.period_days))
+		window_end = window_start + timedelta(days=cycle_days) + \
+			max(self.duration, other.duration)
+		if ends:
+			window_end = min([window_end] + ends)
+		if window_end < window_start:
+			return False
+		for index, start, end in self.between(window_start, window_end):
+			if other.collides(start, end):
+				return True
+		return False
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Cookie holding when a client last wrote, see ReplicaPinMiddleware
+PIN_COOKIE = 'bookit_wrote_at'
+
+_state = threading.local()
+
+
+def replica_alias():
+	"""Alias of the configured read replica, None when there is none"""
+	alias = getattr(settings, 'BOOKIT_REPLICA_DB', 'replica')
+	return alias if alias in settings.DATABASES else None
+
+
+def replica_version_path(name, synced):
+	"""File of a SQLite replica copy taken at a given time"""
+	return '{}.{}'.format(name, int(synced * 1000))
+
+
+def replica_synced_at():
+	"""When the replica's data was read from the primary, or None.
+	Known for SQLite stand-ins, whose file is a symlink to the copy
+	sync_replica made last, named after the time it was taken.
+	"""
+	alias = replica_alias()
+	if alias is None:
+		return None
+	try:
+		version = os.readlink(settings.DATABASES[alias]['NAME'])
+		return int(version.rsplit('.', 1)[1]) / 1000.0
+	except (OSError, KeyError, IndexError, ValueError):
+		return None
+
+
+@contextmanager
+def use_replica():
+	"""Route reads made inside the block to the replica"""
+	previous = getattr(_state, 'use_replica', False)
+	_state.use_replica = True
+	try:
+		yield
+	finally:
+		_state.use_replica = previous
+
+
+@contextmanager
+def use_primary():
+	"""Route reads made inside the block to the primary"""
+	previous = getattr(_state, 'use_replica', False)
+	_state.use_replica = False
+	try:
+		yield
+	finally:
+		_state.use_replica = previous
+
+
+def reading_replica():
+	"""Reads in this thread are currently routed to the replica"""
+	return getattr(_state, 'use_replica', False)
+
+
+def pinned_to_primary(request):
+	"""The client wrote after the replica was copied and must read its
+	own writes from the primary. Without a known copy time the client is
+	pinned for BOOKIT_REPLICA_STICKY_SECONDS after writing."""
+	try:
+		wrote_at = float(request.COOKIES.get(PIN_COOKIE, 0))
+	except ValueError:
+		return False
+	if not wrote_at:
+		return False
+	synced = replica_synced_at()
+	if synced is not None:
+		return wrote_at >= synced
+	return wrote_at + getattr(settings, 'BOOKIT_REPLICA_STICKY_SECONDS',
+							  900) > time.time()
+
+
+def replica_view(view_func):
+	"""Serve a read-only view from the replica unless the client is pinned.
+	Ajax redraws follow live feed deltas, so they read the primary too.
+	"""
+	@wraps(view_func)
+	def wrapper(request, *args, **kwargs):
+		if request.method not in ('GET', 'HEAD') or request.is_ajax() or \
+				pinned_to_primary(request):
+			return view_func(request, *args, **kwargs)
+		with use_replica():
+			return view_func(request, *args, **kwargs)
+	return wrapper
+
+
+class ReplicaRouter(object):
+	"""Send flagged reads to the replica, everything else to the primary"""
+
+	def db_for_read(self, model, **hints):
+		if reading_replica():
+			return replica_alias()
+		return None
+
+	def db_for_write(self, model, **hints):
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints):
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		# The replica is a copy of the primary, never migrated directly
+		return db != replica_alias()
+
+
+class ReplicaPinMiddleware(object):
+	"""Pin a client to the primary after it writes, until the replica has
+	caught up. Anyone who just booked sees their booking even if the
+	replica lags. BOOKIT_REPLICA_STICKY_SECONDS caps how long that lasts.
+	"""
+
+	def process_response(self, request, response):
+		if request.method not in ('GET', 'HEAD', 'OPTIONS') and \
+				response.status_code < 400 and replica_alias():
+			seconds = getattr(settings, 'BOOKIT_REPLICA_STICKY_SECONDS', 900)
+			response.set_cookie(PIN_COOKIE, repr(time.time()),
+								max_age=seconds, httponly=True)
+		return response
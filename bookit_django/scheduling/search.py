@@ -0,0 +1,300 @@
+import re
+from django.db import connections, router, OperationalError
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from .models import Message, Ticket, Comment, Service
+
+SEARCH_TABLE = 'scheduling_search'
+# Row ids pack the kind into the low bits, so an object's row is found
+# through the primary key rather than a scan of unindexed columns
+KINDS = ('message', 'ticket', 'comment', 'service')
+MODELS = dict(zip(KINDS, (Message, Ticket, Comment, Service)))
+HIGHLIGHT = ('\x02', '\x03')
+
+_available = dict()
+
+
+def index_available(connection):
+	"""The FTS5 table exists on this database"""
+	if connection.alias not in _available:
+		_available[connection.alias] = (
+			connection.vendor == 'sqlite' and
+			SEARCH_TABLE in connection.introspection.table_names())
+	return _available[connection.alias]
+
+
+def row_id(kind, object_id):
+	"""FTS row id of an object"""
+	return object_id * len(KINDS) + KINDS.index(kind)
+
+
+def kind_of(instance):
+	"""Search kind of a model instance"""
+	for kind, model in MODELS.items():
+		if isinstance(instance, model):
+			return kind
+
+
+def document(kind, instance):
+	"""Text and equipment id indexed for an object"""
+	if kind == 'service':
+		text = '\n'.join(filter(None, [instance.job, instance.notes]))
+	else:
+		text = instance.msg
+	if kind == 'comment':
+		ticket = first_ticket(instance)
+		equipment_id = ticket.equipment_id if ticket else None
+	else:
+		equipment_id = instance.equipment_id
+	return text, equipment_id
+
+
+def first_ticket(comment):
+	"""Ticket a comment belongs to, using prefetched tickets if present"""
+	tickets = sorted(comment.comments.all(), key=lambda ticket: ticket.pk)
+	return tickets[0] if tickets else None
+
+
+def index_object(kind, instance, connection=None):
+	"""Insert or replace an object's row"""
+	connection = connection or connections[router.db_for_write(MODELS[kind])]
+	if not index_available(connection):
+		return
+	text, equipment_id = document(kind, instance)
+	with connection.cursor() as cursor:
+		cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(SEARCH_TABLE),
+					   [row_id(kind, instance.pk)])
+		cursor.execute('INSERT INTO {} (rowid, body, equipment_id) '
+					   'VALUES (%s, %s, %s)'.format(SEARCH_TABLE),
+					   [row_id(kind, instance.pk), text, equipment_id])
+
+
+def unindex_object(kind, object_id):
+	"""Drop an object's row"""
+	connection = connections[router.db_for_write(MODELS[kind])]
+	if not index_available(connection):
+		return
+	with connection.cursor() as cursor:
+		cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(SEARCH_TABLE),
+					   [row_id(kind, object_id)])
+
+
+def rebuild_index(batch_size=1000):
+	"""Reindex every object, returns counts by kind"""
+	connection = connections[router.db_for_write(Message)]
+	if not index_available(connection):
+		return None
+	comment_equipment = dict()
+	for comment_id, equipment_id in Ticket.comment.through.objects.\
+			order_by('-ticket_id').values_list('comment_id', 'ticket__equipment_id'):
+		# Lowest ticket id wins, as in first_ticket
+		comment_equipment[comment_id] = equipment_id
+	sources = {
+		'message': Message.objects.values_list(
+			'id', 'msg', 'equipment_id').iterator(),
+		'ticket': Ticket.objects.values_list(
+			'id', 'msg', 'equipment_id').iterator(),
+		'comment': ((pk, msg, comment_equipment.get(pk)) for pk, msg in
+					Comment.objects.values_list('id', 'msg').iterator()),
+		'service': ((pk, '\n'.join(filter(None, [job, notes])), equipment_id)
+					for pk, job, notes, equipment_id in Service.objects.
+					values_list('id', 'job', 'notes', 'equipment_id').iterator()),
+	}
+	counts = dict()
+	with connection.cursor() as cursor:
+		cursor.execute('DELETE FROM {}'.format(SEARCH_TABLE))
+		for kind in KINDS:
+			rows = []
+			counts[kind] = 0
+			for pk, text, equipment_id in sources[kind]:
+				rows.append([row_id(kind, pk), text, equipment_id])
+				if len(rows) >= batch_size:
+					insert_rows(cursor, rows)
+					counts[kind] += len(rows)
+					rows = []
+			insert_rows(cursor, rows)
+			counts[kind] += len(rows)
+		cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(
+			SEARCH_TABLE))
+	return counts
+
+
+def insert_rows(cursor, rows):
+	"""Bulk insert index rows"""
+	if rows:
+		cursor.executemany('INSERT INTO {} (rowid, body, equipment_id) '
+						   'VALUES (%s, %s, %s)'.format(SEARCH_TABLE), rows)
+
+
+def match_expression(query):
+	"""FTS5 query matching every word, the last one as a prefix.
+	Words are quoted so user input never reaches the query syntax.
+	"""
+	words = re.findall(r'\w+', query, re.UNICODE)
+	if not words:
+		return None
+	terms = ['"{}"'.format(word) for word in words]
+	terms[-1] += '*'
+	return ' '.join(terms)
+
+
+class SearchResult(object):
+	"""One ranked hit with a highlighted snippet"""
+
+	def __init__(self, kind, instance, snippet):
+		self.kind = kind
+		self.instance = instance
+		self.snippet = snippet
+
+	@property
+	def url(self):
+		"""Where the hit is viewed or edited"""
+		if self.kind == 'comment':
+			ticket = first_ticket(self.instance)
+			return ticket.get_admin_url if ticket else '#'
+		return self.instance.get_admin_url
+
+	@property
+	def date(self):
+		"""When the record was written"""
+		if self.kind == 'service':
+			return self.instance.date
+		return self.instance.created
+
+
+def search(query, equipment_id=None, limit=50, scope=None):
+	"""Ranked results for a query, optionally on one instrument.
+	scope maps the kinds to search to querysets of the records that may
+	be returned, by default every record of every kind.
+	"""
+	if scope is None:
+		scope = dict((kind, model.objects.all())
+					 for kind, model in MODELS.items())
+	if not scope:
+		return []
+	connection = connections[router.db_for_read(Message)]
+	if index_available(connection):
+		return fts_search(connection, query, equipment_id, limit, scope)
+	return scan_search(query, equipment_id, limit, scope)
+
+
+def fts_search(connection, query, equipment_id, limit, scope):
+	"""Search through the FTS5 index, best bm25 rank first.
+	Hits outside the scope are dropped, so further pages of the ranking
+	are read until the limit is reached.
+	"""
+	expression = match_expression(query)
+	if expression is None:
+		return []
+	sql = ("SELECT rowid, snippet({0}, 0, %s, %s, '...', 16) FROM {0} "
+		   "WHERE {0} MATCH %s".format(SEARCH_TABLE))
+	params = list(HIGHLIGHT) + [expression]
+	if len(scope) < len(KINDS):
+		sql += ' AND rowid %% {} IN ({})'.format(
+			len(KINDS), ', '.join(str(KINDS.index(kind)) for kind in scope))
+	if equipment_id is not None:
+		sql += ' AND equipment_id = %s'
+		params.append(equipment_id)
+	sql += ' ORDER BY rank LIMIT %s OFFSET %s'
+	results = []
+	offset = 0
+	while len(results) < limit:
+		try:
+			with connection.cursor() as cursor:
+				cursor.execute(sql, params + [limit, offset])
+				rows = cursor.fetchall()
+		except OperationalError:
+			return []
+		hits = [(KINDS[rowid % len(KINDS)], rowid // len(KINDS), snippet)
+				for rowid, snippet in rows]
+		instances = dict()
+		for kind in scope:
+			ids = [object_id for hit_kind, object_id, _ in hits
+				   if hit_kind == kind]
+			instances[kind] = scope[kind].in_bulk(ids) if ids else {}
+		results.extend(SearchResult(kind, instances[kind][object_id],
+									highlight(snippet))
+					   for kind, object_id, snippet in hits
+					   if object_id in instances[kind])
+		if len(rows) < limit:
+			break
+		offset += limit
+	return results[:limit]
+
+
+def scan_search(query, equipment_id, limit, scope):
+	"""Substring scan used where FTS5 is unavailable, newest first"""
+	words = re.findall(r'\w+', query, re.UNICODE)
+	if not words:
+		return []
+	fields = {'message': ['msg'], 'ticket': ['msg'], 'comment': ['msg'],
+			  'service': ['job', 'notes']}
+	results = []
+	for kind, objects in scope.items():
+		for word in words:
+			condition = Q()
+			for field in fields[kind]:
+				condition |= Q(**{field + '__icontains': word})
+			objects = objects.filter(condition)
+		if equipment_id is not None:
+			if kind == 'comment':
+				objects = objects.filter(comments__equipment_id=equipment_id)
+			else:
+				objects = objects.filter(equipment_id=equipment_id)
+		order = '-date' if kind == 'service' else '-created'
+		for instance in objects.order_by(order)[:limit]:
+			text = document(kind, instance)[0]
+			results.append(SearchResult(kind, instance,
+										scan_snippet(text, words)))
+	results.sort(key=lambda result: result.date, reverse=True)
+	return results[:limit]
+
+
+def scan_snippet(text, words, width=80):
+	"""Window of text around the first matching word, highlighted"""
+	found = re.search('|'.join(re.escape(word) for word in words), text,
+					  re.IGNORECASE | re.UNICODE)
+	start = max(0, found.start() - width // 2) if found else 0
+	excerpt = text[start:start + width]
+	excerpt = re.sub('({})'.format('|'.join(re.escape(word) for word in words)),
+					 HIGHLIGHT[0] + r'\1' + HIGHLIGHT[1], excerpt,
+					 flags=re.IGNORECASE | re.UNICODE)
+	return highlight(('...' if start else '') + excerpt +
+					 ('...' if start + width < len(text) else ''))
+
+
+def highlight(snippet):
+	"""Escape a snippet and turn the match markers into <mark> tags"""
+	return mark_safe(escape(snippet).replace(HIGHLIGHT[0], '<mark>').
+					 replace(HIGHLIGHT[1], '</mark>'))
+
+
+def object_saved(sender, **kwargs):
+	"""Keep the index in step with saved records"""
+	instance = kwargs['instance']
+	index_object(kind_of(instance), instance)
+
+
+def object_deleted(sender, **kwargs):
+	"""Remove deleted records from the index"""
+	instance = kwargs['instance']
+	unindex_object(kind_of(instance), instance.pk)
+
+
+def ticket_comments_changed(sender, **kwargs):
+	"""Comments take their equipment from the ticket they are attached to"""
+	if kwargs['action'] not in ('post_add', 'post_remove', 'post_clear'):
+		return
+	if isinstance(kwargs['instance'], Comment):
+		comments = [kwargs['instance']]
+	else:
+		comments = Comment.objects.filter(pk__in=kwargs['pk_set'] or [])
+	for comment in comments:
+		index_object('comment', comment)
+
+for searchable in MODELS.values():
+	post_save.connect(object_saved, sender=searchable)
+	post_delete.connect(object_deleted, sender=searchable)
+m2m_changed.connect(ticket_comments_changed, sender=Ticket.comment.through)
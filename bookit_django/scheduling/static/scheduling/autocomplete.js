@@ -0,0 +1,52 @@
+(function($) {
+	// Adds a search box to selects rendered by scheduling.widgets and
+	// fills them from the autocomplete view as the user types
+	var attach = function(select) {
+		select = $(select);
+		if (select.data('autocomplete-ready')) {
+			return;
+		}
+		select.data('autocomplete-ready', true);
+		var search = $('<input type="search" class="vTextField" ' +
+					   'placeholder="Type to search" autocomplete="off">'),
+			pending = null,
+			request = null;
+		select.before(search).before('<br>');
+		var fill = function(results) {
+			// Keep what is chosen, replace everything else
+			select.find('option:not(:selected)').filter(function() {
+				return this.value !== '';
+			}).remove();
+			$.each(results, function(i, result) {
+				if (!select.find('option[value="' + result.id + '"]').length) {
+					select.append($('<option>').val(result.id).text(result.text));
+				}
+			});
+		};
+		search.on('input', function() {
+			clearTimeout(pending);
+			pending = setTimeout(function() {
+				if (request) {
+					request.abort();
+				}
+				request = $.getJSON(select.data('autocomplete'),
+									{q: search.val()}, function(data) {
+					fill(data.results);
+				});
+			}, 250);
+		});
+	};
+	$(document).ready(function() {
+		$('select[data-autocomplete]').each(function() {
+			// Skip the empty template row of inline formsets
+			if (this.name.indexOf('__prefix__') == -1) {
+				attach(this);
+			}
+		});
+	});
+	$(document).on('formset:added', function(event, row) {
+		$(row).find('select[data-autocomplete]').each(function() {
+			attach(this);
+		});
+	});
+})(window.django ? django.jQuery : jQuery);
@@ -15,4 +15,37 @@ $(document).ready(function() {
 		var loc = $(this).attr('id')
 		window.location.href = "/scheduling/messages/#" + loc
 	});
+	var calendar = $('#calendar[data-live]');
+	if (calendar.length && window.EventSource) {
+		var year = calendar.data('year'),
+			month = calendar.data('month'),
+			pending = null;
+		var source = new EventSource(calendar.data('live'));
+		var redraw = function(e) {
+			var booking = JSON.parse(e.data),
+				start = new Date(parseInt(booking.start, 10));
+			// A change may move a booking out of this month, always redraw
+			if (e.type != 'changed' && (start.getFullYear() != year ||
+					start.getMonth() + 1 != month)) {
+				return;
+			}
+			// Coalesce a burst of changes into a single redraw
+			clearTimeout(pending);
+			pending = setTimeout(function() {
+				calendar.load(window.location.href + ' #calendar > *');
+			}, 500);
+		};
+		$.each(['created', 'changed', 'cancelled'], function(i, action) {
+			source.addEventListener(action, redraw);
+		});
+		source.addEventListener('error', function() {
+			// Closed for good, e.g. by a 503 from a busy server: poll
+			// instead, as often as BOOKIT_LIVE_BUSY_RETRY_SECONDS
+			if (source.readyState == EventSource.CLOSED) {
+				setInterval(function() {
+					calendar.load(window.location.href + ' #calendar > *');
+				}, 60000);
+			}
+		});
+	}
 });
\ No newline at end of file
@@ -1,3 +1,869 @@
-from django.test import TestCase
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from unittest import skipUnless
+from django.contrib.auth.models import User, Group, Permission
+from django.conf import settings
+from django.core import mail, serializers
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.management import call_command, CommandError
+from django.core.exceptions import ValidationError
+from django.db import connection, connections, transaction, reset_queries, \
+	DatabaseError
+from django.test import TestCase, TransactionTestCase, RequestFactory, \
+	override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .models import Brand, Model, Equipment, Event, EventDelta, \
+	RecurringBooking, Ticket, Service, Message, Tag, Comment, Component, \
+	EventRow, upcoming_bookings, refresh_passed_summaries
+from .booking import save_booking, hold_offline_bookings, \
+	release_offline_bookings
+from .caching import bump, versions, get_cache
+from .routers import PIN_COOKIE, replica_view, replica_synced_at
+from .loaders import feed_bookings, run_all
+from .paginators import LargeTablePaginator, BOUNDARY_KEY
+from .permissions import equipment_access, get_permissions
+from .utils import day_bounds, month_bounds, to_epoch, schedule_entry
 
-# Create your tests here.
+
+def query_plan(queryset):
+	"""SQLite EXPLAIN QUERY PLAN details of a queryset"""
+	sql, params = queryset.query.sql_with_params()
+	with connection.cursor() as cursor:
+		cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+		return [row[-1] for row in cursor.fetchall()]
+
+
+class SchedulingTestCase(TestCase):
+	"""Two instruments and a user to book them"""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.admin = User.objects.create_superuser('admin', 'admin@example.com',
+												  'password')
+		cls.user = User.objects.create_user('user', 'user@example.com',
+											'password')
+		brand = Brand.objects.create(name='Brand')
+		model = Model.objects.create(name='Model')
+		cls.equipment = Equipment.objects.create(name='scope', admin=cls.admin,
+												 brand=brand, model=model)
+		cls.other_equipment = Equipment.objects.create(name='laser',
+													   admin=cls.admin,
+													   brand=brand,
+													   model=model)
+
+	def book(self, equipment, hours, length=1, user=None, **kwargs):
+		"""Event starting a number of hours from now"""
+		start = timezone.now() + timedelta(hours=hours)
+		return Event.objects.create(equipment=equipment,
+									user=user or self.user,
+									start_time=start,
+									end_time=start + timedelta(hours=length),
+									**kwargs)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Reads SQLite query plans')
+class EventIndexTests(SchedulingTestCase):
+	"""Hot Event filters are answered by an index search, not a scan"""
+
+	def assertSearches(self, queryset, table):
+		plan = query_plan(queryset)
+		pattern = r'^SEARCH (TABLE )?{} USING (COVERING )?INDEX'.format(table)
+		self.assertTrue(any(re.match(pattern, step) for step in plan),
+						'{} is scanned: {}'.format(table, plan))
+
+	def test_next_booking(self):
+		self.assertSearches(upcoming_bookings().filter(
+			equipment=self.equipment).order_by('start_time')[:1],
+			'scheduling_event')
+
+	def test_overlap_check(self):
+		event = self.book(self.equipment, 2)
+		self.assertSearches(event.overlapping_bookings(), 'scheduling_event')
+
+	def test_month_calendar(self):
+		start, end = month_bounds(2016, 2)
+		self.assertSearches(Event.objects.filter(
+			equipment=self.equipment,
+			start_epoch__gte=to_epoch(start),
+			start_epoch__lt=to_epoch(end)), 'scheduling_event')
+
+	def test_expire_sweep(self):
+		self.assertSearches(Event.objects.filter(
+			expired=False, end_time__lt=timezone.now()), 'scheduling_event')
+
+	def test_reminder_sweep(self):
+		day_start, day_end = day_bounds(date.today() + timedelta(days=1))
+		self.assertSearches(Event.objects.filter(
+			expired=False,
+			status__in=['A', 'H'],
+			equipment__status=True,
+			start_time__gte=day_start,
+			start_time__lt=day_end), 'scheduling_event')
+
+	def test_user_changelist(self):
+		self.assertSearches(Event.objects.filter(user=self.user),
+							'scheduling_event')
+
+	def test_equipment_by_name(self):
+		self.assertSearches(Equipment.objects.filter(name='scope'),
+							'scheduling_equipment')
+
+
+class ChangelistQueryTests(SchedulingTestCase):
+	"""Changelists and pages run a fixed number of queries, however many
+	rows they show"""
+
+	def setUp(self):
+		self.client.login(username='admin', password='password')
+		self.tag = Tag.objects.create(tag='news')
+		self.component = Component.objects.create(
+			name='Lens', brand=self.equipment.brand,
+			model=self.equipment.model)
+		self.rows = 0
+		self.add_rows(2)
+
+	def add_rows(self, count):
+		"""Rows of every listed kind, with the related objects shown"""
+		for index in range(self.rows, self.rows + count):
+			user = User.objects.create_user(
+				'user{}'.format(index), 'user{}@example.com'.format(index))
+			equipment = Equipment.objects.create(
+				name='scope{}'.format(index), admin=user,
+				brand=self.equipment.brand, model=self.equipment.model)
+			equipment.users.add(user)
+			equipment.component.add(self.component)
+			ticket = Ticket.objects.create(msg='Ticket', user=user,
+										   equipment=equipment)
+			ticket.comment.add(Comment.objects.create(msg='Comment',
+													  user=user))
+			message = Message.objects.create(msg='Message', user=user,
+											 equipment=equipment)
+			message.tags.add(self.tag)
+			service = Service.objects.create(job='Service', user=user,
+											 equipment=equipment,
+											 component=self.component,
+											 ticket=ticket)
+			self.book(equipment, index + 1, user=user, service=service)
+		self.rows += count
+
+	def assertFixedQueries(self, url):
+		# Each request resets the query log, start the captures from empty
+		self.client.get(url)
+		reset_queries()
+		with CaptureQueriesContext(connection) as queries:
+			self.assertEqual(self.client.get(url).status_code, 200)
+		count = len(queries)
+		self.add_rows(5)
+		self.client.get(url)
+		reset_queries()
+		with self.assertNumQueries(count):
+			self.client.get(url)
+
+	def test_ticket_changelist(self):
+		self.assertFixedQueries('/admin/scheduling/ticket/')
+
+	def test_equipment_changelist(self):
+		self.assertFixedQueries('/admin/scheduling/equipment/')
+
+	def test_message_changelist(self):
+		self.assertFixedQueries('/admin/scheduling/message/')
+
+	def test_service_changelist(self):
+		self.assertFixedQueries('/admin/scheduling/service/')
+
+	def test_event_changelist(self):
+		self.assertFixedQueries('/admin/scheduling/event/')
+
+	def test_message_board(self):
+		self.assertFixedQueries('/scheduling/messages/')
+
+
+@override_settings(BOOKIT_ADMIN_COUNT_THRESHOLD=1)
+class LargeTablePaginatorTests(SchedulingTestCase):
+	"""Seek pages of a table above the count threshold"""
+
+	def setUp(self):
+		get_cache().clear()
+		start = timezone.now() + timedelta(days=1)
+		# Three bookings per start time, so pages end inside ties
+		for index in range(20):
+			Event.objects.create(
+				equipment=self.equipment, user=self.user, status='C',
+				start_time=start + timedelta(hours=index // 3),
+				end_time=start + timedelta(hours=index // 3 + 1))
+		self.events = Event.objects.order_by('-start_time', '-pk')
+
+	def pages(self, paginator, numbers):
+		return [[event.pk for event in paginator.page(number)]
+				for number in numbers]
+
+	def test_seek_matches_offset(self):
+		paginator = LargeTablePaginator(self.events, 4)
+		self.assertIsNotNone(paginator.key_fields)
+		numbers = paginator.page_range
+		self.assertEqual(self.pages(paginator, numbers),
+						 self.pages(Paginator(self.events, 4), numbers))
+
+	def test_missing_boundary_uses_offset(self):
+		paginator = LargeTablePaginator(self.events, 4)
+		self.assertEqual(self.pages(paginator, [4, 2]),
+						 self.pages(Paginator(self.events, 4), [4, 2]))
+
+	def test_stale_boundary(self):
+		expected = self.pages(Paginator(self.events, 4), [2])
+		paginator = LargeTablePaginator(self.events, 4)
+		last = list(paginator.page(1))[-1]
+		# The row a cached boundary came from is gone, the next page still
+		# starts right after where it sorted
+		last.delete()
+		self.assertEqual(self.pages(LargeTablePaginator(self.events, 4), [2]),
+						 expected)
+		# A boundary past the last row gives an empty page
+		get_cache().set(BOUNDARY_KEY.format(paginator.query_key, 4, 1),
+						(self.events.last().start_time, 0))
+		self.assertEqual(self.pages(LargeTablePaginator(self.events, 4), [2]),
+						 [[]])
+
+
+class EquipmentSummaryTests(SchedulingTestCase):
+	"""Denormalized next booking column"""
+
+	def test_started_booking_is_replaced(self):
+		later = self.book(self.equipment, 5)
+		Equipment.objects.filter(id=self.equipment.id).update(
+			next_booking_start=timezone.now() - timedelta(minutes=30))
+		equipment = Equipment.objects.get(id=self.equipment.id)
+		self.assertIsNone(equipment.upcoming_booking_start)
+		self.assertEqual(refresh_passed_summaries(), 1)
+		equipment = Equipment.objects.get(id=self.equipment.id)
+		self.assertEqual(equipment.upcoming_booking_start, later.start_time)
+
+
+def shared_database():
+	"""Threads see one database, rather than private in-memory copies"""
+	return connection.vendor != 'sqlite' or not connection.is_in_memory_db(
+		connection.settings_dict['NAME'])
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+	"""Simultaneous bookings are serialized, never double booked"""
+
+	threads = 8
+	attempts = 20
+	slots = 6
+
+	def setUp(self):
+		if not shared_database():
+			self.skipTest('Needs a test database the threads can share')
+		self.user = User.objects.create_user('user', 'user@example.com',
+											 'password')
+		brand = Brand.objects.create(name='Brand')
+		model = Model.objects.create(name='Model')
+		self.equipment_ids = [Equipment.objects.create(
+			name='scope{}'.format(index), admin=self.user, brand=brand,
+			model=model).id for index in range(2)]
+		self.start = timezone.now() + timedelta(days=1)
+
+	def book(self, results):
+		"""Submit random slots the way the admin change form does"""
+		try:
+			for attempt in range(self.attempts):
+				slot = random.randrange(self.slots)
+				try:
+					with transaction.atomic():
+						# The form reads before anything is written
+						equipment = Equipment.objects.get(
+							id=random.choice(self.equipment_ids))
+						event = Event(
+							user=self.user, equipment=equipment,
+							start_time=self.start + timedelta(hours=2 * slot),
+							end_time=self.start + timedelta(hours=2 * slot + 1))
+						event.full_clean()
+						save_booking(event)
+					results.append('booked')
+				except ValidationError:
+					results.append('conflict')
+				except DatabaseError as e:
+					results.append(str(e))
+		finally:
+			connection.close()
+
+	def test_no_double_booking(self):
+		results = []
+		workers = [threading.Thread(target=self.book, args=(results,))
+				   for index in range(self.threads)]
+		for worker in workers:
+			worker.start()
+		for worker in workers:
+			worker.join()
+		errors = [result for result in results
+				  if result not in ('booked', 'conflict')]
+		self.assertEqual(errors, [])
+		self.assertEqual(results.count('booked'),
+						 Event.objects.count())
+		for event in Event.objects.all():
+			self.assertFalse(event.overlapping_bookings().exists())
+
+
+class MaintenanceTests(TransactionTestCase):
+	"""Maintenance clears its window, mailing users once it commits"""
+
+	def setUp(self):
+		self.admin = User.objects.create_superuser('admin', 'admin@example.com',
+												   'password')
+		self.user = User.objects.create_user('user', 'user@example.com',
+											 'password')
+		self.equipment = Equipment.objects.create(
+			name='scope', admin=self.admin,
+			brand=Brand.objects.create(name='Brand'),
+			model=Model.objects.create(name='Model'))
+		self.start = timezone.now() + timedelta(days=1)
+		self.inside = self.booking(1)
+		self.outside = self.booking(6)
+		self.rule = RecurringBooking.objects.create(
+			user=self.user, equipment=self.equipment,
+			start_time=self.start + timedelta(hours=3),
+			end_time=self.start + timedelta(hours=4), frequency='D')
+		self.window = (self.start, self.start + timedelta(hours=5))
+		mail.outbox = []
+
+	def booking(self, hours, **kwargs):
+		return Event.objects.create(
+			equipment=self.equipment, user=self.user,
+			start_time=self.start + timedelta(hours=hours),
+			end_time=self.start + timedelta(hours=hours + 1), **kwargs)
+
+	def maintenance(self, user):
+		return Event(equipment=self.equipment, user=user, maintenance=True,
+					 start_time=self.window[0], end_time=self.window[1])
+
+	def statuses(self):
+		return [Event.objects.get(id=event.id).status
+				for event in (self.inside, self.outside)]
+
+	def test_maintenance_clears_window(self):
+		with transaction.atomic():
+			save_booking(self.maintenance(self.admin))
+			self.assertEqual(mail.outbox, [])
+		self.assertEqual(self.statuses(), ['C', 'A'])
+		self.assertEqual(self.rule.occurrences(*self.window), [])
+		self.assertEqual(len(self.rule.occurrences(
+			self.window[1], self.window[1] + timedelta(days=1))), 1)
+		self.assertEqual(len(mail.outbox), 2)
+		self.assertEqual(set(message.to[0] for message in mail.outbox),
+						 {'user@example.com'})
+
+	def test_failed_save_keeps_bookings(self):
+		# The event itself fails to save after its window was cleared
+		with self.assertRaises(ValueError):
+			save_booking(self.maintenance(User(username='unsaved')))
+		self.assertEqual(self.statuses(), ['A', 'A'])
+		self.assertEqual(len(self.rule.occurrences(*self.window)), 1)
+		self.assertEqual(mail.outbox, [])
+
+
+class LoaderPoolTests(TransactionTestCase):
+	"""Loads spread over the loader threads"""
+
+	def setUp(self):
+		if not shared_database():
+			self.skipTest('Needs a test database the threads can share')
+		user = User.objects.create_user('user', 'user@example.com',
+										'password')
+		brand = Brand.objects.create(name='Brand')
+		model = Model.objects.create(name='Model')
+		self.start = timezone.now()
+		for index in range(4):
+			equipment = Equipment.objects.create(
+				name='scope{}'.format(index), admin=user, brand=brand,
+				model=model)
+			for hours in range(index + 1):
+				Event.objects.create(
+					equipment=equipment, user=user,
+					start_time=self.start + timedelta(hours=2 * hours + 1),
+					end_time=self.start + timedelta(hours=2 * hours + 2))
+		self.used = []
+
+	def load(self, name):
+		self.used.append(connections['default'])
+		return [booking.pk for booking in feed_bookings(
+			name, self.start, self.start + timedelta(days=1))]
+
+	@override_settings(BOOKIT_LOADER_THREADS=4)
+	def test_threads_return_in_order_and_close(self):
+		names = [('scope{}'.format(index),) for index in range(4)]
+		expected = [self.load(*args) for args in names]
+		self.assertEqual([len(pks) for pks in expected], [1, 2, 3, 4])
+		self.used = []
+		self.assertEqual(run_all(self.load, names), expected)
+		threaded = [used for used in self.used if used is not connection]
+		self.assertTrue(threaded)
+		for used in threaded:
+			self.assertIsNone(used.connection)
+
+
+class FeedWindowTests(SchedulingTestCase):
+	"""Public feeds only expand bounded windows"""
+
+	def test_long_window_rejected(self):
+		for url in ['/scheduling/json/scope/',
+					'/scheduling/availability/scope/']:
+			response = self.client.get(url, {'from': 0, 'to': 4102444800000})
+			self.assertEqual(response.status_code, 400)
+			response = self.client.get(url, {'from': 1000, 'to': 0})
+			self.assertEqual(response.status_code, 400)
+
+	def test_month_window_served(self):
+		self.book(self.equipment, 2)
+		start = to_epoch(timezone.now()) * 1000
+		response = self.client.get('/scheduling/availability/scope/', {
+			'from': start, 'to': start + 31 * 86400000})
+		self.assertEqual(response.status_code, 200)
+
+
+class SearchScopeTests(SchedulingTestCase):
+	"""Search only returns records the admin would list for the user"""
+
+	def setUp(self):
+		Ticket.objects.create(msg='Calibration drift', user=self.admin,
+							  equipment=self.equipment)
+		Service.objects.create(job='Calibration', user=self.admin,
+							   equipment=self.equipment)
+
+	def found(self, username):
+		self.client.login(username=username, password='password')
+		response = self.client.get('/scheduling/search/',
+								   {'q': 'calibration'})
+		return sorted(result.kind for result in response.context['results'])
+
+	def test_admin_finds_everything(self):
+		self.assertEqual(self.found('admin'), ['service', 'ticket'])
+
+	def test_user_finds_own_records(self):
+		self.user.user_permissions.add(
+			Permission.objects.get(codename='change_ticket'))
+		self.assertEqual(self.found('user'), [])
+		Ticket.objects.create(msg='Calibration again', user=self.user,
+							  equipment=self.equipment)
+		self.assertEqual(self.found('user'), ['ticket'])
+
+
+class AutocompleteTests(SchedulingTestCase):
+	"""Admin autocomplete widgets"""
+
+	def lookup(self, username, url, term):
+		self.client.login(username=username, password='password')
+		return self.client.get(url, {'q': term})
+
+	def test_prefix_ignores_case(self):
+		smith = User.objects.create_user('Smith', 'smith@example.com',
+										 'password')
+		smith.groups.add(Group.objects.get_or_create(name='equipment_user')[0])
+		response = self.lookup('admin', '/scheduling/autocomplete/equipment/'
+								'users/', 'smi')
+		self.assertEqual([result['text'] for result in json.loads(
+			response.content.decode('utf-8'))['results']], ['Smith'])
+
+	def test_users_only_listed_to_admins(self):
+		User.objects.filter(id=self.user.id).update(is_staff=True)
+		response = self.lookup('user', '/scheduling/autocomplete/equipment/'
+							   'users/', 'a')
+		self.assertEqual(response.status_code, 403)
+
+	def test_service_user_widget(self):
+		Service.objects.create(user=self.user, equipment=self.equipment,
+							   job='Align')
+		staff = User.objects.create_user('staff', 'staff@example.com',
+										 'password')
+		staff.is_staff = True
+		staff.save()
+		staff.user_permissions.add(*Permission.objects.filter(
+			codename__in=['change_service', 'add_service']))
+		search = '/scheduling/autocomplete/service/user/'
+		self.client.login(username='admin', password='password')
+		response = self.client.get('/admin/scheduling/service/')
+		self.assertContains(response, search)
+		# Everyone else could not use the search, they enter a user id
+		self.client.login(username='staff', password='password')
+		response = self.client.get('/admin/scheduling/service/')
+		self.assertNotContains(response, search)
+		self.assertContains(response, 'vForeignKeyRawIdAdminField')
+		self.assertContains(response, 'value="{}"'.format(self.user.pk))
+
+
+class PermissionCacheTests(SchedulingTestCase):
+	"""Cached grants change on the next request after they do"""
+
+	def setUp(self):
+		User.objects.filter(id=self.user.id).update(is_staff=True)
+		cache.clear()
+		self.client.login(username='user', password='password')
+
+	def bookable(self):
+		response = self.client.get('/scheduling/autocomplete/event/equipment/')
+		return sorted(result['text'] for result in json.loads(
+			response.content.decode('utf-8'))['results'])
+
+	def request(self):
+		request = RequestFactory().get('/')
+		request.user = User.objects.get(id=self.user.id)
+		return request
+
+	def test_context_per_request(self):
+		request = self.request()
+		context = get_permissions(request)
+		self.assertIs(get_permissions(request), context)
+		self.assertEqual(context.equipment_ids, frozenset())
+		self.assertFalse(context.is_admin)
+		self.equipment.users.add(self.user)
+		Group.objects.create(name='equipment_admin').user_set.add(self.user)
+		# Settled for the rest of the request
+		self.assertEqual(get_permissions(request).equipment_ids, frozenset())
+		self.assertFalse(get_permissions(request).is_admin)
+		context = get_permissions(self.request())
+		self.assertEqual(context.equipment_ids, {self.equipment.id})
+		self.assertTrue(context.is_admin)
+
+	def test_users_changed_from_equipment(self):
+		self.assertEqual(self.bookable(), [])
+		self.equipment.users.add(self.user)
+		self.assertEqual(self.bookable(), ['scope'])
+		self.other_equipment.users.add(self.user)
+		self.assertEqual(self.bookable(), ['laser', 'scope'])
+		self.equipment.users.remove(self.user)
+		self.assertEqual(self.bookable(), ['laser'])
+		self.other_equipment.users.clear()
+		self.assertEqual(self.bookable(), [])
+
+	def test_equipment_changed_from_user(self):
+		self.assertEqual(self.bookable(), [])
+		self.user.equipment_user.add(self.equipment, self.other_equipment)
+		self.assertEqual(self.bookable(), ['laser', 'scope'])
+		self.user.equipment_user.remove(self.other_equipment)
+		self.assertEqual(self.bookable(), ['scope'])
+		self.user.equipment_user.clear()
+		self.assertEqual(self.bookable(), [])
+
+	def test_equipment_deleted(self):
+		self.user.equipment_user.add(self.equipment, self.other_equipment)
+		self.assertEqual(self.bookable(), ['laser', 'scope'])
+		Equipment.objects.get(id=self.other_equipment.id).delete()
+		self.assertEqual(equipment_access(self.user.pk),
+						 {self.equipment.id})
+		self.assertEqual(self.bookable(), ['scope'])
+
+	def lists_users(self):
+		"""Only admins may look up users"""
+		response = self.client.get('/scheduling/autocomplete/equipment/users/')
+		return response.status_code == 200
+
+	def test_admin_group_changed_from_both_sides(self):
+		group = Group.objects.create(name='equipment_admin')
+		self.assertFalse(self.lists_users())
+		group.user_set.add(self.user)
+		self.assertTrue(self.lists_users())
+		group.user_set.remove(self.user)
+		self.assertFalse(self.lists_users())
+		self.user.groups.add(group)
+		self.assertTrue(self.lists_users())
+		self.user.groups.clear()
+		self.assertFalse(self.lists_users())
+		group.user_set.add(self.user)
+		self.assertTrue(self.lists_users())
+		group.user_set.clear()
+		self.assertFalse(self.lists_users())
+
+	def test_admin_group_renamed_and_deleted(self):
+		group = Group.objects.create(name='equipment_admin')
+		group.user_set.add(self.user)
+		self.assertTrue(self.lists_users())
+		group.name = 'former_admin'
+		group.save()
+		self.assertFalse(self.lists_users())
+		group.name = 'equipment_admin'
+		group.save()
+		self.assertTrue(self.lists_users())
+		group.delete()
+		self.assertFalse(self.lists_users())
+
+
+class ToggleActionTests(SchedulingTestCase):
+	"""Boolean toggles from the annotated ticket changelist"""
+
+	def test_toggle_priority(self):
+		tickets = [Ticket.objects.create(msg='Ticket', user=self.user,
+										 equipment=self.equipment,
+										 priority=bool(index % 2))
+				   for index in range(3)]
+		tickets[0].comment.add(Comment.objects.create(msg='Comment',
+													  user=self.user))
+		self.client.login(username='admin', password='password')
+		self.client.post('/admin/scheduling/ticket/', {
+			'action': 'toggle_priority',
+			'_selected_action': [ticket.pk for ticket in tickets[:2]]})
+		self.assertEqual(list(Ticket.objects.order_by('id').values_list(
+			'priority', flat=True)), [True, False, False])
+
+
+class OfflineHoldTests(SchedulingTestCase):
+	"""Taking an instrument offline holds bookings and standing bookings"""
+
+	@override_settings(BOOKIT_OFFLINE_HOLD_DAYS=30)
+	def test_occurrences_held_and_restored(self):
+		booking = self.book(self.equipment, 72)
+		start = timezone.now() + timedelta(days=1)
+		rule = RecurringBooking.objects.create(
+			user=self.user, equipment=self.equipment, start_time=start,
+			end_time=start + timedelta(hours=1), frequency='W', interval=1)
+		self.assertEqual(rule.period_days, 7)
+		window = (timezone.now(), timezone.now() + timedelta(days=30))
+		expected = rule.occurrences(*window)
+		held = hold_offline_bookings(self.equipment)
+		self.assertEqual(held[0], booking)
+		self.assertEqual(len(held), len(expected) + 1)
+		self.assertEqual(rule.occurrences(*window), [])
+		# The held booking, no longer the first occurrence
+		self.assertEqual(Equipment.objects.get(
+			id=self.equipment.id).next_booking_start, booking.start_time)
+		restored = release_offline_bookings(self.equipment)
+		self.assertEqual(len(restored), len(held))
+		self.assertEqual([occurrence.start_time
+						  for occurrence in rule.occurrences(*window)],
+						 [occurrence.start_time for occurrence in expected])
+
+
+class ReminderTests(SchedulingTestCase):
+	"""Morning reminders of the next day's bookings"""
+
+	def rule(self, equipment, start, **kwargs):
+		return RecurringBooking.objects.create(
+			user=self.user, equipment=equipment, start_time=start,
+			end_time=start + timedelta(hours=1), frequency='D', **kwargs)
+
+	def test_standing_bookings_reminded(self):
+		day_start, day_end = day_bounds(date.today() + timedelta(days=1))
+		event = Event.objects.create(equipment=self.equipment, user=self.user,
+									 start_time=day_start + timedelta(hours=9),
+									 end_time=day_start + timedelta(hours=10))
+		rule = self.rule(self.equipment, day_start + timedelta(hours=14))
+		self.rule(self.equipment, day_start + timedelta(hours=16),
+				  status='C')
+		self.rule(self.other_equipment, day_start + timedelta(hours=14))
+		Equipment.objects.filter(id=self.other_equipment.id).update(
+			status=False)
+		call_command('morning_reminders', stdout=open(os.devnull, 'w'))
+		occurrence, = rule.occurrences(day_start, day_end)
+		self.assertEqual(
+			sorted(message.subject for message in mail.outbox),
+			sorted('Bookit reminder: scope at {}'.format(start) for start in
+				   (Event.objects.get(id=event.id).start_time,
+					occurrence.start_time)))
+		for message in mail.outbox:
+			self.assertEqual(message.to, ['user@example.com'])
+
+
+class EventEpochTests(SchedulingTestCase):
+	"""Epoch columns used by the range filters"""
+
+	def test_feed_loads_window_only(self):
+		inside = self.book(self.equipment, 2)
+		self.book(self.equipment, 24 * 10)
+		now = timezone.now()
+		bookings = feed_bookings('scope', now, now + timedelta(days=1))
+		self.assertEqual([booking.pk for booking in bookings], [inside.pk])
+
+	def test_fixture_epochs(self):
+		event = self.book(self.equipment, 2)
+		data = serializers.serialize('json', [event],
+									 fields=('user', 'equipment',
+											 'start_time', 'end_time'))
+		Event.objects.filter(id=event.id).delete()
+		for loaded in serializers.deserialize('json', data):
+			loaded.save()
+		event = Event.objects.get(id=event.id)
+		self.assertEqual(event.start_epoch, to_epoch(event.start_time))
+		self.assertEqual(event.end_epoch, to_epoch(event.end_time))
+
+
+class EventRowTests(SchedulingTestCase):
+	"""Slotted projections display like the events they were read from"""
+
+	def test_matches_event(self):
+		# Every event has a user and equipment, they vary along with notes
+		bookings = [
+			self.book(self.equipment, 2),
+			self.book(self.equipment, 4, notes='Bring samples'),
+			self.book(self.other_equipment, 2, user=self.admin,
+					  notes='A note longer than what the hover text shows',
+					  disassemble=False),
+			self.book(self.other_equipment, 6, status='C', maintenance=True,
+					  notes='')]
+		rows = EventRow.rows(Event.objects.filter(
+			id__in=[booking.id for booking in bookings]).order_by('id'))
+		self.assertEqual(len(rows), len(bookings))
+		for row, booking in zip(rows, bookings):
+			event = Event.objects.get(id=booking.id)
+			self.assertEqual(row.hover_text, event.hover_text)
+			self.assertEqual(schedule_entry(row), schedule_entry(event))
+			self.assertEqual(row.user_email, event.user.email)
+			self.assertEqual(row.equipment_name, event.equipment.name)
+			self.assertEqual(row.get_absolute_url(), event.get_absolute_url())
+			self.assertEqual(row.__unicode__(), event.__unicode__())
+
+
+class LiveFeedTests(SchedulingTestCase):
+	"""Server-sent booking deltas"""
+
+	@override_settings(BOOKIT_LIVE_MAX_STREAMS=1, BOOKIT_LIVE_MAX_SECONDS=0)
+	def test_streams_capped_per_process(self):
+		first = self.client.get('/scheduling/live/scope/')
+		self.assertEqual(first.status_code, 200)
+		busy = self.client.get('/scheduling/live/scope/')
+		self.assertEqual(busy.status_code, 503)
+		self.assertIn(b'retry:', busy.content)
+		# Read to the end, the client then closes the response without
+		# closing the test database connection as response.close() would
+		b''.join(first.streaming_content)
+		again = self.client.get('/scheduling/live/scope/')
+		self.assertEqual(again.status_code, 200)
+		b''.join(again.streaming_content)
+
+	def test_standing_booking_changes_are_pushed(self):
+		start = timezone.now() + timedelta(days=1)
+		rule = RecurringBooking.objects.create(
+			user=self.user, equipment=self.equipment, start_time=start,
+			end_time=start + timedelta(hours=1))
+		booking = 'r{}'.format(rule.id)
+		rule.skip(start + timedelta(days=7))
+		rule.delete()
+		# Created, occurrence skipped, skip and rule deleted
+		self.assertEqual(list(EventDelta.objects.filter(
+			equipment=self.equipment).values_list('booking', 'action')),
+			[(booking, 'changed')] * 4)
+
+
+class CacheVersionTests(TransactionTestCase):
+	"""Cached renders are invalidated by committed writes only"""
+
+	def test_bumped_on_commit(self):
+		namespaces = ('equipment:1',)
+		before = versions(namespaces)
+		with transaction.atomic():
+			bump(*namespaces)
+			self.assertEqual(versions(namespaces), before)
+		self.assertNotEqual(versions(namespaces), before)
+
+	def test_booking_keeps_other_instruments(self):
+		user = User.objects.create_user('user', 'user@example.com',
+										'password')
+		brand = Brand.objects.create(name='Brand')
+		model = Model.objects.create(name='Model')
+		scope, laser = [Equipment.objects.create(
+			name=name, admin=user, brand=brand, model=model)
+			for name in ('scope', 'laser')]
+		kept = ('equipment', 'equipment:{}'.format(laser.id))
+		changed = ('dashboard', 'equipment:{}'.format(scope.id))
+		before = [versions((namespace,)) for namespace in kept + changed]
+		start = timezone.now() + timedelta(days=1)
+		Event.objects.create(user=user, equipment=scope, start_time=start,
+							 end_time=start + timedelta(hours=1))
+		after = [versions((namespace,)) for namespace in kept + changed]
+		self.assertEqual(after[:2], before[:2])
+		self.assertNotEqual(after[2], before[2])
+		self.assertNotEqual(after[3], before[3])
+
+
+class ReplicaTests(TransactionTestCase):
+	"""A SQLite file standing in for a read replica"""
+
+	@classmethod
+	def setUpClass(cls):
+		super(ReplicaTests, cls).setUpClass()
+		cls.directory = tempfile.mkdtemp()
+		replica = {'ENGINE': 'django.db.backends.sqlite3',
+				   'NAME': os.path.join(cls.directory, 'replica.sqlite3')}
+		connections.databases['replica'] = replica
+		connections.ensure_defaults('replica')
+		databases = dict(settings.DATABASES, replica=replica)
+		cls.replica_settings = override_settings(DATABASES=databases)
+		cls.replica_settings.enable()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.replica_settings.disable()
+		connections['replica'].close()
+		del connections.databases['replica']
+		shutil.rmtree(cls.directory)
+		super(ReplicaTests, cls).tearDownClass()
+
+	def setUp(self):
+		self.admin = User.objects.create_superuser(
+			'admin', 'admin@example.com', 'password')
+
+	def test_in_memory_replica_refused(self):
+		replica = connections['replica'].settings_dict
+		name = replica['NAME']
+		replica['NAME'] = 'file:replica?mode=memory&cache=shared'
+		try:
+			with self.assertRaisesMessage(CommandError, 'in-memory'):
+				call_command('sync_replica')
+		finally:
+			replica['NAME'] = name
+		self.assertEqual(os.listdir(self.directory), [])
+
+	def instrument(self, name):
+		brand, created = Brand.objects.get_or_create(name='Brand')
+		model, created = Model.objects.get_or_create(name='Model')
+		return Equipment.objects.create(name=name, brand=brand, model=model,
+										admin=self.admin)
+
+	def sync(self):
+		"""Copy the primary and reconnect to the new copy"""
+		call_command('sync_replica', stdout=open(os.devnull, 'w'))
+		connections['replica'].close()
+
+	def names(self, request):
+		"""Equipment names read the way a replica view reads them"""
+		return replica_view(lambda request: sorted(
+			Equipment.objects.values_list('name', flat=True)))(request)
+
+	def test_replica_view_reads_replica(self):
+		self.instrument('scope')
+		self.sync()
+		self.instrument('laser')
+		factory = RequestFactory()
+		self.assertEqual(self.names(factory.get('/')), ['scope'])
+		self.assertEqual(self.names(factory.post('/')), ['laser', 'scope'])
+		# Outside a replica view reads stay on the primary
+		self.assertEqual(Equipment.objects.count(), 2)
+
+	def test_write_pins_until_replica_catches_up(self):
+		self.instrument('scope')
+		self.sync()
+		response = self.client.post('/admin/login/', {
+			'username': 'admin', 'password': 'password'})
+		self.assertEqual(response.status_code, 302)
+		wrote_at = response.cookies[PIN_COOKIE].value
+		self.assertGreaterEqual(float(wrote_at), replica_synced_at())
+		self.instrument('laser')
+		factory = RequestFactory()
+		pinned = factory.get('/')
+		pinned.COOKIES[PIN_COOKIE] = wrote_at
+		self.assertEqual(self.names(pinned), ['laser', 'scope'])
+
+		# A copy taken after the write releases the pin
+		self.sync()
+		self.assertGreater(replica_synced_at(), float(wrote_at))
+		self.instrument('stage')
+		released = factory.get('/')
+		released.COOKIES[PIN_COOKIE] = wrote_at
+		self.assertEqual(self.names(released), ['laser', 'scope'])
+		self.assertEqual(Equipment.objects.count(), 3)
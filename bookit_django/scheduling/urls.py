@@ -9,7 +9,14 @@ urlpatterns = [
         views.EquipmentDetailView.as_view(), name='equipment-detail'),
     url(r'^messages/$',
         views.message_board, name='message_board'),
+    url(r'^search/$',
+        views.search_view, name='search'),
     url(r'^json/(?P<equipment>.*)/$', views.json_events, name='json_events'),
+    url(r'^live/(?P<equipment>.*)/$', views.live_events, name='live_events'),
+    url(r'^availability/(?P<equipment>.*)/$',
+        views.availability, name='availability'),
+    url(r'^autocomplete/(?P<model>\w+)/(?P<field>\w+)/$',
+        views.autocomplete, name='autocomplete'),
     url(r'^requestperms/(?P<pk>.*)/$',
         views.request_equipment_perms, name='request-equipment-perms'),
     url(r'^activateperms/(?P<equip_pk>\d+)/(?P<user_pk>\d+)/$',
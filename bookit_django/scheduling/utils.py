@@ -7,9 +7,12 @@ from django.utils.html import conditional_escape as esc
 from datetime import date, datetime
 from itertools import groupby
 from django.conf import settings
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
 from django.contrib.sites.models import Site
 from django.template.loader import render_to_string
+from django.utils import timezone
+from datetime import timedelta
+from time import mktime
 import logging
 
 # Maybe move these to settings
@@ -19,11 +22,16 @@ logger = logging.getLogger(__name__)
 
 
 def is_admin(user):
-	"""Fine tune admin status check for model and view interactions"""
-	if user.is_superuser or user in User.objects.filter(
-			groups__name="equipment_admin"):
-		return True
-	return False
+	"""Fine tune admin status check for model and view interactions.
+	Answered with a single EXISTS query and memoized on the user object.
+	"""
+	cached = getattr(user, '_bookit_is_admin', None)
+	if cached is None:
+		cached = bool(user.is_superuser or (
+			user.pk is not None and
+			user.groups.filter(name="equipment_admin").exists()))
+		user._bookit_is_admin = cached
+	return cached
 
 
 def day_past(year, month, day):
@@ -31,6 +39,45 @@ def day_past(year, month, day):
 	return date(year, month, day) < date.today()
 
 
+def localize_bound(value):
+	"""Attach the current timezone to a naive bound when USE_TZ is on"""
+	if settings.USE_TZ:
+		return timezone.make_aware(value, timezone.get_current_timezone())
+	return value
+
+
+def to_epoch(value):
+	"""Whole seconds since the Unix epoch of a datetime.
+	Aware values are converted through UTC, so the result is the same on
+	either side of a DST change; naive ones are read on the local clock."""
+	if timezone.is_aware(value):
+		return calendar.timegm(value.utctimetuple())
+	return int(mktime(value.timetuple()))
+
+
+def epoch_timestamp(epoch):
+	"""Millisecond timestamp string of an epoch for the JSON feeds"""
+	return '{0}'.format(epoch * 1000)
+
+
+def to_timestamp(value):
+	"""Millisecond timestamp string of a datetime for the JSON feeds"""
+	return epoch_timestamp(to_epoch(value))
+
+
+def month_bounds(year, month):
+	"""Start and end datetimes of a month for indexable range filters"""
+	start = datetime(year, month, 1)
+	end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+	return localize_bound(start), localize_bound(end)
+
+
+def day_bounds(day):
+	"""Start and end datetimes of a single date for range filters"""
+	start = datetime(day.year, day.month, day.day)
+	return localize_bound(start), localize_bound(start + timedelta(days=1))
+
+
 def check_add_link_status(equipment_status, year, month, day):
 	"""Check whether we should provide an add link"""
 	if equipment_status is False:
@@ -164,20 +211,22 @@ def get_admin_emails():
 						 values_list('email', flat=True)) + get_superuser_emails()))
 
 
+def schedule_entry(event):
+	"""Feed representation of a single event"""
+	return {
+		"id": event.pk,
+		"title": event.user_name,
+		"url": event.get_absolute_full_url,
+		"status": event.status,
+		"expired": event.expired,
+		"start": event.start_timestamp,
+		"end": event.end_timestamp
+	}
+
+
 def jsonify_schedule(qset):
 	"""Convert queryset to json string"""
-	json_set = list()
-	for event in qset:
-		field = {
-			"id": event.pk,
-			"title": event.user.username,
-			"url": event.get_absolute_full_url,
-			"status": event.status,
-			"expired": event.expired,
-			"start": event.start_timestamp,
-			"end": event.end_timestamp
-		}
-		json_set.append(field)
+	json_set = [schedule_entry(event) for event in qset]
 	json_set_master = {"success": 1}
 	json_set_master["result"] = json_set
 	return json.dumps(json_set_master)
@@ -195,18 +244,29 @@ def maintenance_announcement(obj):
 	logger.info('Sent maintenance announcement [{}]'.format(obj))
 
 
-def maintenance_cancellation(obj):
-	"""Email user regarding an event cancellation for maint"""
+def maintenance_cancellation_message(obj):
+	"""Message to a user regarding an event cancellation for maint"""
 	context = {'event': obj,
 			   'admin': obj.equipment.admin.get_full_name()}
-	send_mail('{0.start_time} on {0.equipment.name} cancelled - emergency maintenance'.format(obj),
-			  render_to_string('scheduling/maintenance_cancellation.txt', context),
-			  EMAIL_FROM,
-			  [obj.user.email],
-			  fail_silently=False)
+	return EmailMessage('{0.start_time} on {0.equipment.name} cancelled - emergency maintenance'.format(obj),
+						render_to_string('scheduling/maintenance_cancellation.txt', context),
+						EMAIL_FROM,
+						[obj.user.email])
+
+
+def maintenance_cancellation(obj):
+	"""Email user regarding an event cancellation for maint"""
+	maintenance_cancellation_message(obj).send(fail_silently=False)
 	logger.info('Sent maintenance cancellation [{}]'.format(obj))
 
 
+def maintenance_cancellation_mails(bookings):
+	"""Email the users of many cancelled bookings over one connection"""
+	messages = [maintenance_cancellation_message(obj) for obj in bookings]
+	send_batch(messages)
+	logger.info('Sent [{}] maintenance cancellations'.format(len(messages)))
+
+
 def ticket_mail(obj):
 	"""Email superusers to inform of a new ticket or comment"""
 	context = {'user': obj.user.get_full_name(),
@@ -219,17 +279,28 @@ def ticket_mail(obj):
 	logger.info('Sent new ticket info [{}]'.format(obj))
 
 
+def ticket_status_toggle_message(obj):
+	"""Message to a user regarding their updated ticket status"""
+	context = {'ticket': obj}
+	return EmailMessage('{0.created} re:{0.equipment.name} - ticket updated'.format(obj),
+						render_to_string('scheduling/ticket_status_toggle_mail.txt', context),
+						EMAIL_FROM,
+						[obj.user.email])
+
+
 def ticket_status_toggle_mail(obj):
 	"""Email specific user regarding their updated ticket status"""
-	context = {'ticket': obj}
-	send_mail('{0.created} re:{0.equipment.name} - ticket updated'.format(obj),
-			  render_to_string('scheduling/ticket_status_toggle_mail.txt', context),
-			  EMAIL_FROM,
-			  [obj.user.email],
-			  fail_silently=False)
+	ticket_status_toggle_message(obj).send(fail_silently=False)
 	logger.info('Sent ticket status change [{}]'.format(obj))
 
 
+def ticket_status_toggle_mails(tickets):
+	"""Email the users of many updated tickets over one connection"""
+	messages = [ticket_status_toggle_message(obj) for obj in tickets]
+	send_batch(messages)
+	logger.info('Sent [{}] ticket status changes'.format(len(messages)))
+
+
 def message_mail(obj):
 	"""Email all users about new message"""
 	context = {'user': obj.user.get_full_name(),
@@ -258,21 +329,95 @@ def changed_event_mail(obj):
 	logger.info('Sent event changed email [{}]'.format(obj))
 
 
-def deleted_event_mail(obj):
-	"""Email all users of a deleted event"""
+def deleted_event_message(obj, recipients=None, domain=None):
+	"""Message to all users of a deleted event"""
 	context = {'user': obj.user.get_full_name(),
 			   'event': obj,
 			   'url': 'http://{0}{1}'.format(
-				   Site.objects.get(id=1).domain,
+				   domain or Site.objects.get(id=1).domain,
 				   reverse('month_view', args=(obj.equipment.name,)))}
-	EmailMessage('{0.equipment.name} - {0.orig_start} is now open'.format(obj),
-				 render_to_string('scheduling/deleted_event_mail.txt', context),
-				 EMAIL_FROM,
-				 [],
-				 get_all_user_emails(obj.equipment)).send(fail_silently=False)
+	return EmailMessage('{0.equipment.name} - {0.orig_start} is now open'.format(obj),
+						render_to_string('scheduling/deleted_event_mail.txt', context),
+						EMAIL_FROM,
+						[],
+						recipients if recipients is not None
+						else get_all_user_emails(obj.equipment))
+
+
+def deleted_event_mail(obj):
+	"""Email all users of a deleted event"""
+	deleted_event_message(obj).send(fail_silently=False)
 	logger.info('Sent event deleted email [{}]'.format(obj))
 
 
+def deleted_event_mails(events):
+	"""Email all users of many deleted events over one connection"""
+	domain = Site.objects.get(id=1).domain
+	recipients = dict()
+	messages = []
+	for obj in events:
+		if obj.equipment_id not in recipients:
+			recipients[obj.equipment_id] = get_all_user_emails(obj.equipment)
+		messages.append(deleted_event_message(obj, recipients[obj.equipment_id],
+											  domain))
+	send_batch(messages)
+	logger.info('Sent [{}] event deleted emails'.format(len(messages)))
+
+
+def offline_hold_mails(equipment, events):
+	"""Email each user once about their bookings held while offline"""
+	context = {'equipment': equipment,
+			   'admin': equipment.admin.get_full_name()}
+	messages = []
+	for user, user_events in group_by_user(events):
+		context['events'] = user_events
+		messages.append(EmailMessage(
+			'{0.name} is offline - your bookings are on hold'.format(equipment),
+			render_to_string('scheduling/offline_hold_mail.txt', context),
+			EMAIL_FROM,
+			[user.email]))
+	send_batch(messages)
+	logger.info('Sent [{}] offline hold notices [{}]'.format(len(messages),
+															  equipment))
+
+
+def offline_release_mails(equipment, events):
+	"""Email each user once about their bookings reactivated online"""
+	context = {'equipment': equipment,
+			   'url': 'http://{0}{1}'.format(
+				   Site.objects.get(id=1).domain,
+				   reverse('month_view', args=(equipment.name,)))}
+	messages = []
+	for user, user_events in group_by_user(events):
+		context['events'] = user_events
+		messages.append(EmailMessage(
+			'{0.name} is back online - your bookings are active'.format(
+				equipment),
+			render_to_string('scheduling/offline_release_mail.txt', context),
+			EMAIL_FROM,
+			[user.email]))
+	send_batch(messages)
+	logger.info('Sent [{}] offline release notices [{}]'.format(len(messages),
+																 equipment))
+
+
+def group_by_user(events):
+	"""(user, events) pairs, events in start order.
+	Occurrences have no user_id, both are grouped by their loaded user.
+	"""
+	events = sorted(events, key=lambda event: (event.user.pk, event.start_time))
+	return [(user_events[0].user, user_events) for user_events in
+			[list(group) for _, group in
+			 groupby(events, key=lambda event: event.user.pk)]]
+
+
+def send_batch(messages):
+	"""Send prepared messages over a single mail connection"""
+	if not messages:
+		return 0
+	return get_connection(fail_silently=False).send_messages(messages)
+
+
 def new_event_mail(obj):
 	"""Email user of their newly scheduled event"""
 	context = {'event': obj}
@@ -288,10 +433,10 @@ def event_reminder_mail(obj):
 	"""Email user to remind them of their event today"""
 	context = {'event': obj,
 			   'event_details': obj.hover_text.replace('&#10;', '\n\t')}
-	send_mail('Bookit reminder: {0.equipment.name} at {0.start_time}'.format(obj),
+	send_mail('Bookit reminder: {0.equipment_name} at {0.start_time}'.format(obj),
 		render_to_string('scheduling/event_reminder_email.txt', context),
 			  EMAIL_FROM,
-			  [obj.user.email],
+			  [obj.user_email],
 			  fail_silently=False)
 	logger.info('Sent event reminder email [{}]'.format(obj))
 
@@ -1,16 +1,51 @@
-from django.shortcuts import get_list_or_404, get_object_or_404
-from .utils import jsonify_schedule, EventCalendar, alert_requested, \
-	request_granted, is_admin
-from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from .utils import jsonify_schedule, alert_requested, request_granted, \
+	to_timestamp
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, Http404, \
+	StreamingHttpResponse
+from django.utils import timezone
 from django.contrib import messages
 from django.views.generic.detail import DetailView
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import render, redirect
 from django.contrib.auth.models import User
-from .models import Event, Equipment, Message, Information, Tag
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist, PermissionDenied
+from django.utils.encoding import force_text
+from .permissions import get_permissions
+from .routers import replica_view
+from .models import Equipment, Message, Ticket, Comment, Service
+from .loaders import run_all, feed_bookings, free_slots
+from .live import open_stream
+from .search import search
+from .caching import equipment_list, equipment_detail, equipment_named, \
+	tag_list, month_calendar, default_feed, dashboard_snapshot
 import calendar
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
+from operator import attrgetter
+
+# Default window for expanding standing bookings into the JSON feed
+RECURRENCE_FEED_DAYS = 90
+# Longest from/to window the public feeds will expand
+FEED_MAX_DAYS = 92
+# Messages per page of the message board
+MESSAGE_PAGE = 25
+# Default window and shortest gap reported by the availability feed
+AVAILABILITY_DAYS = 7
+AVAILABILITY_MIN_MINUTES = 30
+# Longest choice list returned to admin autocomplete widgets
+AUTOCOMPLETE_LIMIT = 20
+# Indexed column searched for each autocompleted model, see migration 0034
+AUTOCOMPLETE_COLUMNS = {User: 'username', Equipment: 'name'}
+# Backends whose default collation already ignores case
+CASE_INSENSITIVE_VENDORS = ('mysql',)
 
 
 # def handle_month(month):
@@ -34,6 +69,23 @@ class EquipmentDetailView(LoginRequiredMixin, DetailView):
 	model = Equipment
 	template_name = 'scheduling/equipment_detail.html'
 
+	def get_object(self, queryset=None):
+		"""Serve the instrument from the cache"""
+		try:
+			equipment = equipment_detail(int(self.kwargs['pk']))
+		except ValueError:
+			equipment = None
+		if equipment is None:
+			raise Http404('No such equipment')
+		return equipment
+
+	def get_context_data(self, **kwargs):
+		"""Add the user's booking rights on this instrument"""
+		context = super(EquipmentDetailView, self).get_context_data(**kwargs)
+		context['can_book'] = get_permissions(self.request).can_book(
+			self.object.id)
+		return context
+
 
 @login_required
 def request_equipment_perms(request, pk):
@@ -56,7 +108,7 @@ def activate_equipment_perms(request, equip_pk, user_pk):
 	equipment = get_object_or_404(Equipment, id=equip_pk)
 	user = get_object_or_404(User, id=user_pk)
 
-	if is_admin(request.user):
+	if get_permissions(request).is_admin:
 		equipment.users.add(user)
 		equipment.save()
 		request_granted(equipment, user)
@@ -70,6 +122,7 @@ def activate_equipment_perms(request, equip_pk, user_pk):
 
 
 @login_required
+@replica_view
 def month_view(request, equipment):
 	"""Main calendar view"""
 	year = request.GET.get('year', None)
@@ -107,63 +160,299 @@ def month_view(request, equipment):
 		calendar_data['next']['month'] = 12
 		calendar_data['next']['month_name'] = calendar.month_name[12]
 
-	events = Event.objects.filter(
-		start_time__year=year,
-		start_time__month=month,
-		equipment__name=equipment)
-	equipment_result = Equipment.objects.get(name=equipment)
-	month_calendar = EventCalendar(events).formatmonth(
-		year,
-		month,
-		equipment_result).replace('\n', '')
+	equipment_result = equipment_named(equipment)
+	if equipment_result is None:
+		raise Http404('No equipment named {}'.format(equipment))
 	nav_data = {'equipment': equipment}
 	context = {'navigation_data': nav_data,
-			   'month_calendar': month_calendar,
+			   'month_calendar': month_calendar(equipment_result, year, month),
 			   'calendar_data': calendar_data,
-			   'equipment_list': Equipment.objects.all()}
+			   'equipment_list': equipment_list()}
 	return render(request, 'scheduling/calendar.html', context)
 
 
 @login_required
+@replica_view
 def message_board(request):
-	"""Message board view"""
+	"""Message board view -
+	Pages are keyset ranges on (created, id): ?before=<id> pages back
+	from a message, ?after=<id> forward, and ?at=<id> opens the page
+	starting at a message, as linked from emails."""
 	tag_filter = request.GET.get('tag', None)
 	equipment_filter = request.GET.get('equipment', None)
 	nav_data = dict()
+	message_objs = Message.objects.all()
 	if tag_filter:
-		tag = get_object_or_404(Tag, tag=tag_filter)
-		message_objs = Message.objects.filter(tags__id=tag.id)
+		tag = next((tag for tag in tag_list() if tag.tag == tag_filter), None)
+		if tag is None:
+			raise Http404('No such tag')
+		message_objs = message_objs.filter(tags__id=tag.id)
 		nav_data['tag'] = tag_filter
-	else:
-		message_objs = Message.objects.all()
-	# Maybe not the best filtering setup, let's redesign this
 	if equipment_filter:
-		message_objs = message_objs.filter(equipment__name=equipment_filter)
+		equipment = equipment_named(equipment_filter)
+		if equipment is None:
+			message_objs = message_objs.none()
+		else:
+			message_objs = message_objs.filter(equipment_id=equipment.id)
 		nav_data['equipment'] = equipment_filter
-	context = {'message_objs': message_objs.order_by('-created'),
-			   'tags': Tag.objects.all().order_by('tag'),
-			   'equipment_list': Equipment.objects.all().order_by('name'),
+	page, newer, older = message_page(message_objs, request.GET)
+	nav_data['newer'] = page_link(request.GET, 'after', newer)
+	nav_data['older'] = page_link(request.GET, 'before', older)
+	nav_data['latest'] = page_link(request.GET)
+	context = {'message_objs': page,
+			   'tags': tag_list(),
+			   'equipment_list': sorted(equipment_list(),
+										key=attrgetter('name')),
 			   'nav_data': nav_data}
 	return render(request, 'scheduling/comments.html', context)
 
 
+def message_page(message_objs, params):
+	"""One page of messages, newest first, with the ids to page from.
+	Returns the page, the id to fetch newer messages after (or None) and
+	the id to fetch older messages before (or None).
+	"""
+	message_objs = message_objs.select_related('user', 'equipment').\
+		prefetch_related('tags')
+	cursor, direction = None, 'before'
+	for key in ('before', 'after', 'at'):
+		if params.get(key, '').isdigit():
+			cursor = Message.objects.filter(id=int(params[key])).\
+				values_list('created', 'id').first()
+			direction = key
+			break
+	if cursor is None:
+		page = list(message_objs.order_by('-created', '-id')[:MESSAGE_PAGE + 1])
+		return page[:MESSAGE_PAGE], None, \
+			page[MESSAGE_PAGE - 1].id if len(page) > MESSAGE_PAGE else None
+	created, message_id = cursor
+	newer_q = Q(created__gt=created) | Q(created=created, id__gt=message_id)
+	older_q = Q(created__lt=created) | Q(created=created, id__lt=message_id)
+	if direction == 'after':
+		page = list(message_objs.filter(newer_q).
+					order_by('created', 'id')[:MESSAGE_PAGE + 1])
+		has_newer = len(page) > MESSAGE_PAGE
+		page = page[:MESSAGE_PAGE][::-1]
+		has_older = True
+	else:
+		if direction == 'at':
+			older_q = older_q | Q(id=message_id)
+		page = list(message_objs.filter(older_q).
+					order_by('-created', '-id')[:MESSAGE_PAGE + 1])
+		has_older = len(page) > MESSAGE_PAGE
+		page = page[:MESSAGE_PAGE]
+		has_newer = message_objs.filter(newer_q).exists() if page else True
+	if not page:
+		return page, None, None
+	return page, page[0].id if has_newer else None, \
+		page[-1].id if has_older else None
+
+
+def page_link(params, key=None, message_id=None):
+	"""Query string for a page of the board, keeping the filters.
+	None when paging from a missing message, the first page without a key.
+	"""
+	if key is not None and message_id is None:
+		return None
+	params = params.copy()
+	for cursor_key in ('before', 'after', 'at'):
+		params.pop(cursor_key, None)
+	if key is not None:
+		params[key] = message_id
+	return '?' + params.urlencode()
+
+
+def search_scope(request):
+	"""Records a user may find, by search kind.
+	Follows the admin changelists: tickets are limited to their authors
+	unless the user is an admin, as in TicketAdmin, comments unless a
+	superuser, as in CommentAdmin, and service records are shown to
+	users allowed to change them.
+	"""
+	user = request.user
+	scope = {'message': Message.objects.all()}
+	if user.has_perm('scheduling.change_ticket'):
+		scope['ticket'] = Ticket.objects.all()
+		if not get_permissions(request).is_admin:
+			scope['ticket'] = scope['ticket'].filter(user=user)
+	if user.has_perm('scheduling.change_comment'):
+		scope['comment'] = Comment.objects.all()
+		if not user.is_superuser:
+			scope['comment'] = scope['comment'].filter(user=user)
+	if user.has_perm('scheduling.change_service'):
+		scope['service'] = Service.objects.all()
+	return scope
+
+
 @login_required
+@replica_view
+def search_view(request):
+	"""Ranked full-text search over messages, tickets, comments and
+	service records, optionally on one instrument"""
+	query = request.GET.get('q', '').strip()
+	equipment_filter = request.GET.get('equipment', None)
+	equipment = equipment_named(equipment_filter) if equipment_filter else None
+	results = []
+	if query and not (equipment_filter and equipment is None):
+		results = search(query, equipment.id if equipment else None,
+						 scope=search_scope(request))
+	context = {'query': query,
+			   'results': results,
+			   'equipment_list': sorted(equipment_list(),
+										key=attrgetter('name')),
+			   'nav_data': {'equipment': equipment_filter}}
+	return render(request, 'scheduling/search.html', context)
+
+
+@login_required
+@replica_view
 def main_view(request):
 	"""Main landing view"""
-	equipment_list = Equipment.objects.all()
-	message_objs = Message.objects.all().order_by('-created')[:3]
-	information_list = Information.objects.filter(main_page_visible=True)
-	context = {'message_objs': message_objs,
-			   'equipment_list': equipment_list,
-			   'information_list': information_list}
+	snapshot = dashboard_snapshot()
+	context = {'message_objs': snapshot.message_objs,
+			   'equipment_list': snapshot.equipment_list,
+			   'information_list': snapshot.information_list}
 	return render(request, 'scheduling/index.html', context)
 
 
+@replica_view
 def json_events(request, equipment):
 	"""JSON event list -
 	No login currently required so as to use as publicly
 	available API (of sorts)"""
 	if equipment is not None:
-		event_list = get_list_or_404(Event, equipment__name=equipment)
-		return HttpResponse(jsonify_schedule(event_list))
+		equipment_obj = equipment_named(equipment)
+		if 'from' in request.GET or equipment_obj is None:
+			try:
+				window = feed_window(request)
+			except FeedWindowError as e:
+				return HttpResponseBadRequest(str(e))
+			event_list = feed_bookings(equipment, *window)
+			feed = jsonify_schedule(event_list) if event_list else ''
+		else:
+			feed = default_feed(equipment_obj, RECURRENCE_FEED_DAYS)
+		if not feed:
+			raise Http404('No events for {}'.format(equipment))
+		return HttpResponse(feed)
 	return HttpResponse('Nothing here.')
+
+
+def live_events(request, equipment):
+	"""Server-sent booking deltas for an instrument -
+	Public like the JSON feed. Reads the primary, since a delta has to be
+	visible as soon as it is announced."""
+	equipment_obj = get_object_or_404(Equipment, name=equipment)
+	last_event_id = request.META.get('HTTP_LAST_EVENT_ID',
+									 request.GET.get('last_event_id'))
+	try:
+		last_event_id = int(last_event_id) if last_event_id else None
+	except ValueError:
+		last_event_id = None
+	stream = open_stream(equipment_obj.id, last_event_id)
+	if stream is None:
+		# Browsers stop reconnecting on a 503 and the calendar polls
+		retry = getattr(settings, 'BOOKIT_LIVE_BUSY_RETRY_SECONDS', 60)
+		response = HttpResponse('retry: {}\n\n'.format(retry * 1000),
+								content_type='text/event-stream', status=503)
+		response['Retry-After'] = retry
+		return response
+	response = StreamingHttpResponse(stream, content_type='text/event-stream')
+	response['Cache-Control'] = 'no-cache'
+	# Stop nginx from buffering the stream
+	response['X-Accel-Buffering'] = 'no'
+	return response
+
+
+@replica_view
+def availability(request, equipment):
+	"""JSON free time on one or more instruments -
+	Names are comma separated and each instrument is loaded on the
+	loader pool. Takes the calendar's from/to window and a minimum
+	gap length in minutes."""
+	names = [name for name in equipment.split(',') if name]
+	try:
+		window = feed_window(request, AVAILABILITY_DAYS)
+	except FeedWindowError as e:
+		return HttpResponseBadRequest(str(e))
+	try:
+		min_length = timedelta(minutes=int(request.GET.get(
+			'minutes', AVAILABILITY_MIN_MINUTES)))
+	except ValueError:
+		min_length = timedelta(minutes=AVAILABILITY_MIN_MINUTES)
+	equipment_list = list(Equipment.objects.filter(name__in=names,
+												   status=True))
+	if not equipment_list:
+		raise Http404('No running equipment named {}'.format(equipment))
+	slots = run_all(free_slots, [(equipment_obj, window[0], window[1],
+								  min_length)
+								 for equipment_obj in equipment_list])
+	result = dict()
+	for equipment_obj, free in zip(equipment_list, slots):
+		result[equipment_obj.name] = [{"start": to_timestamp(start),
+									   "end": to_timestamp(end)}
+									  for start, end in free]
+	return HttpResponse(json.dumps({"success": 1, "result": result}),
+						content_type='application/json')
+
+
+@staff_member_required
+def autocomplete(request, model, field):
+	"""JSON choices for an admin autocomplete widget -
+	A prefix of the target's indexed column is matched as a range, which
+	every backend answers from an index, ignoring case. The field's
+	limit_choices_to applies, instruments are limited to those the user
+	may book and only admins may look up users."""
+	try:
+		db_field = apps.get_model('scheduling', model)._meta.get_field(field)
+	except (LookupError, FieldDoesNotExist):
+		raise Http404('No field {}.{}'.format(model, field))
+	target = db_field.related_model if db_field.is_relation else None
+	column = AUTOCOMPLETE_COLUMNS.get(target)
+	if column is None:
+		raise Http404('No autocomplete for {}.{}'.format(model, field))
+	permissions = get_permissions(request)
+	if target is User and not permissions.is_admin:
+		raise PermissionDenied
+	objects = target._default_manager.complex_filter(
+		db_field.get_limit_choices_to())
+	if target is Equipment and not permissions.is_admin:
+		objects = objects.filter(id__in=permissions.equipment_ids)
+	term = request.GET.get('q', '').strip()
+	if connections[objects.db].vendor not in CASE_INSENSITIVE_VENDORS:
+		# Matches the LOWER() expression indexes
+		objects = objects.annotate(autocomplete_key=Lower(column))
+		column = 'autocomplete_key'
+		term = term.lower()
+	if term:
+		objects = objects.filter(**{column + '__gte': term,
+									column + '__lt': term + u'\uffff'})
+	results = [{"id": obj.pk, "text": force_text(obj)}
+			   for obj in objects.order_by(column)[:AUTOCOMPLETE_LIMIT]]
+	return HttpResponse(json.dumps({"results": results}),
+						content_type='application/json')
+
+
+class FeedWindowError(ValueError):
+	"""A from/to window the feeds refuse to expand"""
+
+
+def feed_window(request, default_days=RECURRENCE_FEED_DAYS):
+	"""Window to expand standing bookings over, from the calendar's
+	from/to millisecond parameters when supplied. Windows longer than
+	FEED_MAX_DAYS, or ending before they start, raise FeedWindowError."""
+	try:
+		bounds = [int(request.GET[key]) / 1000 for key in ('from', 'to')]
+	except (KeyError, ValueError):
+		now = timezone.now()
+		return [now, now + timedelta(days=default_days)]
+	if not 0 <= bounds[1] - bounds[0] <= FEED_MAX_DAYS * 86400:
+		raise FeedWindowError(
+			'from/to must span at most {} days'.format(FEED_MAX_DAYS))
+	try:
+		window = [datetime.fromtimestamp(bound, timezone.utc)
+				  for bound in bounds]
+	except (ValueError, OverflowError):
+		raise FeedWindowError('from/to is out of range')
+	if not settings.USE_TZ:
+		window = [timezone.make_naive(value) for value in window]
+	return window
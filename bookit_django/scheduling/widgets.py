@@ -0,0 +1,60 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.urlresolvers import reverse
+from django.utils.encoding import force_text
+
+
+class AutocompleteSelect(forms.Select):
+	"""Select that renders only its chosen options.
+	Others are fetched from the autocomplete view as the user types into
+	a search box added by autocomplete.js, so rendering never reads the
+	whole related table.
+	"""
+
+	def __init__(self, model_name, field_name, attrs=None):
+		super(AutocompleteSelect, self).__init__(attrs)
+		self.model_name = model_name
+		self.field_name = field_name
+		# Labels already known to the caller, by primary key
+		self.labels = dict()
+
+	class Media:
+		js = ('scheduling/autocomplete.js',)
+
+	def render(self, name, value, attrs=None, choices=()):
+		attrs = dict(attrs or {})
+		attrs['data-autocomplete'] = reverse(
+			'autocomplete', args=[self.model_name, self.field_name])
+		return super(AutocompleteSelect, self).render(name, value, attrs)
+
+	def render_options(self, choices, selected_choices):
+		selected = [force_text(value) for value in selected_choices
+					if value not in ('', None)]
+		options = []
+		field = getattr(self.choices, 'field', None)
+		if not self.allow_multiple_selected and field is not None and \
+				field.empty_label is not None:
+			options.append(('', field.empty_label))
+		options.extend(self.selected_labels(selected))
+		return '\n'.join(self.render_option(selected, value, label)
+						 for value, label in options)
+
+	def selected_labels(self, selected):
+		"""(value, label) of the chosen objects, one query for unknown ones"""
+		labels = dict((force_text(pk), label)
+					  for pk, label in self.labels.items())
+		missing = [value for value in selected if value not in labels]
+		if missing and hasattr(self.choices, 'queryset'):
+			try:
+				for obj in self.choices.queryset.filter(pk__in=missing):
+					labels[force_text(obj.pk)] = \
+						self.choices.field.label_from_instance(obj)
+			except (ValueError, ValidationError):
+				# Garbage posted back to a form that failed to validate
+				pass
+		return [(value, labels[value]) for value in selected if value in labels]
+
+
+class AutocompleteSelectMultiple(AutocompleteSelect, forms.SelectMultiple):
+	"""Multiple choice version of AutocompleteSelect"""
+	allow_multiple_selected = True